@@ -1,9 +1,10 @@
 import os
-from utils.config_loader import load_config
+from utils.config_loader import load_config, resolve_table_config
 from utils.logger import setup_logger
-from utils.def_handler import handle_def_file_and_create_table
+from utils.def_handler import handle_def_file_and_create_table, get_def_loader
 from utils.db_connections import get_mssql_conn, get_postgres_conn
 from utils.etl_executor import run_etl_for_table
+from utils.parallel_executor import run_tables_parallel
 
 def main():
     # Load configuration with error handling
@@ -15,6 +16,12 @@ def main():
 
     logger = setup_logger(config["log_folder"])
 
+    # Run tables (and key-range partitions of large tables) on a worker pool when configured
+    if config.get("parallel_workers", 1) > 1:
+        run_tables_parallel(config, logger)
+        logger.info("✅ ETL process completed for all tables.")
+        return
+
     # Establish MSSQL connection
     try:
         mssql_conn = get_mssql_conn(config["source_database"])
@@ -34,8 +41,12 @@ def main():
                 logger.error(f"Failed to close MSSQL connection: {close_err}")
         return
 
+    # Shared in-process loader for .def files (None means use the myw_db subprocess)
+    def_loader = get_def_loader(config, logger)
+
     # Process each table configuration
     for table_config in config["tables"]:
+        table_config = resolve_table_config(config, table_config)
         try:
             target_schema = table_config["target_schema"]
             target_table = table_config["target_table"]
@@ -49,7 +60,8 @@ def main():
                 source_def_path,
                 config["target_database"],
                 target_table,
-                logger
+                logger,
+                def_loader
             )
 
             # Run the ETL process (data extraction and loading)
@@ -64,6 +76,12 @@ def main():
             logger.error(f"[ERROR] ETL failed for {target_schema}.{target_table}: {e}")
 
     # Attempt to close database connections gracefully
+    if def_loader:
+        try:
+            def_loader.close()
+        except Exception as e:
+            logger.error(f"Failed to close .def loader database: {e}")
+
     try:
         mssql_conn.close()
     except Exception as e:
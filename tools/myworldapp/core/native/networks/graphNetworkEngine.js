@@ -53,3 +53,4 @@ export class GraphNetworkEngine extends NetworkEngine {
 }
 
 NetworkEngine.engines['myw_graph_network_engine'] = GraphNetworkEngine;
+NetworkEngine.engines['myw_memory_graph_network_engine'] = GraphNetworkEngine; //Server-side in-memory variant of the same model
@@ -12,11 +12,11 @@ from functools import cached_property
 from myworldapp.core.server.base.core.myw_error import MywError
 from myworldapp.core.server.base.core.myw_thread_safe_cache import MywThreadSafeCache
 from myworldapp.core.server.base.core.myw_thread_safe_record_cache import MywThreadSafeRecordCache
-from myworldapp.core.server.base.core.utils import PropertyDict
 
 from myworldapp.core.server.base.db.myw_filter_parser import MywFilterParser
 from myworldapp.core.server.base.db.myw_db_predicate import MywDbPredicate
 from myworldapp.core.server.base.core.utils import getCacheManager
+from myworldapp.core.server.auth.myw_config_snapshot_store import MywConfigSnapshotStore
 
 from myworldapp.core.server.models.myw_role import MywRole
 from myworldapp.core.server.models.myw_datasource import MywDatasource
@@ -74,7 +74,7 @@ class MywConfigCache:
         self.config_version = config_version
         self.progress = progress
 
-        self.app_data = self._get_data()
+        self.app_data = self._load_data()
 
     @cached_property
     def sharedCacheManager(self):
@@ -87,6 +87,25 @@ class MywConfigCache:
     #                                     CONSTRUCTION
     # ==============================================================================
 
+    def _load_data(self):
+        """
+        Get properties from shared snapshot store (if configured) or database
+
+        Snapshots are shared between processes, so only one process
+        needs to build the data for a given config version and roles
+        (see MywConfigSnapshotStore). See _get_data() for return value"""
+
+        try:
+            store = MywConfigSnapshotStore.storeFor(self.db_session)
+        except Exception as cond:
+            self.progress("warning", "Config snapshot store unavailable:", cond)
+            store = None
+
+        if not store:
+            return self._get_data()
+
+        return store.get(self.config_version, self.role_names, self._get_data, self.progress)
+
     def _get_data(self):
         """
         Get properties from database
@@ -820,47 +839,6 @@ class MywConfigCache:
         necessary to do one query per feature type when rendering.
         """
 
-        # Get and sort items (slow because involves getting feild geom types)
-        # ENH: Use unsorted items we already have cached?
         layer_rec = self.db_session.query(MywLayer).filter(MywLayer.name == layer_name).first()
-        if layer_rec is None:
-            feature_item_defs = []
-        else:
-            feature_item_defs = layer_rec.feature_item_defs(in_draw_order=True, with_defaults=True)
-
-        featureTypeDetails = PropertyDict()
-        featureTypeDetails.zoomRange = layer_rec.zoomRangeFn()
-
-        # gather item details per feature type
-        for feature_item_def in feature_item_defs:
-            feature_type = feature_item_def["name"]
-
-            field_name = feature_item_def.get("field_name")
-            if feature_type not in featureTypeDetails:
-                featureTypeDetails[feature_type] = {
-                    "field_names": [],
-                    "required_fields": ["myw_geometry_world_name"],
-                    "min_vis": 100,
-                    "max_vis": 0,
-                }
 
-            details = featureTypeDetails[feature_type]
-            if field_name:
-                details["field_names"].append(field_name)
-                details["required_fields"].extend(
-                    [field_name, "myw_gwn_" + field_name, "myw_orientation_" + field_name]
-                )
-
-            # include fields used by text styles in results
-            text_style = feature_item_def.get("text_style", "")
-            text_field = text_style.split(":")[0]
-            if text_field:
-                details["required_fields"].append(text_field)
-
-            details["min_vis"] = min(details["min_vis"], feature_item_def["min_vis"])
-            details["max_vis"] = max(details["max_vis"], feature_item_def["max_vis"])
-            details["filter"] = feature_item_def.get(
-                "filter"
-            )  # filter should be the same if several items
-
-        return featureTypeDetails
+        return layer_rec.render_feature_details()
@@ -0,0 +1,421 @@
+################################################################################
+# Shared store for built config cache data
+################################################################################
+# Copyright: IQGeo Limited 2010-2023
+
+import os
+import stat
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from pyramid import threadlocal
+
+from myworldapp.core.server.base.core.myw_error import MywError
+from myworldapp.core.server.base.core.utils import PropertyDict
+from myworldapp.core.server.base.db.myw_filter_parser import MywFilterParser
+from myworldapp.core.server.base.db.myw_db_predicate import MywDbPredicate
+
+
+class MywConfigSnapshotStore:
+    """
+    Store for snapshots of built MywConfigCache data, shared between processes
+
+    Snapshots are held in a local SQLite file, keyed by config
+    version + role names. The first process to need a snapshot
+    builds it. Other processes wait briefly for it to be stored and
+    then load it from the file (without querying the database).
+
+    Snapshots are stored as plain JSON data (not pickles) in a
+    directory private to the server's user. Snapshots for older
+    config versions are discarded when a newer one is stored."""
+
+    # Per-process stores, keyed by file path
+    instances = {}
+    instances_lock = threading.Lock()
+
+    # Time after which a claim to build a snapshot is assumed abandoned (in seconds)
+    build_timeout = 120
+
+    # Time to wait for a snapshot being built by another process before building it here (in seconds)
+    wait_timeout = 5
+
+    # Interval at which to check for snapshot being built by another process (in seconds)
+    poll_interval = 0.2
+
+    @classmethod
+    def storeFor(cls, db_session):
+        """
+        The snapshot store for the database of DB_SESSION (None if disabled)
+
+        Location is taken from myw.auth.options 'config_snapshot_dir' (default:
+        'config_snapshots' in the application's cache directory). Setting it
+        to false disables snapshots. Raises MywError if the directory is
+        accessible to other users"""
+
+        registry = threadlocal.get_current_registry()
+        settings = registry.settings or {}
+        snapshot_dir = settings.get("myw.auth.options", {}).get("config_snapshot_dir", True)
+
+        if snapshot_dir is True:
+            cache_dir = settings.get("cache_dir")
+            snapshot_dir = cache_dir and os.path.join(cache_dir, "config_snapshots")
+
+        if not snapshot_dir:
+            return None
+
+        # Use a separate file for each database
+        db_ident = repr(db_session.get_bind().url)  # Note: repr() hides password
+        db_hash = hashlib.md5(db_ident.encode("utf-8")).hexdigest()[:16]
+        file_path = os.path.join(snapshot_dir, "myw_config_snapshots_{}.db".format(db_hash))
+
+        with cls.instances_lock:
+            store = cls.instances.get(file_path)
+            if store is None:
+                cls._ensurePrivateDir(snapshot_dir)
+                store = cls.instances[file_path] = cls(file_path)
+
+        return store
+
+    @classmethod
+    def _ensurePrivateDir(cls, path):
+        """
+        Create directory PATH (if necessary), checking that only the current user can access it
+
+        Snapshot data determines users' rights, so must not be writable by others"""
+
+        os.makedirs(path, mode=0o700, exist_ok=True)
+
+        st = os.lstat(path)
+        if not stat.S_ISDIR(st.st_mode):
+            raise MywError("Config snapshot location is not a directory:", path)
+
+        # Case: No ownership info (Windows)
+        if not hasattr(os, "getuid"):
+            return
+
+        if st.st_uid != os.getuid():
+            raise MywError("Config snapshot directory not owned by current user:", path)
+
+        if stat.S_IMODE(st.st_mode) & 0o077:
+            os.chmod(path, 0o700)
+
+    def __init__(self, file_path):
+        """
+        Init slots of self
+
+        FILE_PATH is the SQLite file to store snapshots in (created if necessary)"""
+
+        self.file_path = file_path
+        self._initialised = False
+
+    # ==============================================================================
+    #                                    ACCESS
+    # ==============================================================================
+
+    def get(self, config_version, role_names, build_proc, progress):
+        """
+        The config data for CONFIG_VERSION + ROLE_NAMES
+
+        If no snapshot is stored and no other process is building it,
+        calls BUILD_PROC to build the data and stores the result"""
+
+        role_key = "|".join(sorted(role_names))
+
+        # Case: Already stored (or being built elsewhere)
+        data = self._load(config_version, role_key, progress)
+        if data is not None:
+            progress(10, "Loaded config snapshot:", config_version, role_key)
+            return data
+
+        # Case: Build it
+        try:
+            data = build_proc()
+        except Exception:
+            self._releaseClaim(config_version, role_key)
+            raise
+
+        try:
+            self._store(config_version, role_key, data)
+            progress(10, "Stored config snapshot:", config_version, role_key)
+        except Exception as cond:  # Includes data that cannot be serialised
+            progress("warning", "Cannot store config snapshot:", cond)
+            self._releaseClaim(config_version, role_key)
+
+        return data
+
+    def _load(self, config_version, role_key, progress):
+        """
+        Load the snapshot for CONFIG_VERSION + ROLE_KEY
+
+        If another process is building it, waits (up to
+        .wait_timeout) for it to be stored. Otherwise, claims the
+        right to build it
+
+        Returns None if caller must build the data"""
+
+        start = time.time()
+        key = (str(config_version), role_key)
+
+        while True:
+            try:
+                # Check for already stored (without taking write lock)
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT data FROM snapshots WHERE config_version = ? AND role_key = ?", key
+                    ).fetchone()
+
+                if row:
+                    return self._decode(row[0])
+
+                # Try to claim build (discarding abandoned claims)
+                with self._connect(write=True) as conn:
+                    now = time.time()
+                    conn.execute(
+                        "DELETE FROM builds WHERE started < ?", (now - self.build_timeout,)
+                    )
+                    claimed = conn.execute(
+                        "INSERT OR IGNORE INTO builds (config_version, role_key, pid, started) VALUES (?, ?, ?, ?)",
+                        key + (os.getpid(), now),
+                    ).rowcount
+
+                if claimed:
+                    return None
+
+            except (sqlite3.Error, OSError, ValueError, MywError) as cond:
+                progress("warning", "Cannot read config snapshot:", cond)
+                return None
+
+            # Wait for other process to finish (but not for long .. building is only a few seconds)
+            if time.time() - start > self.wait_timeout:
+                progress(4, "Timed out waiting for config snapshot:", config_version, role_key)
+                return None
+
+            time.sleep(self.poll_interval)
+
+    def _store(self, config_version, role_key, data):
+        """
+        Store DATA as the snapshot for CONFIG_VERSION + ROLE_KEY
+
+        Also discards snapshots for older config versions"""
+
+        text = self._encode(data)
+
+        with self._connect(write=True) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots (config_version, role_key, data) VALUES (?, ?, ?)",
+                (str(config_version), role_key, text),
+            )
+            conn.execute(
+                "DELETE FROM builds WHERE config_version = ? AND role_key = ?",
+                (str(config_version), role_key),
+            )
+
+            # Discard stale versions
+            for table in ["snapshots", "builds"]:
+                conn.execute(
+                    "DELETE FROM {} WHERE CAST(config_version AS INTEGER) < ?".format(table),
+                    (int(config_version),),
+                )
+
+    def _releaseClaim(self, config_version, role_key):
+        """
+        Discard this process's claim to build the snapshot for CONFIG_VERSION + ROLE_KEY (if any)
+        """
+
+        try:
+            with self._connect(write=True) as conn:
+                conn.execute(
+                    "DELETE FROM builds WHERE config_version = ? AND role_key = ? AND pid = ?",
+                    (str(config_version), role_key, os.getpid()),
+                )
+        except sqlite3.Error:
+            pass
+
+    def _connect(self, write=False):
+        """
+        Connection to self's file (initialising it if necessary)
+
+        If WRITE is True, transactions take the write lock on
+        start. Otherwise, they are deferred (so readers don't
+        block each other)"""
+
+        isolation_level = "IMMEDIATE" if write else "DEFERRED"
+        conn = sqlite3.connect(self.file_path, timeout=30, isolation_level=isolation_level)
+
+        if not self._initialised:
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS snapshots "
+                    "(config_version TEXT, role_key TEXT, data TEXT, PRIMARY KEY (config_version, role_key))"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS builds "
+                    "(config_version TEXT, role_key TEXT, pid INTEGER, started REAL, PRIMARY KEY (config_version, role_key))"
+                )
+            self._initialised = True
+
+        return _ClosingConnection(conn)
+
+    # ==============================================================================
+    #                                  SERIALISATION
+    # ==============================================================================
+
+    def _encode(self, data):
+        """
+        Serialise config data DATA as JSON text
+
+        Filter predicates are stored as their expressions (and
+        re-parsed on load). Raises MywError if DATA includes a
+        predicate with no known expression or an unsupported value"""
+
+        # Find expressions for filter predicates
+        pred_exprs = {}
+        for app_props in data.values():
+            for feature_def in app_props.get("feature_defs", {}).values():
+                for name, pred in feature_def["filter_preds"].items():
+                    expr = feature_def["filter_exprs"].get(name)
+                    if expr is not None:
+                        pred_exprs[id(pred)] = expr
+
+        return json.dumps(_SnapshotEncoder(pred_exprs).encode(data), separators=(",", ":"))
+
+    def _decode(self, text):
+        """
+        Rebuild config data from TEXT
+        """
+
+        return _SnapshotDecoder().decode(json.loads(text))
+
+
+class _SnapshotEncoder:
+    """
+    Engine for converting config data to plain JSON-able data
+
+    Containers are tagged with their type (so that tuple keys,
+    sets etc are preserved). Filter predicates are replaced by
+    their expressions"""
+
+    def __init__(self, pred_exprs):
+        """
+        Init slots of self
+
+        PRED_EXPRS maps id() of filter predicates to their expressions"""
+
+        self.pred_exprs = pred_exprs
+
+    def encode(self, obj):
+        """
+        JSON-able form of OBJ
+        """
+
+        if obj is None or isinstance(obj, (bool, int, float, str)):
+            return obj
+
+        if isinstance(obj, MywDbPredicate):
+            return self.encodePredicate(obj)
+
+        if isinstance(obj, dict):
+            items = [[self.encode(k), self.encode(v)] for k, v in obj.items()]
+
+            if type(obj) is OrderedDict:
+                return {"odict": items}
+            if type(obj) is PropertyDict:
+                return {"pdict": items}
+            if type(obj) is dict:
+                return {"dict": items}
+
+        elif type(obj) is list:
+            return {"list": [self.encode(v) for v in obj]}
+        elif type(obj) is tuple:
+            return {"tuple": [self.encode(v) for v in obj]}
+        elif type(obj) in (set, frozenset):
+            return {"set": [self.encode(v) for v in obj]}
+
+        raise MywError("Config snapshot: Unsupported value type:", type(obj).__name__)
+
+    def encodePredicate(self, pred):
+        """
+        JSON-able form of filter predicate PRED
+        """
+
+        if pred is MywDbPredicate.false:
+            return {"const": False}
+        if pred is MywDbPredicate.true:
+            return {"const": True}
+
+        # Note: Must not persist as a constant, as that would change the features visible
+        expr = self.pred_exprs.get(id(pred))
+        if expr is None:
+            raise MywError("Config snapshot: No expression for filter predicate:", pred)
+
+        return {"filter": expr}
+
+
+class _SnapshotDecoder:
+    """
+    Engine for rebuilding config data from output of _SnapshotEncoder
+    """
+
+    # Constructors for tagged containers
+    dict_types = {"dict": dict, "odict": OrderedDict, "pdict": PropertyDict}
+    seq_types = {"list": list, "tuple": tuple, "set": set}
+
+    def __init__(self):
+        """
+        Init slots of self
+        """
+
+        self.preds = {}  # Parsed filter predicates, keyed by expression
+
+    def decode(self, obj):
+        """
+        Rebuild value from JSON-able form OBJ
+        """
+
+        if not isinstance(obj, dict):
+            return obj
+
+        ((tag, value),) = obj.items()
+
+        if tag in self.dict_types:
+            return self.dict_types[tag]((self.decode(k), self.decode(v)) for k, v in value)
+
+        if tag in self.seq_types:
+            return self.seq_types[tag](self.decode(v) for v in value)
+
+        if tag == "const":
+            return MywDbPredicate.true if value else MywDbPredicate.false
+
+        if tag == "filter":
+            pred = self.preds.get(value)
+            if pred is None:
+                pred = self.preds[value] = MywFilterParser(value).parse()
+            return pred
+
+        raise ValueError("Bad config snapshot value: " + tag)
+
+
+class _ClosingConnection:
+    """
+    Context manager for a sqlite3 connection that commits (or rolls back) and then closes it
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type:
+                self.conn.rollback()
+            else:
+                self.conn.commit()
+        finally:
+            self.conn.close()
@@ -7,8 +7,10 @@
 
 import os
 import hashlib
+import threading
 import time
 import traceback
+from collections import Counter
 import urllib.request, urllib.parse, urllib.error
 from urllib.parse import quote, unquote
 
@@ -17,6 +19,7 @@ from sqlalchemy import or_
 
 from myworldapp.core.server.base.core.myw_progress import MywSimpleProgressHandler
 from myworldapp.core.server.base.core.myw_lazy_set import MywLazySet
+from myworldapp.core.server.base.core.myw_bounded_cache import MywBoundedCache
 from myworldapp.core.server.base.db.globals import Session
 from myworldapp.core.server.models.myw_role import MywRole
 from myworldapp.core.server.auth.myw_config_cache import MywConfigCache
@@ -25,11 +28,19 @@ from myworldapp.core.server.auth.myw_authenticator import MywAuthenticator
 
 # Cache of MywConfigCaches, keyed by config version + role names
 # Preserved across requests .. but not Apache reboots.
-config_caches = {}
+# Entries for old config versions are discarded when a new version is seen
+config_caches = MywBoundedCache(max_size=100)
 
 # Mapping from session id to shared MywConfigCache.
 # Avoids saving/loading large amounts of data in beaker session files (slow)
-session_caches = {}
+# Entries for idle sessions are discarded
+session_caches = MywBoundedCache(max_size=10000, max_idle=24 * 3600)
+
+# Number of requests for each combination of role names (used when pre-warming config_caches)
+role_names_usage = Counter()
+
+# Most recent config version seen by this process
+latest_config_version = None
 
 
 class MywCurrentUser:
@@ -58,7 +69,7 @@ class MywCurrentUser:
 
         # Init slots
         self.session = session
-        self._config_cache = session_caches.get(self.session.id)
+        self._config_cache = session_caches.lookup(self.session.id)
         self.options = auth_options
         self.login_cookie_options = login_cookie_options
         self.disable_csrf_check = dev_options.get("disable_csrf_check", False)
@@ -67,6 +78,16 @@ class MywCurrentUser:
         self.disable_reauth_check = auth_options.get("disable_reauth_check", False)
         self._authenticator = None  # Init lazily
         self.progress = MywSimpleProgressHandler(auth_options.get("log_level", 0), "INFO: AUTH: ")
+        self.config_cache_prewarm = auth_options.get("config_cache_prewarm", 5)
+
+        # Apply configured limits to shared caches
+        if "config_cache_max_size" in auth_options:
+            config_caches.setLimits(max_size=auth_options["config_cache_max_size"])
+        if "session_cache_max_size" in auth_options or "session_cache_max_idle" in auth_options:
+            session_caches.setLimits(
+                max_size=auth_options.get("session_cache_max_size", session_caches.max_size),
+                max_idle=auth_options.get("session_cache_max_idle", session_caches.max_idle),
+            )
 
         # Init in-memory cache
         if self._config_cache == None:
@@ -86,25 +107,90 @@ class MywCurrentUser:
         if config_version is None:
             config_version = Session.myw_db_driver.versionStamp("myw_server_config")
             self.session["config_version"] = config_version
+            self._noteConfigVersion(config_version)
 
-        # Find pre-built cache for these roles (if there is one)
-        key = tuple([config_version] + sorted(self.roleNames()))
-        config_cache = config_caches.get(key)
-
-        # If not found, build it
-        if config_cache == None:
-            self.progress(6, "Building config cache:", key)
-            config_cache = config_caches[key] = MywConfigCache(
-                Session, self.roleNames(), config_version, self.progress
-            )
-            self.progress(7, "Built config cache:", key)
+        # Find pre-built cache for these roles (building it if necessary)
+        role_names = sorted(self.roleNames())
+        role_names_usage[tuple(role_names)] += 1
+        key = tuple([config_version] + role_names)
+        config_cache = config_caches.get(key, self._buildConfigCache, key, role_names)
 
         # Associate it with self's session id (for future requests)
-        session_caches[self.session.id] = config_cache
+        session_caches.add(self.session.id, config_cache)
 
         # Set it as self's cache
         self._config_cache = config_cache
 
+    def _buildConfigCache(self, key, role_names):
+        """
+        Build config cache KEY for ROLE_NAMES
+        """
+
+        self.progress(6, "Building config cache:", key)
+        config_cache = MywConfigCache(Session, role_names, key[0], self.progress)
+        self.progress(7, "Built config cache:", key)
+
+        return config_cache
+
+    def _noteConfigVersion(self, config_version):
+        """
+        Discard config caches older than CONFIG_VERSION (if it is new)
+
+        Also starts building caches for the most used role combinations in the background"""
+
+        global latest_config_version
+
+        # Check for no change
+        if latest_config_version is not None and config_version <= latest_config_version:
+            return
+
+        prev_version = latest_config_version
+        latest_config_version = config_version
+
+        # Discard stale caches
+        n_evicted = config_caches.removeIf(lambda key: key[0] < config_version)
+        self.progress(6, "Config version changed:", config_version, ":", "Discarded", n_evicted, "caches")
+
+        # Pre-warm (but not on first request to this process)
+        if prev_version is not None and self.config_cache_prewarm:
+            role_names_list = [
+                list(role_names)
+                for role_names, count in role_names_usage.most_common(self.config_cache_prewarm)
+            ]
+
+            thread = threading.Thread(
+                target=self._prewarmConfigCaches,
+                args=(config_version, role_names_list),
+                name="myw_config_cache_prewarm",
+                daemon=True,
+            )
+            thread.start()
+
+    def _prewarmConfigCaches(self, config_version, role_names_list):
+        """
+        Build config caches for CONFIG_VERSION for each set of role names in ROLE_NAMES_LIST
+
+        Runs in a background thread (so uses its own database session)"""
+
+        try:
+            for role_names in role_names_list:
+                key = tuple([config_version] + role_names)
+                config_caches.get(key, self._buildConfigCache, key, role_names)
+
+        except Exception as cond:
+            self.progress("error", "Config cache pre-warm failed:", cond, traceback=traceback)
+
+        finally:
+            Session.remove()
+
+    @classmethod
+    def cacheStats(cls):
+        """
+        Statistics on use of the in-memory config and session caches (a dict)
+        """
+
+        return {"config_caches": config_caches.stats(), "session_caches": session_caches.stats()}
+
     @property
     def config_cache(self):
         """
@@ -201,7 +287,7 @@ class MywCurrentUser:
             self.progress("error", "logout failed:", cond, traceback=traceback)
 
         # Discard entry from in memory cache
-        del session_caches[self.session.id]
+        session_caches.remove(self.session.id)
 
         # Remove session info from the session file (so other processes see change)
         self.session.clear()
@@ -0,0 +1,195 @@
+################################################################################
+# Size and age limited cache to be used across threads
+################################################################################
+# Copyright: IQGeo Limited 2010-2023
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class MywBoundedCache:
+    """
+    In-memory least-recently-used cache with optional size and idle time limits
+
+    When more than MAX_SIZE items are present, the least recently used are
+    discarded. Items not accessed for MAX_IDLE seconds are also discarded.
+    Maintains hit, miss and eviction counts (see .stats())
+
+    All operations are thread-safe"""
+
+    def __init__(self, max_size=None, max_idle=None):
+        """
+        Initialises slots to hold cache and thread management
+
+        MAX_SIZE is the maximum number of items to hold (None for no limit).
+        MAX_IDLE is the time after which unused items are discarded (in seconds)"""
+
+        self.max_size = max_size
+        self.max_idle = max_idle
+
+        self.items = OrderedDict()  # (value, last_used) tuples, least recently used first
+        self.building = {}  # Locks for items being computed, keyed by item key
+        self.lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def setLimits(self, max_size=None, max_idle=None):
+        """
+        Change self's limits (discarding items if necessary)
+        """
+
+        with self.lock:
+            self.max_size = max_size
+            self.max_idle = max_idle
+            self._prune()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def keys(self):
+        """
+        Keys of the items in self, least recently used first
+        """
+
+        with self.lock:
+            return list(self.items.keys())
+
+    def lookup(self, key):
+        """
+        Value of item KEY (None if not present)
+        """
+
+        with self.lock:
+            return self._lookup(key)
+
+    def add(self, key, value):
+        """
+        Set value of item KEY to VALUE (discarding old items if necessary)
+        """
+
+        with self.lock:
+            self.items[key] = (value, time.time())
+            self.items.move_to_end(key)
+            self._prune()
+
+    def get(self, key, proc, *args):
+        """
+        Obtains value for given KEY
+
+        If KEY hasn't been populated it runs PROC with ARGS and stores the result in the cache.
+        If the value for KEY is already being calculated by another thread, this call will wait
+        for the result to be available before returning"""
+
+        with self.lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+
+            build_lock = self.building.get(key)
+            if not build_lock:
+                build_lock = self.building[key] = threading.Lock()
+
+        with build_lock:
+
+            # Check again in case another thread built it while we were waiting
+            with self.lock:
+                value = self.items.get(key, (None, None))[0]
+                if value is not None:
+                    return value
+
+            try:
+                value = proc(*args)
+                self.add(key, value)
+            finally:
+                with self.lock:
+                    if self.building.get(key) is build_lock:
+                        del self.building[key]
+
+        return value
+
+    def remove(self, key):
+        """
+        Discard item KEY (if present)
+        """
+
+        with self.lock:
+            self.items.pop(key, None)
+
+    def removeIf(self, pred):
+        """
+        Discard items whose keys satisfy predicate PRED
+
+        Returns number of items discarded"""
+
+        with self.lock:
+            keys = [key for key in self.items if pred(key)]
+
+            for key in keys:
+                del self.items[key]
+
+            self.evictions += len(keys)
+
+        return len(keys)
+
+    def stats(self):
+        """
+        Statistics on use of self (a dict)
+        """
+
+        with self.lock:
+            return {
+                "size": len(self.items),
+                "max_size": self.max_size,
+                "max_idle": self.max_idle,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _lookup(self, key):
+        """
+        Value of item KEY (None if not present), marking it as recently used
+
+        Must be called holding self.lock"""
+
+        item = self.items.get(key)
+
+        if item is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.items[key] = (item[0], time.time())
+        self.items.move_to_end(key)
+
+        return item[0]
+
+    def _prune(self):
+        """
+        Discard items that are beyond self's limits
+
+        Must be called holding self.lock"""
+
+        # Discard least recently used items
+        if self.max_size:
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+                self.evictions += 1
+
+        # Discard idle items (oldest come first)
+        if self.max_idle:
+            cutoff = time.time() - self.max_idle
+
+            while self.items:
+                key, (value, last_used) = next(iter(self.items.items()))
+                if last_used >= cutoff:
+                    break
+
+                del self.items[key]
+                self.evictions += 1
@@ -968,6 +968,9 @@ class MywDbDriver:
                 feature_schema, feature_rec, trigger_type, filter_ctrl
             )
 
+        if feature_schema == "data" and getattr(feature_rec, "mvt_generalised", False):
+            trigger_body += self.featureTriggerMvtGeomSql(feature_rec, trigger_type)
+
         trigger_body += self.featureLogChangeSql(feature_schema, feature_rec, trigger_type)
 
         # Construct trigger
@@ -1182,6 +1185,15 @@ class MywDbDriver:
         """
         raise Exception("_getGeomTypeClause not implemented")
 
+    def featureTriggerMvtGeomSql(self, feature_rec, trigger_type):
+        """
+        Returns SQL for maintaining generalised tile geometry records for FEATURE_REC
+
+        TRIGGER_TYPE is "insert", "update" or "delete". Only maintained for
+        databases that build vector tiles in SQL (see subclasses)"""
+
+        return ""
+
     def featureTriggerSearchIndexesSql(
         self, feature_schema, feature_rec, trigger_type, filter_ctrl
     ):
@@ -1661,6 +1673,24 @@ class MywDbDriver:
 
         return sqls
 
+    def rebuildMvtGeomsFor(self, feature_rec):
+        """
+        Recreate generalised tile geometry records for FEATURE_REC
+
+        Returns number of rows updated"""
+
+        sqls = self.rebuildMvtGeomsSqls(feature_rec)
+
+        return self.executeCounting(sqls, "INSERT")
+
+    def rebuildMvtGeomsSqls(self, feature_rec):
+        """
+        Returns a list of SQL statements to update the generalised tile geometry records for FEATURE_REC
+        """
+        # Gets subclassed in Postgres driver
+
+        return []
+
     def rebuildSearchStringsFor(self, feature_schema, feature_rec, search_rule_rec):
         """
         Rebuild search string records for SEARCH_RULE_REC
@@ -1709,6 +1739,54 @@ class MywDbDriver:
 
         return sqls
 
+    def logFeatureInsertsFor(self, feature_schema, feature_rec):
+        """
+        Add transaction log 'insert' records for every record in the table for FEATURE_REC
+
+        Used after loading data with triggers disabled. Returns number of records logged"""
+
+        sqls = self.logFeatureInsertsSqls(feature_schema, feature_rec)
+
+        return self.executeCounting(sqls, "INSERT")
+
+    def logFeatureInsertsSqls(self, feature_schema, feature_rec):
+        """
+        Returns SQL to log an insert for every record in the table for FEATURE_REC (set-based equivalent of featureLogChangeSql())
+        """
+
+        if not feature_rec.track_changes:
+            return []
+
+        feature_type = feature_rec.feature_name
+        key_field_name = feature_rec.key_name
+
+        # Determine target table
+        table_name = "transaction_log"
+        if feature_schema in ["delta", "base"]:
+            table_name = feature_schema + "_" + table_name
+
+        # Build field names and values
+        fields = OrderedDict()
+        fields["operation"] = "'insert'"
+        fields["feature_type"] = "'{}'".format(feature_type)
+        fields["feature_id"] = "ftr.{}".format(key_field_name)
+
+        if feature_schema in ["delta", "base"]:
+            fields["delta"] = "ftr.myw_delta"
+
+        fields["version"] = "vs.version"
+
+        sql = "INSERT INTO {} ( {} ) \n".format(
+            self.dbNameFor("myw", table_name, True), ", ".join(list(fields.keys()))
+        )
+        sql += "  SELECT {}\n".format(", ".join(list(fields.values())))
+        sql += "    FROM {} ftr, {} vs WHERE vs.component='data'".format(
+            self.dbNameFor(feature_schema, feature_type, True),
+            self.dbNameFor("myw", "version_stamp", True),
+        )
+
+        return [sql]
+
     def deleteSearchStringsFor(self, feature_schema, search_rule_id):
         """
         Deletes index records for SEARCH_RULE_ID
@@ -2115,6 +2193,19 @@ class MywDbDriver:
         """
         raise Exception("getUpdatabilityClause not implemented")
 
+    def transactionIdHorizon(self):
+        """
+        Range of transaction ids that may still be in progress (if writes can overlap)
+
+        Returns a tuple (XMIN, XMAX) such that all transactions with ids below XMIN
+        have ended and all transactions started later will get ids >= XMAX. Used
+        to determine when entries allocated from a sequence by other sessions
+        (e.g. transaction log ids) can no longer appear out of order.
+
+        Returns None if the database serialises writers (ids always commit in order)"""
+
+        return None
+
     def optimizeLargeQuery(self, query):
         """
         Returns version of SQLAlchemy large select QUERY optimised for memory usage
@@ -4,6 +4,7 @@
 # Copyright: IQGeo Limited 2010-2023
 
 import re
+import operator
 from typing import Dict
 from sqlalchemy import literal, null, not_, or_
 from sqlalchemy.sql.elements import Null as null_element
@@ -689,6 +690,197 @@ class MywDbPredicate:
 
         raise MywInternalError("Not an operand:", str(self))
 
+    # ==============================================================================
+    #                                  COMPILATION
+    # ==============================================================================
+
+    # Python equivalents of comparison operators
+    comp_op_procs = {
+        "=": operator.eq,
+        "<>": operator.ne,
+        "<=": operator.le,
+        ">=": operator.ge,
+        "<": operator.lt,
+        ">": operator.gt,
+    }
+
+    def compile(self, variables={}):
+        """
+        Self as a python function PROC(REC) -> bool (recursive)
+
+        Gives the same result as .matches() but avoids walking the parse tree
+        for each record. Session variables are resolved from VARIABLES at compile
+        time, field accessors are pre-built and LIKE patterns and IN lists
+        are pre-compiled"""
+
+        if self.type == "unary_op":
+            return self._compileUnaryOp(self.operands[0], variables)
+        if self.type == "join_op":
+            return self._compileJoinOp(self.operands[0], self.operands[1], variables)
+        if self.type == "comp_op":
+            return self._compileCompOp(self.operands[0], self.operands[1], variables)
+        if self.type == "func_op":
+            return self._compileInOp(self.operands[0], self.operands[1], variables)
+        if self.type == "bool_const":
+            value = self.value
+            return lambda rec: value
+
+        raise MywInternalError("Unknown parse node type:", str(self))
+
+    def _compileUnaryOp(self, operand1, variables):
+        """
+        Compile a unary operator (NOT, ...)
+        """
+
+        if self.value == "not":
+            test1 = operand1.compile(variables)
+            return lambda rec: not test1(rec)
+
+        raise MywInternalError("Unknown unary_op parse node type:", str(self))
+
+    def _compileJoinOp(self, operand1, operand2, variables):
+        """
+        Compile join operator (AND, OR, ...)
+        """
+
+        test1 = operand1.compile(variables)
+        test2 = operand2.compile(variables)
+
+        if self.value == "&":
+            return lambda rec: test1(rec) and test2(rec)
+        if self.value == "|":
+            return lambda rec: test1(rec) or test2(rec)
+
+        raise MywInternalError("Unknown join parse node type:", str(self))
+
+    def _compileCompOp(self, operand1, operand2, variables):
+        """
+        Compile field comparison
+        """
+
+        is_const1, value1 = operand1._compileOperand(variables)
+        is_const2, value2 = operand2._compileOperand(variables)
+
+        # Case: Pattern match
+        if self.value in ("like", "ilike"):
+            case_sensitive = self.value == "like"
+
+            if is_const2:
+                match = self._compileStrLike(value2, case_sensitive).match
+            else:
+                match = lambda str, pattern: self._compileStrLike(pattern, case_sensitive).match(
+                    str
+                )
+
+            if is_const1 and is_const2:
+                result = match(value1 or "") != None
+                return lambda rec: result
+            if is_const2:
+                return lambda rec: match(value1(rec) or "") != None
+            if is_const1:
+                return lambda rec: match(value1 or "", value2(rec)) != None
+            return lambda rec: match(value1(rec) or "", value2(rec)) != None
+
+        # Case: Comparison
+        proc = self.comp_op_procs.get(self.value)
+        if proc is None:
+            raise MywInternalError("Unknown comparison parse node type:", str(self))
+
+        if is_const1 and is_const2:
+            result = proc(value1, value2)
+            return lambda rec: result
+        if is_const2:
+            return lambda rec: proc(value1(rec), value2)
+        if is_const1:
+            return lambda rec: proc(value1, value2(rec))
+        return lambda rec: proc(value1(rec), value2(rec))
+
+    def _compileStrLike(self, sql_pattern, case_sensitive):
+        """
+        Compiled regex equivalent to SQA like() pattern SQL_PATTERN
+        """
+
+        re_flags = re.DOTALL  # SQAlchemy % matches newlines
+        if not case_sensitive:
+            re_flags |= re.IGNORECASE
+
+        return re.compile(self._regexFor(sql_pattern), re_flags)
+
+    def _compileInOp(self, operand1, operand2, variables):
+        """
+        Compile 'in' operator
+        """
+
+        is_const1, value1 = operand1._compileOperand(variables)
+
+        # Build args to in(), expanding session variables (where necessary)
+        vals = []
+        field_vals = []
+        for arg in operand2.operands:
+
+            val = arg._valueFrom(variables)
+
+            if isinstance(val, list):
+                vals += [self._evaluateValue(x) for x in val]
+            elif arg.type == "field":
+                field_vals.append(arg._compileOperand(variables)[1])
+            else:
+                vals.append(arg._compileOperand(variables)[1])
+
+        # Use set for lookup (where possible)
+        # Note: Null in list matches null value, so no need to special-case it
+        vals = tuple(vals)
+        try:
+            val_set = frozenset(vals)
+        except TypeError:
+            val_set = vals
+
+        def test_const(op1):
+            try:
+                return op1 in val_set
+            except TypeError:  # Unhashable value
+                return op1 in vals
+
+        if field_vals:
+            test_value = lambda rec, op1: test_const(op1) or any(
+                op1 == field_val(rec) for field_val in field_vals
+            )
+        else:
+            test_value = lambda rec, op1: test_const(op1)
+
+        if is_const1:
+            return lambda rec: test_value(rec, value1)
+
+        return lambda rec: test_value(rec, value1(rec))
+
+    def _compileOperand(self, variables):
+        """
+        Compile self as an expression operand
+
+        Returns:
+          IS_CONST  True if value does not depend on record
+          VALUE     The value (if IS_CONST) or a function PROC(REC) returning it"""
+
+        # Case: Field
+        if self.type == "field":
+            get_field = operator.attrgetter(self.value)
+
+            def value(rec):
+                value = get_field(rec)
+                return None if value == "" or value == None else value
+
+            return False, value
+
+        # Case: Session variable
+        if self.type == "variable":
+            return True, self._valueFrom(variables)
+
+        # Case: Literal
+        if self.type.endswith("_const"):
+            return True, self._evaluateValue(self.value)
+
+        raise MywInternalError("Not an operand:", str(self))
+
     # ==============================================================================
     #                                    HELPERS
     # ==============================================================================
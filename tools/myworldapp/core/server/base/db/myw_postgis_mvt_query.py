@@ -5,6 +5,7 @@
 
 from sqlalchemy.dialects import postgresql
 
+from myworldapp.core.server.base.tilestore.globalmaptiles import GlobalMercator
 from myworldapp.core.server.controllers.base.myw_utils import sqlaFilterOf
 from myworldapp.core.server.dd.myw_versioned_feature_table import MywVersionedFeatureTable
 
@@ -158,6 +159,7 @@ class MywPostGISMVTQuery:
     # rescue the buffer out of sqla, and convert it to a python bytes obj.
     memory = result_proxy.fetchall()[0][0]
     response = memory.tobytes()
+    (or just: response = query.execute())
 
     Note on SQL Injection:
     This class generates SQL by hand, rather than using SQLAlchemy like much of our other code.
@@ -167,6 +169,29 @@ class MywPostGISMVTQuery:
     here, x y zoom are handled in the constructor, and the additional fields are processed in
     add_geometry (they are ignored, rather than throwing an error, because of internal fields which
     may not exist. ENH: process them separately and throw errors.) World uses a sqlalchemy compile.
+
+    Note on generalisation:
+    For feature types with property mvt_generalised, geo world geometry is read from the
+    web mercator zoom band tables maintained by the database triggers (see
+    MywPostgresDbDriver.featureTriggerMvtGeomSql). This avoids transforming and clipping full
+    resolution geometry on each request. Delta records are always read from the feature table.
+    Optional SUB_PIXEL controls handling of detail smaller than a display pixel:
+      "keep"  Pass to ST_AsMVTGeom unchanged
+      "drop"  Omit line and area features whose extent is less than a pixel
+      "snap"  Snap vertices to the pixel grid (dropping features that collapse)
+
+    Note on layers:
+    By default all geometries go in a single MVT layer called 'layer'. Optional LAYERS can be
+    "feature_type" (one layer per feature type) or a dict mapping feature types to layer names
+    (types not in it go in 'layer'). Each layer is built by its own ST_AsMVT() call, with only
+    the columns its feature types need, and the results concatenated.
+
+    Note on prepared statements:
+    If PREPARED is True, the tile coordinates etc are rendered as parameters ($1, $2, ..) rather
+    than literals (see PARAM_TYPES and .params()). The SQL is then the same for every tile of a
+    given layer definition and generalisation band, so .execute() can prepare it once per database
+    connection and reuse it. The band is always a literal, so that the planner can use the partial
+    indexes on each band of the geometry band table.
     """
 
     # TILE_EXTENT (the number of integer coords inside the tile.)
@@ -175,14 +200,36 @@ class MywPostGISMVTQuery:
     # tile.
     TILE_EXTENT = 8192
 
+    # Size of a tile on the display (used to determine the size of a pixel)
+    TILE_PIXELS = 512
+
     MARGIN = 0
+    SUB_PIXEL_MODES = {"keep", "drop", "snap"}
     GEOMETRY_TYPES = {"point", "linestring", "polygon"}
     FEATURE_TYPE_META_KEY = ("feature_type", None)
     GEOM_FIELD_NAME_META_KEY = ("geom_field", None)
-
-    def __init__(self, db_driver, current_user, session_vars, tile_coords, world):
+    DEFAULT_LAYER_NAME = "layer"
+
+    # Types of the parameters of prepared statements: zoom, x, y, pixel size
+    PARAM_TYPES = ["integer", "integer", "integer", "double precision"]
+
+    def __init__(
+        self,
+        db_driver,
+        current_user,
+        session_vars,
+        tile_coords,
+        world,
+        generalise=True,
+        sub_pixel="keep",
+        layers=None,
+        prepared=False,
+    ):
         """Read in arguments, and initialise the collections which are built up as geometries are
-        added."""
+        added.
+
+        If GENERALISE is False, geometry is always read from the feature tables. SUB_PIXEL is one
+        of SUB_PIXEL_MODES. LAYERS and PREPARED are described above."""
         self.db_driver = db_driver
         self.current_user = current_user
         self.session_vars = session_vars
@@ -195,11 +242,24 @@ class MywPostGISMVTQuery:
         self.y = int(y)
         self.zoom = int(zoom)
 
+        if sub_pixel not in self.SUB_PIXEL_MODES:
+            raise ValueError(f"Bad sub-pixel mode: {sub_pixel}")
+
+        if isinstance(layers, dict):
+            if not all(isinstance(name, str) for name in layers.values()):
+                raise ValueError(f"Bad layers option: {layers}")
+        elif not (layers is None or layers == "feature_type"):
+            raise ValueError(f"Bad layers option: {layers}")
+
+        self.generalise = generalise
+        self.sub_pixel = sub_pixel
+        self.layers = layers
+        self.prepared = prepared
+
         # Collections to accumulate feature tables, geometry columns, and their metadata.
 
         self.type_geom_combinations_with_filter = []
         self.field_keys_by_feature = {}
-        self.unique_field_keys = set()
 
         # db object caches.
         self.tables = {}
@@ -262,23 +322,96 @@ class MywPostGISMVTQuery:
 
         self.field_keys_by_feature[feature_type] = feature_field_keys
 
-        # Fields are uniquely-enough identified by (name, type) for our purposes - where two
-        # feature types share a field name, if they have the same type, they can be selected
-        # together and have the correct name. Otherwise, if we have a name repeat with a
-        # different type.
-        self.unique_field_keys = self.unique_field_keys.union(set(feature_field_keys))
-
     def generate_sql(self):
         """Creates and returns the SQL-literal query to generate an MVT of the feature types added
         with add_geometries."""
         if not self.type_geom_combinations_with_filter:
             raise MywNoFeaturesError()
 
-        wide_table_fields = self._get_wide_table_columns()
+        layer_sqls = [
+            self._layer_sql(layer_name, combinations)
+            for layer_name, combinations in self._layer_combinations().items()
+        ]
+
+        zoom = self._param_sql(1, self.zoom)
+        x = self._param_sql(2, self.x)
+        y = self._param_sql(3, self.y)
+
+        sql = f"""
+        WITH webmercator(envelope, expanded_envelope) AS (
+                SELECT ST_TileEnvelope({zoom}, {x}, {y}),
+                ST_TileEnvelope({zoom}, {x}, {y}, margin => {self.MARGIN})
+            ),
+            wgs84(expanded_envelope) AS (
+                SELECT ST_Transform((SELECT expanded_envelope FROM webmercator), 4326)
+            )
+        SELECT {" || ".join(layer_sqls)} as mvt
+        """
+
+        return sql
+
+    def params(self):
+        """Values for the parameters of the query (when self.prepared). See PARAM_TYPES."""
+        pixel_size = GlobalMercator(self.TILE_PIXELS).Resolution(self.zoom)
+
+        return [self.zoom, self.x, self.y, pixel_size]
+
+    def execute(self):
+        """Run the query, returning the tile (as bytes)."""
+        sql = self.generate_sql()
+
+        if self.prepared:
+            result_proxy = self.db_driver.executePrepared(sql, self.PARAM_TYPES, self.params())
+        else:
+            result_proxy = self.db_driver.execute(sql)
+
+        # rescue the buffer out of sqla, and convert it to a python bytes obj.
+        memory = result_proxy.fetchall()[0][0]
+        return memory.tobytes()
+
+    def _param_sql(self, index, value):
+        """SQL for a value that varies from tile to tile: either parameter INDEX (if building a
+        prepared statement) or VALUE as a literal."""
+        if self.prepared:
+            return f"${index}"
+
+        return repr(value)
+
+    def _layer_combinations(self):
+        """The geometries added to self, grouped by the name of the MVT layer they go in.
+
+        Returns an ordered dict of lists of (feature_type, geom_field, combined_filter) tuples."""
+        layer_combinations = {}
+
+        for combination in self.type_geom_combinations_with_filter:
+            feature_type = combination[0]
+
+            if self.layers == "feature_type":
+                layer_name = feature_type
+            elif self.layers:
+                layer_name = self.layers.get(feature_type, self.DEFAULT_LAYER_NAME)
+            else:
+                layer_name = self.DEFAULT_LAYER_NAME
+
+            layer_combinations.setdefault(layer_name, []).append(combination)
+
+        return layer_combinations
+
+    def _layer_sql(self, layer_name, combinations):
+        """SQL expression building the MVT layer LAYER_NAME from the geometries COMBINATIONS."""
+        # Fields are uniquely-enough identified by (name, type) for our purposes - where two
+        # feature types share a field name, if they have the same type, they can be selected
+        # together and have the correct name. Otherwise, if we have a name repeat with a
+        # different type.
+        field_keys = set()
+        for feature_type, geom_field, combined_filter in combinations:
+            field_keys.update(self.field_keys_by_feature[feature_type])
+
+        wide_table_fields = self._get_wide_table_columns(field_keys)
 
         ordered_wide_table_fields = sorted(wide_table_fields.keys())
 
-        table_sqls = self._get_table_sqls(wide_table_fields, ordered_wide_table_fields)
+        table_sqls = self._get_table_sqls(wide_table_fields, ordered_wide_table_fields, combinations)
 
         # NOTE: ST_AsMVT's 5th param is feature_id_name, but it can't be our pkey because they can
         # be strings (and MVT requires an int.)
@@ -286,32 +419,48 @@ class MywPostGISMVTQuery:
 
         geometries_table_fields = ", ".join(wide_table_fields[k] for k in ordered_wide_table_fields)
 
-        feature_table_selects = "(" + (" ) UNION ( ".join(table_sqls)) + ")"
-
-        sql = f"""
-        WITH webmercator(envelope, expanded_envelope) AS (
-                SELECT ST_TileEnvelope({self.zoom}, {self.x}, {self.y}),
-                ST_TileEnvelope({self.zoom}, {self.x}, {self.y}, margin => {self.MARGIN})
-            ),
-            wgs84(expanded_envelope) AS (
-                SELECT ST_Transform((SELECT expanded_envelope FROM webmercator), 4326)
-            ),
-            geometries(wkb_geometry, {geometries_table_fields}) AS (
-                {feature_table_selects}
+        # Rows from different selects are always distinct, so no need to pay for UNION's dedup
+        feature_table_selects = "(" + (" ) UNION ALL ( ".join(table_sqls)) + ")"
+
+        (tile_geom, sub_pixel_clause) = self._sub_pixel_sql("wkb_geometry")
+
+        # Layer names can come from the request, so must be quoted
+        layer_name_sql = "'" + layer_name.replace("'", "''") + "'"
+
+        return f"""COALESCE((
+            SELECT ST_AsMVT(tile.*, {layer_name_sql}, {self.TILE_EXTENT}, 'tilegeom') FROM (
+                SELECT  ST_AsMVTGeom(
+                    {tile_geom},
+                    (SELECT envelope FROM webmercator),
+                    {self.TILE_EXTENT},
+                    clip_geom => false) AS tilegeom, {geometries_table_fields}
+                FROM (
+                    {feature_table_selects}
+                ) AS geometries(wkb_geometry, {geometries_table_fields}){sub_pixel_clause}
+            ) AS tile
+        ), ''::bytea)"""
+
+    def _sub_pixel_sql(self, geom):
+        """The expression for the geometry to encode from web mercator geometry column GEOM, and
+        the clause for filtering out sub-pixel features (as determined by self.sub_pixel)."""
+        pixel_size = self._param_sql(4, GlobalMercator(self.TILE_PIXELS).Resolution(self.zoom))
+
+        if self.sub_pixel == "snap":
+            return (f"ST_SnapToGrid({geom}, {pixel_size})", "")
+
+        if self.sub_pixel == "drop":
+            # Uses bounding box only, so cheap. Points are always kept.
+            return (
+                geom,
+                f"""
+            WHERE ST_Dimension({geom}) = 0
+                OR ST_XMax({geom}) - ST_XMin({geom}) >= {pixel_size}
+                OR ST_YMax({geom}) - ST_YMin({geom}) >= {pixel_size}""",
             )
-        SELECT ST_AsMVT(tile.*, 'layer', {self.TILE_EXTENT}, 'tilegeom') as mvt FROM (
-            SELECT  ST_AsMVTGeom(
-                wkb_geometry,
-                (SELECT envelope FROM webmercator),
-                {self.TILE_EXTENT},
-                clip_geom => false) AS tilegeom, {geometries_table_fields}
-            FROM geometries
-        ) AS tile
-        """
 
-        return sql
+        return (geom, "")
 
-    def _get_wide_table_columns(self):
+    def _get_wide_table_columns(self, unique_field_keys):
         """In order for this Query to work, we must have all the individual queries to feature
         tables have the same column set. I call this column set a "wide table" throughout this
         class.
@@ -323,14 +472,18 @@ class MywPostGISMVTQuery:
         this using a utility function which converts the type into an identifier-compatible string
         (_type_name_as_identifier)
 
+        UNIQUE_FIELD_KEYS is the set of field keys of the feature types going in the table.
+
         Returns dict of field_key => identifier_name, with each entry meaning a new column in the
         wide table."""
         field_name_to_set_of_types = {}
-        self.unique_field_keys.add(self.FEATURE_TYPE_META_KEY)
-        self.unique_field_keys.add(self.GEOM_FIELD_NAME_META_KEY)
+        unique_field_keys = unique_field_keys | {
+            self.FEATURE_TYPE_META_KEY,
+            self.GEOM_FIELD_NAME_META_KEY,
+        }
 
         # Group different types by field name.
-        for field_name, field_type in self.unique_field_keys:
+        for field_name, field_type in unique_field_keys:
             try:
                 field_name_to_set_of_types[field_name].add(field_type)
             except KeyError:
@@ -357,7 +510,7 @@ class MywPostGISMVTQuery:
 
         return wide_table_fields
 
-    def _get_table_sqls(self, wide_table_fields, ordered_fields):
+    def _get_table_sqls(self, wide_table_fields, ordered_fields, combinations):
         """Here we do the business of actually generating the select statement from each feature
         table, using all the columns in the wide table. For those that aren't actually present in
         the feature table, we must insert typed-NULL literals (!!)."""
@@ -365,7 +518,7 @@ class MywPostGISMVTQuery:
 
         combined_filter: CombinedFilter
 
-        for feature_type, geom_field, combined_filter in self.type_geom_combinations_with_filter:
+        for feature_type, geom_field, combined_filter in combinations:
             table = self.tables[feature_type]
             # fully qualified table name:
             table_sql_name = f"{table.model.__table__.schema}.{feature_type}"
@@ -414,18 +567,49 @@ class MywPostGISMVTQuery:
                     )
                 )
 
-            table_sqls.append(
-                self._feature_table_sql_query(
-                    geom_field,
-                    sql_fields,
-                    ordered_fields,
-                    table_sql_name,
-                    data_filter_clause,
+            band = self._mvt_geom_band_for(table, geom_field)
+
+            if band is None:
+                table_sqls.append(
+                    self._feature_table_sql_query(
+                        geom_field,
+                        sql_fields,
+                        ordered_fields,
+                        table_sql_name,
+                        data_filter_clause,
+                    )
+                )
+            else:
+                table_sqls.append(
+                    self._mvt_geom_table_sql_query(
+                        table,
+                        geom_field,
+                        band,
+                        sql_fields,
+                        ordered_fields,
+                        table_sql_name,
+                        data_filter_clause,
+                    )
                 )
-            )
 
         return table_sqls
 
+    def _mvt_geom_band_for(self, table, geom_field):
+        """SQL for the generalised geometry band to read GEOM_FIELD of TABLE from, for self's zoom
+        level. None if the geometry must be read from the feature table itself.
+
+        Always a literal (even when prepared) so that a generic plan can use the partial index
+        for the band."""
+        if not self.generalise or self.world != "geo":
+            return None
+
+        if not getattr(table.descriptor, "mvt_generalised", False):
+            return None
+
+        geom_type = table.descriptor.fields[geom_field].type
+
+        return repr(self.db_driver.mvtGeomBandFor(self.zoom, geom_type))
+
     def _feature_table_sql_query(
         self, geom_field, sql_fields, ordered_fields, table_sql_name, filter_clause
     ):
@@ -436,3 +620,27 @@ class MywPostGISMVTQuery:
                 {','.join(sql_fields[k] for k in ordered_fields)}
             FROM {table_sql_name}
             WHERE ({geom_field} && (SELECT expanded_envelope FROM wgs84)) {filter_clause}"""
+
+    def _mvt_geom_table_sql_query(
+        self, table, geom_field, band, sql_fields, ordered_fields, table_sql_name, filter_clause
+    ):
+        """Query for a data table whose geometry is read from the generalised geometry band BAND.
+        Geometry in the band table is already in web mercator, so no transform is required."""
+        feature_type = table.model.__table__.name
+        key_field = table.descriptor.key_field_name
+        key_sql_type = self.db_driver.sqlTypeFor(
+            key_field, table.descriptor.fields[key_field].type_desc
+        )
+
+        # Note: Column names are prefixed to avoid clashes with feature fields
+        return f"""
+            SELECT
+                mvt_geom.myw_mvt_geom,
+                {','.join(sql_fields[k] for k in ordered_fields)}
+            FROM (
+                SELECT feature_id AS myw_mvt_id, the_geom AS myw_mvt_geom
+                FROM myw.mvt_geom
+                WHERE feature_table = '{feature_type}' AND field_name = '{geom_field}'
+                    AND band = {band} AND the_geom && (SELECT expanded_envelope FROM webmercator)
+            ) AS mvt_geom, {table_sql_name}
+            WHERE ({table_sql_name}.{key_field} = CAST(mvt_geom.myw_mvt_id AS {key_sql_type})) {filter_clause}"""
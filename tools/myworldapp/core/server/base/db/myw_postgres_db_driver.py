@@ -2,12 +2,15 @@
 
 import re, os
 import time
+import hashlib
+from collections import OrderedDict
 import psycopg2, psycopg2.errors
 from sqlalchemy.dialects.postgresql.base import RESERVED_WORDS
 
 from myworldapp.core.server.base.core.myw_error import MywError, MywInternalError
 from myworldapp.core.server.base.core.myw_os_engine import MywOsEngine
-from myworldapp.core.server.base.db.myw_db_meta import MywDbTable, MywDbColumn
+from myworldapp.core.server.base.db.myw_db_meta import MywDbTable
+from myworldapp.core.server.base.tilestore.globalmaptiles import GlobalMercator
 
 from .myw_db_driver import MywDbDriver
 
@@ -1033,6 +1036,217 @@ class MywPostgresDbDriver(MywDbDriver):
 
         return trigger_defs
 
+    # ==============================================================================
+    #                          GENERALISED TILE GEOMETRY
+    # ==============================================================================
+    # Features with property mvt_generalised have their geo-world geometries copied to
+    # myw.mvt_geom in web mercator, simplified for bands of tile zoom levels. This
+    # allows vector tiles to be built without transforming and clipping full resolution
+    # geometry on every request (see MywPostGISMVTQuery)
+
+    # Max tile zoom served by each simplified band. Tiles beyond the last use
+    # geometry that is transformed but not simplified
+    mvt_geom_band_zooms = [5, 9, 13]
+
+    def mvtGeomBands(self):
+        """
+        The zoom bands for which generalised tile geometry is maintained
+
+        Returns a list of (BAND,TOLERANCE) tuples, where TOLERANCE is the
+        simplification distance (in web mercator metres). This is the pixel
+        size of a 512 pixel tile at the band's max zoom"""
+
+        mercator = GlobalMercator(512)
+
+        bands = []
+        for band, zoom in enumerate(self.mvt_geom_band_zooms):
+            bands.append((band, mercator.Resolution(zoom)))
+
+        bands.append((len(self.mvt_geom_band_zooms), 0.0))
+
+        return bands
+
+    def mvtGeomBandFor(self, zoom, geom_type):
+        """
+        The generalised geometry band to use for tiles at ZOOM
+
+        GEOM_TYPE is the myWorld type of the field being rendered. Points are only
+        held unsimplified (as simplification would not reduce them)"""
+
+        full_band = len(self.mvt_geom_band_zooms)
+
+        if geom_type == "point":
+            return full_band
+
+        for band, band_zoom in enumerate(self.mvt_geom_band_zooms):
+            if zoom <= band_zoom:
+                return band
+
+        return full_band
+
+    def createMvtGeomTable(self):
+        """
+        Create the generalised tile geometry table (and its indexes)
+
+        Geometry is held in web mercator. A separate spatial index is
+        built for each band, as tile queries only ever read one"""
+
+        db_table_name = self.dbNameFor("myw", "mvt_geom", True)
+
+        self.execute(
+            "CREATE TABLE {} ("
+            "feature_table character varying(100) NOT NULL, "
+            "feature_id character varying(100) NOT NULL, "
+            "field_name character varying(100) NOT NULL, "
+            "band integer NOT NULL, "
+            "the_geom geometry(Geometry,3857), "
+            "PRIMARY KEY (feature_table, feature_id, field_name, band))".format(db_table_name)
+        )
+
+        for band, tolerance in self.mvtGeomBands():
+            self.execute(
+                'CREATE INDEX "idx_mvt_geom_band{band}" ON {table} USING GIST ( the_geom ) '
+                "WHERE band = {band}".format(band=band, table=db_table_name)
+            )
+
+    def featureTriggerMvtGeomSql(self, feature_rec, trigger_type):
+        """
+        Returns SQL for maintaining generalised tile geometry records for FEATURE_REC
+
+        TRIGGER_TYPE is "insert", "update" or "delete". On update, records
+        are only rebuilt for geometries that have changed"""
+
+        feature_type = feature_rec.feature_name
+        key_field_name = feature_rec.key_name
+
+        # Case: Delete
+        if trigger_type == "delete":
+            return self.mvtGeomRecDeleteSql(feature_type, key_field_name) + "\n"
+
+        # Case: Insert or update
+        sql = ""
+
+        for geom_field_name, world_field_name in self.geomFieldInfoFor(feature_type).items():
+            field_sql = ""
+
+            if trigger_type == "update":
+                field_sql += self.mvtGeomRecDeleteSql(feature_type, key_field_name, geom_field_name)
+
+            field_sql += self.mvtGeomRecInsertSql(
+                feature_type, key_field_name, geom_field_name, world_field_name, True
+            )
+
+            # Skip rebuild if geometry unchanged (as simplification is expensive)
+            if trigger_type == "update":
+                changed_exps = [
+                    "NEW.{0} IS DISTINCT FROM OLD.{0}".format(name)
+                    for name in [key_field_name, geom_field_name, world_field_name]
+                    if name
+                ]
+                field_sql = "  IF {} THEN\n{}  END IF;\n".format(
+                    " OR ".join(changed_exps), field_sql
+                )
+
+            sql += field_sql + "\n"
+
+        return sql
+
+    def mvtGeomRecInsertSql(
+        self, feature_type, key_field_name, geom_field_name, world_field_name, for_trigger
+    ):
+        """
+        Build insert statement for the generalised tile geometry records of GEOM_FIELD_NAME
+
+        If FOR_TRIGGER is True, builds records for the trigger's NEW record. Otherwise
+        builds records for all features in the data table"""
+
+        db_mvt_table_name = self.dbNameFor("myw", "mvt_geom", True)
+
+        if for_trigger:
+            ftr_rec = self.trigger_new
+            feature_rec_from = ""
+        else:
+            ftr_rec = "f"
+            feature_rec_from = "{} f, LATERAL ".format(self.dbNameFor("data", feature_type, True))
+
+        bands_sql = ", ".join(
+            "({}, {!r})".format(band, tolerance) for band, tolerance in self.mvtGeomBands()
+        )
+
+        # Build template (filtering before transform, as internal world coords may not be valid)
+        sql = ""
+        sql += "  INSERT INTO {table_name} ( feature_table, feature_id, field_name, band, the_geom ) \n"
+        sql += "    SELECT '{feature_type}', {ftr_rec}.{key_field_name}, '{geom_field_name}',"
+        sql += " b.band, ST_SimplifyPreserveTopology(t.geom, b.tolerance)\n"
+        sql += "    FROM {feature_rec_from}(\n"
+        sql += "      SELECT ST_Transform({ftr_rec}.{geom_field_name}, 3857) AS geom\n"
+        sql += "      WHERE {ftr_rec}.{geom_field_name} IS NOT NULL"
+
+        if world_field_name:
+            sql += "\n        AND {ftr_rec}.{world_field_name} {world_type_clause}"
+
+        sql += ") t, (VALUES {bands}) AS b(band, tolerance)\n"
+        sql += "    WHERE b.tolerance = 0 OR ST_Dimension(t.geom) > 0"
+
+        sql = sql.format(
+            table_name=db_mvt_table_name,
+            feature_type=feature_type,
+            ftr_rec=ftr_rec,
+            key_field_name=key_field_name,
+            geom_field_name=geom_field_name,
+            world_field_name=world_field_name,
+            world_type_clause=self.geomWorldTypeClause("geo"),
+            feature_rec_from=feature_rec_from,
+            bands=bands_sql,
+        )
+
+        if for_trigger:
+            sql += ";"
+
+        return sql + " \n"
+
+    def mvtGeomRecDeleteSql(self, feature_type, key_field_name=None, geom_field_name=None):
+        """
+        Build delete statement for generalised tile geometry records of FEATURE_TYPE
+
+        If KEY_FIELD_NAME is given, deletes only the records of the trigger's OLD
+        record (optionally, just those for GEOM_FIELD_NAME)"""
+
+        db_mvt_table_name = self.dbNameFor("myw", "mvt_geom", True)
+
+        sql = "  DELETE FROM {} \n".format(db_mvt_table_name)
+        sql += "    WHERE feature_table = '{}'".format(feature_type)
+
+        if key_field_name:
+            sql += "    AND feature_id = '' || {}.{}".format(self.trigger_old, key_field_name)
+            if geom_field_name:
+                sql += "    AND field_name = '{}'".format(geom_field_name)
+            sql += ";"
+
+        return sql + "\n"
+
+    def rebuildMvtGeomsSqls(self, feature_rec):
+        """
+        Returns a list of SQL statements to update the generalised tile geometry records for FEATURE_REC
+        """
+
+        feature_type = feature_rec.feature_name
+        key_field_name = feature_rec.key_name
+
+        sqls = [self.mvtGeomRecDeleteSql(feature_type)]
+
+        if not feature_rec.mvt_generalised:
+            return sqls
+
+        for geom_field_name, world_field_name in self.geomFieldInfoFor(feature_type).items():
+            sqls.append(
+                self.mvtGeomRecInsertSql(
+                    feature_type, key_field_name, geom_field_name, world_field_name, False
+                )
+            )
+
+        return sqls
+
     # ==============================================================================
     #                                  MISC
     # ==============================================================================
@@ -1054,6 +1268,41 @@ class MywPostgresDbDriver(MywDbDriver):
 
         return isinstance(cond.orig, psycopg2.errors.QueryCanceled)  # pylint: disable=no-member
 
+    def executePrepared(self, sql, param_types, params, max_statements=100):
+        """
+        Run SQL as a prepared statement with parameter values PARAMS (a list of numbers)
+
+        SQL refers to its parameters as $1, $2, .. and PARAM_TYPES gives their SQL types.
+        The statement is prepared on first use on each connection and reused after that.
+        At most MAX_STATEMENTS are kept on a connection (least recently used are discarded)
+
+        Note: Prepared statements belong to the database session so this will not work
+        via a connection pooler that shares sessions between clients"""
+
+        # Find statements prepared on this connection (info persists for life of DBAPI connection)
+        statements = self.session.connection().info.setdefault(
+            "myw_prepared_statements", OrderedDict()
+        )
+
+        name = "myw_stmt_" + hashlib.sha1(sql.encode("utf-8")).hexdigest()[:24]
+
+        # Prepare it (if necessary)
+        if name in statements:
+            statements.move_to_end(name)
+
+        else:
+            if len(statements) >= max_statements:
+                (old_name, _) = statements.popitem(last=False)
+                self.execute("DEALLOCATE {}".format(old_name))
+
+            self.execute("PREPARE {} ({}) AS {}".format(name, ", ".join(param_types), sql))
+            statements[name] = True
+
+        # Run it
+        param_sqls = [repr(param) for param in params]  # Numbers only, so safe to render
+
+        return self.execute("EXECUTE {} ({})".format(name, ", ".join(param_sqls)))
+
     # ==============================================================================
     #                         LOCK AND TRANSACTION MANAGEMENT
     # ==============================================================================
@@ -1126,6 +1375,22 @@ class MywPostgresDbDriver(MywDbDriver):
         self.execute("SELECT pg_advisory_xact_lock(2)")
         self.progress(8, "Acquired sShards lock")
 
+    def transactionIdHorizon(self):
+        """
+        Range of transaction ids that may still be in progress
+
+        Returns a tuple (XMIN, XMAX) such that all transactions with ids below XMIN
+        have ended and all transactions started later will get ids >= XMAX"""
+
+        sql = (
+            "SELECT txid_snapshot_xmin(s), txid_snapshot_xmax(s)"
+            " FROM (SELECT txid_current_snapshot() AS s) x"
+        )
+
+        xmin, xmax = self.execute(sql).fetchone()
+
+        return (xmin, xmax)
+
     def getUpdatabilityClause(self):
         """
         Returns sql FOR UPDATE clause, that sets updatability during select
@@ -1156,18 +1421,23 @@ class MywPostgresDbDriver(MywDbDriver):
 
         TABLE_DESC is a MywDbTable descriptor
 
-        Uses Postgres COPY utility. Assumes file is EWKT-encoded CSV
+        Streams the file into a temporary table using COPY (over self's
+        connection) then merges it into the feature table with a single
+        INSERT .. ON CONFLICT. Assumes file is EWKT-encoded CSV
 
         Returns vector:
           [0] number of records inserted
           [1] number of records updated
-          [2] number of records skipped due to errors"""
+          [2] number of records skipped due to errors
+          [3] highest key value loaded (0 if key not integer)"""
 
         import codecs, csv
 
         # Get key field name
         key_field_name = table_desc.key_column_names[0]
-        key_field_sql_type = None
+        key_field_sql_type = self.sqlTypeFor(
+            key_field_name, table_desc.columns[key_field_name].type_desc
+        )
 
         # Get names of columns in input file
         with codecs.open(filepath, "r", encoding=file_encoding) as strm:
@@ -1177,16 +1447,15 @@ class MywPostgresDbDriver(MywDbDriver):
         # Get timestamp format
         timestamp_format = self._iso_to_sql_timestamp(timestamp_format)
 
-        # Create temporary table to hold input data
+        # Create temporary table to hold input data (dropped at end of transaction)
         tmp_table_name = "myw_tmp_" + str(os.getpid())
-        tmp_table_desc = MywDbTable("data", tmp_table_name)
-
-        for col_name in tmp_col_names:
-            tmp_table_desc.add(MywDbColumn(col_name, "string()"))
+        tmp_col_defs = ['"{}" text'.format(col_name) for col_name in tmp_col_names]
 
-        self.createTable(tmp_table_desc)
-
-        tmp_db_table_name = self.dbNameFor("data", tmp_table_name, True)
+        self.execute(
+            "CREATE TEMP TABLE {} ({}) ON COMMIT DROP".format(
+                tmp_table_name, ", ".join(tmp_col_defs)
+            )
+        )
 
         # Build mapping to target columns
         col_names = []
@@ -1214,36 +1483,15 @@ class MywPostgresDbDriver(MywDbDriver):
             else:
                 col_sql_vals.append('"{}"::{}'.format(col_name, sql_type))
 
-            if col_name == key_field_name:
-                key_field_sql_type = sql_type
-
-        if key_field_sql_type is None:
-            key_field_sql_type = self.sqlTypeFor(
-                key_field_name, table_desc.columns[key_field_name].type_desc
-            )
-
-        # Construct SQL to set feature fields from temp fields
+        # Construct SQL to set feature fields from incoming values
         col_sql_assigns = []
         for col_name in col_names:
-            if col_name != "id":
-                sql_type = self.sqlTypeFor(col_name, table_desc.columns[col_name].type_desc)
-                if sql_type == "date" and date_format != None:
-                    col_copy_sql = "\"{0}\" = TO_DATE({1}.{0},'{2}')".format(
-                        col_name, tmp_db_table_name, date_format
-                    )
-                elif sql_type[:9] == "timestamp" and timestamp_format != None:
-                    col_copy_sql = "\"{0}\" = TO_TIMESTAMP({1}.{0},'{2}')".format(
-                        col_name, tmp_db_table_name, timestamp_format
-                    )
-                else:
-                    col_copy_sql = '"{0}" = {1}.{0}::{2}'.format(
-                        col_name, tmp_db_table_name, sql_type
-                    )
-                col_sql_assigns.append(col_copy_sql)
+            if col_name != key_field_name:
+                col_sql_assigns.append('"{0}" = EXCLUDED."{0}"'.format(col_name))
 
         sql_params = {
             "ftr_tab": self.dbNameFor("data", table_desc.name, True),
-            "tmp_tab": self.dbNameFor("data", tmp_table_name, True),
+            "tmp_tab": tmp_table_name,
             "col_names": ",".join(safe_col_names),
             "col_vals": ",".join(col_sql_vals),
             "col_assigns": ",".join(col_sql_assigns),
@@ -1251,59 +1499,63 @@ class MywPostgresDbDriver(MywDbDriver):
             "ftr_key_type": key_field_sql_type,
         }
 
-        self.session.commit()  # So psql \copy can 'see' temporary table
+        # Load data into temp table
+        self._copy_data(tmp_table_name, filepath, file_encoding)
 
-        ok = False
-        try:
-            # Load data into temp table
-            self._load_data(tmp_db_table_name, filepath)
-
-            # Incoming records include the key field
-            if key_field_name in tmp_col_names:
-                # Update existing records
-                sql = "UPDATE {ftr_tab} SET {col_assigns} FROM {tmp_tab} WHERE {ftr_tab}.{ftr_key} = {tmp_tab}.{ftr_key}::{ftr_key_type}".format(
-                    **sql_params
-                )
-                n_updated = self.execute(sql).rowcount
-
-                # Insert new records
-                sql = "INSERT INTO {ftr_tab} ({col_names}) SELECT {col_vals} FROM {tmp_tab} WHERE NOT EXISTS (SELECT 1 FROM {ftr_tab} WHERE {ftr_key} = {tmp_tab}.{ftr_key}::{ftr_key_type})".format(
-                    **sql_params
-                )
-
-                n_inserted = self.execute(sql).rowcount
-
-            # Incoming records don't include the key field
+        # Incoming records include the key field: merge them (last occurrence of a key wins)
+        if key_field_name in tmp_col_names:
+            if col_sql_assigns:
+                conflict_action = "DO UPDATE SET {col_assigns}".format(**sql_params)
             else:
-                n_updated = 0
+                conflict_action = "DO NOTHING"
 
-                # Insert new records
-                sql = "INSERT INTO {ftr_tab} ({col_names}) SELECT {col_vals} FROM {tmp_tab}".format(
-                    **sql_params
-                )
+            sql = (
+                "INSERT INTO {ftr_tab} ({col_names}) "
+                "SELECT DISTINCT ON (\"{ftr_key}\"::{ftr_key_type}) {col_vals} FROM {tmp_tab} "
+                "ORDER BY \"{ftr_key}\"::{ftr_key_type}, ctid DESC "
+                "ON CONFLICT (\"{ftr_key}\") "
+            ).format(**sql_params) + conflict_action
 
-                n_inserted = self.execute(sql).rowcount
-            ok = True
+        # Incoming records don't include the key field
+        else:
+            sql = "INSERT INTO {ftr_tab} ({col_names}) SELECT {col_vals} FROM {tmp_tab}".format(
+                **sql_params
+            )
 
-        finally:
+        # Run it, counting inserts vs updates (xmax is zero for newly inserted rows)
+        max_key_expr = (
+            'MAX("{}")'.format(key_field_name)
+            if key_field_sql_type in ["integer", "bigint"]
+            else "0"
+        )
+        sql = (
+            "WITH loaded AS ({} RETURNING {}, (xmax = 0) AS inserted) "
+            "SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted), {} FROM loaded"
+        ).format(sql, '"{}"'.format(key_field_name), max_key_expr)
 
-            # Tidy up
-            if not ok:
-                self.session.rollback()
-            self.dropTable(tmp_table_desc.schema, tmp_table_desc.name)
-            self.session.commit()
+        (n_inserted, n_updated, max_key) = self.execute(sql).first()
 
-        return n_inserted, n_updated, 0
+        # Tidy up (in case of another load in the same transaction)
+        self.execute("DROP TABLE {}".format(tmp_table_name))
 
-    def _load_data(self, db_table_name, filepath):
+        return n_inserted, n_updated, 0, max_key or 0
+
+    def _copy_data(self, db_table_name, filepath, file_encoding=None):
         """
-        Loadds CSV data from FILEPATH into DB_TABLE_NAME using the psql \copy command
+        Loads CSV data from FILEPATH into DB_TABLE_NAME using COPY over self's connection
         """
 
-        # Build command
-        sql = "\copy {} FROM {} WITH (FORMAT CSV, HEADER);".format(db_table_name, filepath)
+        import codecs
 
-        self.run_postgres_command("psql", "-c", sql)
+        sql = "COPY {} FROM STDIN WITH (FORMAT CSV, HEADER)".format(db_table_name)
+        self.progress(6, "Streaming", filepath, "into", db_table_name)
+
+        cursor = self.session.connection().connection.cursor()
+        try:
+            with codecs.open(filepath, "r", encoding=file_encoding) as strm:
+                cursor.copy_expert(sql, strm)
+        finally:
+            cursor.close()
 
     def canonicalise_geometry(self, geom):
         """
@@ -210,21 +210,22 @@ class MywSqliteDbDriver(MywDbDriver):
     #                                  TABLE MANAGEMENT
     # ==============================================================================
 
-    def createTable(self, table_desc):
+    def createTable(self, table_desc, indexes=True):
         """
         Create a table from a MywDbTable description
-        """
+
+        If INDEXES is False, the table's indexes are not created (see .createTableIndexSqls())"""
         # ENH: Modify super to implement createTableSql and remove this?
 
-        sqls = self.createTableSql(table_desc)
+        sqls = self.createTableSql(table_desc, indexes=indexes)
 
         self.execute(sqls)
 
         return table_desc
 
-    def createTableSql(self, table_desc):
+    def createTableSql(self, table_desc, indexes=True):
         """
-        Returns SQL statements to create a table (inc indexes)
+        Returns SQL statements to create a table (inc indexes, unless INDEXES is False)
         """
 
         db_table_name = self.dbNameFor(table_desc.schema, table_desc.name, True)
@@ -270,6 +271,20 @@ class MywSqliteDbDriver(MywDbDriver):
                 )
                 sqls.append(sql)
 
+        # Create indexes
+        if indexes:
+            sqls += self.createTableIndexSqls(table_desc)
+
+        return sqls
+
+    def createTableIndexSqls(self, table_desc):
+        """
+        Returns SQL statements to create the indexes of a table (geometry and other)
+
+        Building indexes on a populated table is faster than maintaining them during a bulk load"""
+
+        sqls = []
+
         # Create geometry indexes
         for field_name, column_desc in list(table_desc.columns.items()):
             if column_desc.isGeometry():
@@ -24,6 +24,8 @@ class MywDbUpgrade700(MywDbUpgrade):
         70004: "remove_length_limit_on_style_lookups",
         70005: "add_save_default_state_right",
         70006: "extend_replica_username",
+        70007: "add_network_cost_expressions",
+        70008: "add_mvt_generalised_geometry",
     }
 
     supports_dry_run = False
@@ -157,3 +159,24 @@ class MywDbUpgrade700(MywDbUpgrade):
             MywDbColumn("owner", "string(32)"),
             MywDbColumn("owner", "string(256)"),
         )
+
+    def add_network_cost_expressions(self):
+        """
+        Add field for cost expression to network feature items
+        """
+
+        self.db_driver.addColumn("myw", "network_feature_item", MywDbColumn("cost", "string(1000)"))
+
+    def add_mvt_generalised_geometry(self):
+        """
+        Add table for generalised web mercator geometry (used when building vector tiles)
+        and the feature property that enables it
+        """
+
+        self.db_driver.addColumn(
+            "myw", "dd_feature", MywDbColumn("mvt_generalised", "boolean", default=False)
+        )
+
+        # Vector tiles are only built in the database for Postgres
+        if self.db_driver.dialect_name == "postgresql":
+            self.db_driver.createMvtGeomTable()
@@ -280,7 +280,54 @@ class MywGeometry:
 
         return geom
 
-    def getProjTransform(self, from_coord_sys, to_coord_sys):
+    @classmethod
+    def geoTransformAll(cls, geoms, from_coord_sys, to_coord_sys):
+        """
+        Returns copies of GEOMS projected into TO_COORD_SYS
+
+        GEOMS is a list of MywGeometries or shapely geometries (None entries
+        are passed through). The coordinates of all geometries are transformed
+        in a single proj call, so this is much faster than calling
+        .geoTransform() on each in turn.
+
+        FROM_COORD_SYS and TO_COORD_SYS are MywCoordSystems"""
+
+        import numpy
+        import shapely
+
+        # Check for nothing to do
+        if from_coord_sys == to_coord_sys:
+            return list(geoms)
+
+        # Build vector of shapely geoms
+        shapely_geoms = numpy.empty(len(geoms), dtype=object)
+        shapely_geoms[:] = [getattr(geom, "_shapely_geom", geom) for geom in geoms]
+
+        # Transform (2D and 3D geoms separately, as coordinate arrays must have one shape)
+        try:
+            proj_trans = cls.getProjTransform(from_coord_sys, to_coord_sys)
+            has_z = shapely.has_z(shapely_geoms)
+            is_2d = ~has_z & ~shapely.is_missing(shapely_geoms)
+
+            for sel, include_z in ((is_2d, False), (has_z, True)):
+                if not sel.any():
+                    continue
+
+                coords = shapely.get_coordinates(shapely_geoms[sel], include_z=include_z)
+                coords = numpy.column_stack(proj_trans(*coords.T))
+                shapely_geoms[sel] = shapely.set_coordinates(shapely_geoms[sel].copy(), coords)
+
+        except RuntimeError as cond:
+            raise MywError("Error transforming geometry:", from_coord_sys, "->", to_coord_sys, cond)
+
+        # Build result
+        return [
+            cls.newFromShapely(geom, to_coord_sys.srid) if geom is not None else None
+            for geom in shapely_geoms
+        ]
+
+    @classmethod
+    def getProjTransform(cls, from_coord_sys, to_coord_sys):
         """
         Returns a (possibily cached) projection transform function
 
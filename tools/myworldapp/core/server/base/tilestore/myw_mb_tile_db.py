@@ -10,9 +10,12 @@ from .myw_tile_db_mixin import MywTileDBMixin
 
 class MywMBTileDB(MywTileDBMixin):
     """
-    A Maxbox Tiles format sqlite tile database (readonly)
+    A Maxbox Tiles format sqlite tile database
 
-    Supports a single layer per file. See http://www.mapbox.com/developers/mbtiles/"""
+    Supports a single layer per file. See http://www.mapbox.com/developers/mbtiles/
+
+    Update is limited to adding, replacing and deleting tiles and setting
+    metadata (see .putTiles() and .setMetadata())"""
 
     # ==============================================================================
     #                                  CREATION
@@ -21,10 +24,8 @@ class MywMBTileDB(MywTileDBMixin):
     def __init__(self, filename, mode, progress=None):
         """
         Initialise self
-        """
 
-        if mode != "r":
-            raise MywError("Update of MB tiles format not supported")
+        If MODE is 'w', creates the MB tiles tables (if necessary)"""
 
         # Init super
         super(MywMBTileDB, self).__init__(filename, mode, progress)
@@ -33,6 +34,27 @@ class MywMBTileDB(MywTileDBMixin):
         self.type = "mb_tile"
         self.layer = "geo/{}".format(os.path.splitext(os.path.basename(filename))[0])
 
+        if mode == "w":
+            self.createSchema()
+
+    def createSchema(self):
+        """
+        Create the MB tiles tables (if not already present)
+        """
+
+        cur = self.connection.cursor()
+
+        cur.execute("CREATE TABLE IF NOT EXISTS metadata (name text, value text)")
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS name ON metadata (name)")
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS tiles (zoom_level integer, tile_column integer, tile_row integer, tile_data blob)"
+        )
+        cur.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)"
+        )
+
+        self.commit()
+
     # ==============================================================================
     #                                  PROPERTIES
     # ==============================================================================
@@ -65,6 +87,33 @@ class MywMBTileDB(MywTileDBMixin):
 
         return []
 
+    def metadata(self):
+        """
+        Self's metadata properties (a dict of strings, keyed by name)
+        """
+
+        props = {}
+        for name, value in self.selectQuery("SELECT name, value FROM metadata"):
+            props[name] = value
+
+        return props
+
+    def setMetadata(self, props):
+        """
+        Set metadata properties from dict PROPS (replacing existing values)
+
+        Properties with value None are removed"""
+
+        cur = self.connection.cursor()
+
+        for name, value in props.items():
+            cur.execute("DELETE FROM metadata WHERE name = ?", (name,))
+
+            if value is not None:
+                cur.execute("INSERT INTO metadata (name, value) VALUES (?,?)", (name, str(value)))
+
+        self.commit()
+
     # ==============================================================================
     #                                      STATS
     # ==============================================================================
@@ -145,6 +194,27 @@ class MywMBTileDB(MywTileDBMixin):
 
         return res[0]
 
+    def tilesInRange(self, layer, zoom, tile_id_range):
+        """
+        Generator yielding the tiles of LAYER at level ZOOM within TILE_ID_RANGE
+
+        TILE_ID_RANGE is a pair of Google-format tile IDs ((min_x,min_y),(max_x,max_y)).
+        Runs a single range query. Yields (x, y, data) tuples with Google-format IDs"""
+
+        # Convert to internal address scheme
+        min_row = self._flipY(zoom, tile_id_range[1][1])
+        max_row = self._flipY(zoom, tile_id_range[0][1])
+
+        cur = self.connection.cursor()
+
+        cur.execute(
+            "SELECT tile_column, tile_row, tile_data FROM tiles WHERE zoom_level = ? AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?",
+            (zoom, tile_id_range[0][0], tile_id_range[1][0], min_row, max_row),
+        )
+
+        for rec in cur:
+            yield rec[0], self._flipY(zoom, rec[1]), rec[2]
+
     def tiles(self, layer, **tile_filter):
         """
         Generator yielding tiles for LAYER
@@ -176,6 +246,40 @@ class MywMBTileDB(MywTileDBMixin):
                 "data": rec[3],
             }
 
+    def putTiles(self, tiles):
+        """
+        Add or replace tiles
+
+        TILES is a list of (ZOOM, X, Y, DATA) tuples with Google-format tile IDs. If DATA
+        is None, the tile is removed
+
+        Returns number of tiles stored"""
+
+        puts = []
+        deletes = []
+
+        for zoom, x, y, data in tiles:
+            tile_id = (zoom, x, self._flipY(zoom, y))
+
+            if data is None:
+                deletes.append(tile_id)
+            else:
+                puts.append(tile_id + (data,))
+
+        cur = self.connection.cursor()
+
+        cur.executemany(
+            "DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", deletes
+        )
+        cur.executemany(
+            "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?,?,?,?)",
+            puts,
+        )
+
+        self.commit()
+
+        return len(puts)
+
     # ==============================================================================
     #                                HELPERS
     # ==============================================================================
@@ -238,6 +342,20 @@ class MywMBTileDB(MywTileDBMixin):
     #                                   OPERATIONS
     # ==============================================================================
 
+    def loadFromTree(self, *args, **kwargs):
+        """
+        Load tiles from a directory tree (not supported)
+        """
+
+        raise MywError("Load of MB tiles format not supported")
+
+    def loadFromDB(self, *args, **kwargs):
+        """
+        Load tiles from another tile file (not supported)
+        """
+
+        raise MywError("Load of MB tiles format not supported")
+
     def renameLayer(self, layer, new_name):
         """
         Rename all tiles in given layer
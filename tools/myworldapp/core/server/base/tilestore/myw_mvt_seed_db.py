@@ -0,0 +1,235 @@
+################################################################################
+# An MB tiles file holding pre-rendered vector tiles for a layer
+################################################################################
+# Copyright: IQGeo Limited 2010-2023
+
+import json
+from .myw_mb_tile_db import MywMBTileDB
+
+
+class MywMVTSeedDB(MywMBTileDB):
+    """
+    An MB tiles file holding pre-rendered vector tiles for a myWorld layer
+
+    Built by MywMVTTileSeeder. In addition to the tiles, holds:
+      - Metadata identifying what was rendered and the master changes it reflects (see .seedProps())
+      - The extent of each feature rendered (so that the tiles affected by later
+        updates and deletes can be found)
+
+    Tiles within the seeded area that contain no features are not stored"""
+
+    # Render options recorded in seed (and their defaults)
+    render_option_defaults = {"generalise": True, "sub_pixel": "keep", "layers": None}
+
+    # Max number of ids in a single IN clause
+    max_ids_per_query = 500
+
+    # ==============================================================================
+    #                                  CREATION
+    # ==============================================================================
+
+    def __init__(self, filename, mode, progress=None):
+        """
+        Initialise self
+
+        If MODE is 'w', creates the MB tiles and feature extent tables (if necessary)"""
+
+        super(MywMVTSeedDB, self).__init__(filename, mode, progress)
+
+        self.type = "mvt_seed"
+
+    def createSchema(self):
+        """
+        Create self's tables (if not already present)
+        """
+
+        super(MywMVTSeedDB, self).createSchema()
+
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS myw_seed_feature (feature_type text, feature_id text, min_x real, min_y real, max_x real, max_y real, PRIMARY KEY (feature_type, feature_id))"
+        )
+
+        self.commit()
+
+    def clear(self):
+        """
+        Remove all tiles, feature extents and metadata
+        """
+
+        for table in ["tiles", "myw_seed_feature", "metadata"]:
+            self.connection.execute("DELETE FROM {}".format(table))
+
+        self.commit()
+
+    # ==============================================================================
+    #                                  SEED PROPERTIES
+    # ==============================================================================
+
+    def seedProps(self):
+        """
+        Properties of the seed (None if seeding has not completed)
+
+        Returns a dict with keys:
+          layer           Name of the myWorld layer rendered
+          min_zoom        Lowest zoom level seeded
+          max_zoom        Highest zoom level seeded
+          bounds          Long/lat area seeded ((min_x,min_y),(max_x,max_y))
+          tile_size       Tile size of the layer, in pixels
+          options         Render options (see .render_option_defaults)
+          log_id          Id of the last master transaction log entry that the tiles reflect"""
+
+        props = self.metadata()
+
+        # Note: Seeds from before change tracking by log id are treated as incomplete
+        if props.get("myw_log_id") is None:
+            return None
+
+        bounds = [float(val) for val in props["bounds"].split(",")]
+
+        return {
+            "layer": props["name"],
+            "min_zoom": int(props["minzoom"]),
+            "max_zoom": int(props["maxzoom"]),
+            "bounds": ((bounds[0], bounds[1]), (bounds[2], bounds[3])),
+            "tile_size": int(props["myw_tile_size"]),
+            "options": json.loads(props["myw_options"]),
+            "log_id": int(props["myw_log_id"]),
+        }
+
+    def setSeedProps(self, layer, min_zoom, max_zoom, bounds, tile_size, options, log_id):
+        """
+        Record the properties of the seed (see .seedProps())
+        """
+
+        bounds_str = "{},{},{},{}".format(bounds[0][0], bounds[0][1], bounds[1][0], bounds[1][1])
+
+        self.setMetadata(
+            {
+                "name": layer,
+                "format": "pbf",
+                "type": "overlay",
+                "minzoom": min_zoom,
+                "maxzoom": max_zoom,
+                "bounds": bounds_str,
+                "myw_tile_size": tile_size,
+                "myw_options": json.dumps(options, sort_keys=True),
+                "myw_log_id": log_id,
+            }
+        )
+
+    def setLogId(self, log_id):
+        """
+        Record that the tiles reflect master changes up to transaction log entry LOG_ID
+        """
+
+        self.setMetadata({"myw_log_id": log_id})
+
+    def tileIdRangeFor(self, zoom, bounds):
+        """
+        The Google-format tile ID range covering long/lat area BOUNDS at ZOOM
+
+        Like ._tileIdBoundsFor() but clamped to the valid tile IDs for the level"""
+
+        max_lat = 85.0511287798  # Limit of web mercator
+        max_id = 2**zoom - 1
+
+        bounds = [
+            (min(max(lon, -180.0), 180.0), min(max(lat, -max_lat), max_lat)) for lon, lat in bounds
+        ]
+
+        ((min_x, min_y), (max_x, max_y)) = self._tileIdBoundsFor(bounds, zoom)
+
+        return (
+            (max(min_x, 0), max(min_y, 0)),
+            (min(max_x, max_id), min(max_y, max_id)),
+        )
+
+    # ==============================================================================
+    #                                 FEATURE EXTENTS
+    # ==============================================================================
+
+    def featureExtents(self, feature_type=None):
+        """
+        Yields the recorded extents of features (optionally restricted to FEATURE_TYPE)
+
+        Yields (FEATURE_TYPE, FEATURE_ID, BOUNDS) tuples"""
+
+        cur = self.connection.cursor()
+
+        sql = "SELECT feature_type, feature_id, min_x, min_y, max_x, max_y FROM myw_seed_feature"
+
+        if feature_type:
+            cur.execute(sql + " WHERE feature_type = ?", (feature_type,))
+        else:
+            cur.execute(sql)
+
+        for rec in cur:
+            yield rec[0], rec[1], ((rec[2], rec[3]), (rec[4], rec[5]))
+
+    def featureExtentsFor(self, feature_type, ids):
+        """
+        Recorded extents of features IDS of FEATURE_TYPE
+
+        Returns a dict of bounds ((min_x,min_y),(max_x,max_y)), keyed by feature id"""
+
+        ids = [str(id) for id in ids]
+        extents = {}
+
+        cur = self.connection.cursor()
+
+        for i in range(0, len(ids), self.max_ids_per_query):
+            chunk = ids[i : i + self.max_ids_per_query]
+
+            cur.execute(
+                "SELECT feature_id, min_x, min_y, max_x, max_y FROM myw_seed_feature WHERE feature_type = ? AND feature_id IN ({})".format(
+                    ",".join("?" * len(chunk))
+                ),
+                [feature_type] + chunk,
+            )
+
+            for rec in cur:
+                extents[rec[0]] = ((rec[1], rec[2]), (rec[3], rec[4]))
+
+        return extents
+
+    def setFeatureExtents(self, feature_type, extents):
+        """
+        Record the extents of features of FEATURE_TYPE
+
+        EXTENTS is a dict of bounds ((min_x,min_y),(max_x,max_y)), keyed by feature id. Features
+        with bounds None are removed"""
+
+        puts = []
+        deletes = []
+
+        for id, bounds in extents.items():
+            if bounds is None:
+                deletes.append((feature_type, str(id)))
+            else:
+                puts.append((feature_type, str(id)) + tuple(bounds[0]) + tuple(bounds[1]))
+
+        cur = self.connection.cursor()
+
+        cur.executemany(
+            "DELETE FROM myw_seed_feature WHERE feature_type = ? AND feature_id = ?", deletes
+        )
+        cur.executemany(
+            "INSERT OR REPLACE INTO myw_seed_feature (feature_type, feature_id, min_x, min_y, max_x, max_y) VALUES (?,?,?,?,?,?)",
+            puts,
+        )
+
+        self.commit()
+
+    def featureExtentsBounds(self):
+        """
+        Long/lat bounds of all recorded feature extents (None if there are none)
+        """
+
+        rec = self.executeSql(
+            "SELECT min(min_x), min(min_y), max(max_x), max(max_y) FROM myw_seed_feature"
+        )
+
+        if rec is None or rec[0] is None:
+            return None
+
+        return ((rec[0], rec[1]), (rec[2], rec[3]))
@@ -168,6 +168,27 @@ class MywMWTileDB(MywTileDBMixin):
 
         return res[0]
 
+    def tilesInRange(self, layer, zoom, tile_id_range):
+        """
+        Generator yielding the tiles of LAYER at level ZOOM within TILE_ID_RANGE
+
+        TILE_ID_RANGE is a pair of Google-format tile IDs ((min_x,min_y),(max_x,max_y)).
+        Runs a single range query. Yields (x, y, data) tuples with Google-format IDs"""
+
+        # Convert to internal address scheme
+        min_row = self._flipY(zoom, tile_id_range[1][1])
+        max_row = self._flipY(zoom, tile_id_range[0][1])
+
+        cur = self.connection.cursor()
+
+        cur.execute(
+            "SELECT tile_column, tile_row, tile_data FROM myw_tiles WHERE id = ? AND zoom_level = ? AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?",
+            [layer, zoom, tile_id_range[0][0], tile_id_range[1][0], min_row, max_row],
+        )
+
+        for rec in cur:
+            yield rec[0], self._flipY(zoom, rec[1]), rec[2]
+
     def tiles(self, layer, **tile_filter):
         """
         Generator yielding tiles for LAYER
@@ -351,6 +372,86 @@ class MywMWTileDB(MywTileDBMixin):
             z_levels,
         )
 
+    def canCopyFromDB(self, tile_db, clip=True, bounds=None):
+        """
+        True if tiles can be loaded from TILE_DB using .copyFromDB()
+
+        Tile data is copied verbatim, so not possible where edge tiles
+        need clipping to BOUNDS (or for other file formats)"""
+
+        if bounds and clip:
+            return False
+
+        if tile_db.type != self.type or tile_db.schemaVersion() < 5:
+            return False
+
+        return True
+
+    def copyFromDB(self, tile_db, bounds=None, min_zoom=None, max_zoom=None, since_version=None):
+        """
+        Load tile records from another myWorld tile database (without clipping)
+
+        Set-based equivalent of .loadFromDB(clip=False): runs one INSERT ... SELECT
+        per layer and zoom level on TILE_DB's file, attached to self.
+        See .canCopyFromDB()
+
+        Returns number of tiles loaded"""
+
+        n_tiles = 0
+
+        # Attach source (which cannot be done within a transaction)
+        self.commit()
+        self.connection.execute(
+            "ATTACH DATABASE ? AS src", ["file:{}?mode=ro".format(tile_db.filename)]
+        )
+
+        try:
+            cur = self.connection.cursor()
+
+            for layer in tile_db.layers():
+                stats = tile_db.layerStats(layer, since_version=since_version)
+                if not stats["count"]:
+                    continue
+
+                # Find levels to copy
+                if min_zoom is not None:
+                    stats["min_zoom"] = max(stats["min_zoom"], min_zoom)
+                if max_zoom is not None:
+                    stats["max_zoom"] = min(stats["max_zoom"], max_zoom)
+
+                # Copy them
+                for zoom in range(stats["min_zoom"], stats["max_zoom"] + 1):
+                    sql = "INSERT OR REPLACE INTO myw_tiles (id, zoom_level, tile_column, tile_row, tile_data, version) SELECT id, zoom_level, tile_column, tile_row, tile_data, version FROM src.myw_tiles WHERE id = ? AND zoom_level = ?"
+                    params = [layer, zoom]
+
+                    if bounds:
+                        tile_id_range = self._tileIdBoundsFor(bounds, zoom)
+                        sql += " AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?"
+                        params += [
+                            tile_id_range[0][0],
+                            tile_id_range[1][0],
+                            self._flipY(zoom, tile_id_range[1][1]),  # Google Tile ID to TMS
+                            self._flipY(zoom, tile_id_range[0][1]),
+                        ]
+
+                    if since_version is not None:
+                        sql += " AND version > ?"
+                        params.append(since_version)
+
+                    cur.execute(sql, params)
+                    n_tiles += cur.rowcount
+
+            self.commit()
+
+        finally:
+            self.connection.rollback()  # Discards partial load (if failed)
+            self.connection.execute("DETACH DATABASE src")
+
+        # Update layer meta-data
+        self.updateLayerData()
+
+        return n_tiles
+
     def __runTileLoader(self, *args):
         """
         Run the Java tileloader engine with ARGS
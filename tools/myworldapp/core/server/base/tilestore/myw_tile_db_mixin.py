@@ -27,7 +27,8 @@ class MywTileDBMixin:
       .layerStats(layer,**tile_filter)
       .levelStats(layer,**tile_filter)
       .tiles(layer,**tile_filter)
-      .tile(layer,zoom,x,y)"""
+      .tile(layer,zoom,x,y)
+      .tilesInRange(layer,zoom,tile_id_range)"""
 
     # ==============================================================================
     #                              CONNECTION MANAGEMENT
@@ -82,6 +83,19 @@ class MywTileDBMixin:
         self.commit()
         self.connection.close()
 
+    def backupTo(self, filename):
+        """
+        Copy self to new file FILENAME using SQLite's online backup
+
+        Gives a consistent copy even if self is being updated by another process"""
+
+        out_connection = sqlcipher3.connect(filename)
+
+        try:
+            self.connection.backup(out_connection)
+        finally:
+            out_connection.close()
+
     def hasTable(self, table_name):
         """
         True if self contains a table table_name
@@ -302,6 +316,18 @@ class MywTileDBMixin:
 
         return (tile_id[0], (2**zoom - 1) - tile_id[1])
 
+    # ==============================================================================
+    #                                     LOADING
+    # ==============================================================================
+
+    def canCopyFromDB(self, tile_db, clip=True, bounds=None):
+        """
+        True if tiles can be loaded from TILE_DB using a set-based copy
+
+        Default is False (subclasses that support .copyFromDB() extend this)"""
+
+        return False
+
     # ==============================================================================
     #                                     EXPORT
     # ==============================================================================
@@ -0,0 +1,218 @@
+################################################################################
+# A pool of read connections to a tile file
+################################################################################
+# Copyright: IQGeo Limited 2010-2023
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from .myw_tile_db import MywTileDB
+
+
+class MywTileDBPool:
+    """
+    A pool of readonly MywTileDB connections to a single tile file
+
+    Allows tiles to be read from the file by several threads
+    concurrently (see .connection()). Connections are opened on
+    demand, up to MAX_SIZE. When all are in use, callers wait for
+    one to be released.
+
+    Also detects replacement or update of the file on disk (see .checkForChanges())"""
+
+    def __init__(self, filename, max_size=8, check_interval=5.0, db_class=None):
+        """
+        Init self
+
+        FILENAME is the tile file to open. CHECK_INTERVAL is the minimum
+        time between checks for changes to the file (in seconds). Optional
+        DB_CLASS is the class to open the file with (default: by file extension)
+
+        Raises MywError if the file cannot be opened"""
+
+        self.filename = filename
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self.db_class = db_class
+
+        self.idle = []  # Open connections not currently in use
+        self.n_open = 0  # Number of open connections (idle or in use)
+        self.generation = 0  # Incremented when file is replaced
+        self.cond = threading.Condition()
+
+        self.file_stamp = self._fileStamp()
+        self.last_check = time.time()
+
+        # Statistics
+        self.n_opened = 0
+        self.n_waits = 0
+
+        # Open first connection (to check file is valid)
+        self.idle.append(self._open())
+
+    def stats(self):
+        """
+        Statistics on use of self (a dict)
+        """
+
+        with self.cond:
+            return {
+                "open": self.n_open,
+                "idle": len(self.idle),
+                "max_size": self.max_size,
+                "opened": self.n_opened,
+                "waits": self.n_waits,
+            }
+
+    # ==============================================================================
+    #                                  CONNECTIONS
+    # ==============================================================================
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager yielding a connection for exclusive use by the caller (a MywTileDB)
+        """
+
+        db_file, generation = self._acquire()
+        ok = False
+
+        try:
+            yield db_file
+            ok = True
+
+        finally:
+            self._release(db_file, generation, ok)
+
+    def _acquire(self):
+        """
+        Get an idle connection (opening one or waiting if necessary)
+
+        Returns a MywTileDB and the generation it belongs to"""
+
+        with self.cond:
+            while not self.idle and self.n_open >= self.max_size:
+                self.n_waits += 1
+                self.cond.wait()
+
+            generation = self.generation
+
+            if self.idle:
+                return self.idle.pop(), generation
+
+            self.n_open += 1
+
+        # Open new connection (outside lock, as may be slow)
+        try:
+            return self._open(), generation
+
+        except Exception:
+            with self.cond:
+                self.n_open -= 1
+                self.cond.notify()
+            raise
+
+    def _release(self, db_file, generation, ok):
+        """
+        Return DB_FILE to the pool
+
+        If the connection is from an earlier generation of the file (or OK
+        is false) it is closed instead"""
+
+        with self.cond:
+            keep = ok and generation == self.generation
+
+            if keep:
+                self.idle.append(db_file)
+            else:
+                self.n_open -= 1
+
+            self.cond.notify()
+
+        if not keep:
+            self._close(db_file)
+
+    def _open(self):
+        """
+        Open a new readonly connection to self's file
+        """
+
+        if self.db_class:
+            db_file = self.db_class(self.filename, "r")
+        else:
+            db_file = MywTileDB(self.filename, "r")
+
+        with self.cond:
+            self.n_opened += 1
+
+        return db_file
+
+    def _close(self, db_file):
+        """
+        Close DB_FILE (ignoring errors)
+        """
+
+        try:
+            db_file.connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """
+        Close all idle connections
+        """
+
+        with self.cond:
+            idle = self.idle
+            self.idle = []
+            self.n_open -= len(idle)
+            self.generation += 1
+
+        for db_file in idle:
+            self._close(db_file)
+
+    # ==============================================================================
+    #                                 CHANGE DETECTION
+    # ==============================================================================
+
+    def checkForChanges(self):
+        """
+        True if self's file has been modified since the last check
+
+        Checks at most once every .check_interval seconds. If the file
+        has been replaced, open connections are discarded"""
+
+        now = time.time()
+
+        with self.cond:
+            if now - self.last_check < self.check_interval:
+                return False
+            self.last_check = now
+
+        file_stamp = self._fileStamp()
+
+        with self.cond:
+            if file_stamp == self.file_stamp:
+                return False
+
+            replaced = file_stamp[0] != self.file_stamp[0]
+            self.file_stamp = file_stamp
+
+        if replaced:
+            self.close()
+
+        return True
+
+    def _fileStamp(self):
+        """
+        Identity and modification info for self's file: (inode, mtime, size)
+        """
+
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return (None, None, None)
+
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
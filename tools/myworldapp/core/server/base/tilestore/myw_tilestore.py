@@ -3,10 +3,11 @@
 ################################################################################
 # Copyright: IQGeo Limited 2010-2023
 
-import os, copy, fnmatch
+import os, re, copy, fnmatch, threading
 from collections import OrderedDict
 from myworldapp.core.server.base.core.utils import replace_env_variables_in
-from .myw_tile_db import MywTileDB
+from myworldapp.core.server.base.core.myw_error import MywError
+from .myw_tile_db_pool import MywTileDBPool
 
 
 class MywTilestore:
@@ -14,9 +15,20 @@ class MywTilestore:
     A set of tile files (+ mappings from layers to files)
 
     Deals with opening and caching these files and retrieving
-    tiles from them (see .get_tile())"""
-
-    def __init__(self, file_specs, db_dir=None, verbosity=0):
+    tiles from them (see .get_tile()). Each file is accessed via
+    a pool of read connections, so that tiles can be retrieved by
+    several threads concurrently. Recently used tiles are held in
+    memory (see .stats())"""
+
+    def __init__(
+        self,
+        file_specs,
+        db_dir=None,
+        verbosity=0,
+        pool_size=8,
+        cache_max_bytes=32 * 1024 * 1024,
+        check_interval=5.0,
+    ):
         """
         Init self
 
@@ -30,15 +42,31 @@ class MywTilestore:
         File paths can contain references to OS environment
         variables using {VAR_NAME}.
 
-        Optional VERBOSITY can be used to output info on name lookups etc"""
+        Optional VERBOSITY can be used to output info on name lookups etc
+
+        POOL_SIZE is the maximum number of read connections to open per
+        file. CACHE_MAX_BYTES is the size of the in-memory tile cache (0 to
+        disable). CHECK_INTERVAL is the minimum time between checks for
+        files being updated (in seconds)"""
 
         # Init slots
         self.name = "TILESTORE"
         self.file_specs = file_specs
         self.verbosity = verbosity
+        self.pool_size = pool_size
+        self.check_interval = check_interval
 
-        self.layer_db_files = dict()  # Mapping from layer name to tile DB file (init lazily)
-        self.file_db_files = dict()  # Mapping from file name to tile DB file  (init lazily)
+        self.layer_db_files = dict()  # Mapping from layer name to tile DB pool (init lazily)
+        self.file_db_files = dict()  # Mapping from file name to tile DB pool  (init lazily)
+        self.lock = threading.RLock()
+
+        # In-memory cache of recently used tiles
+        self.cache_max_bytes = cache_max_bytes
+        self.cached_tiles = OrderedDict()  # Keyed by (filename,layer,zoom,x,y), least recently used first
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
         # Build lookup table
         self.layer_file_lookup = OrderedDict()
@@ -53,6 +81,16 @@ class MywTilestore:
 
             self.layer_file_lookup[layer_spec] = file_name
 
+        # Build matcher for layer specs (first match wins)
+        self.layer_file_names = list(self.layer_file_lookup.values())
+        self.layer_spec_regex = re.compile(
+            "|".join(
+                "(?P<s{}>{})".format(i_spec, fnmatch.translate(layer_spec))
+                for i_spec, layer_spec in enumerate(self.layer_file_lookup.keys())
+            )
+            or "(?!)"
+        )
+
         # Show progress
         for layer_spec, file_name in list(self.layer_file_lookup.items()):
             self._report_progress(layer_spec, "->", file_name)
@@ -86,18 +124,140 @@ class MywTilestore:
         LAYER is the layer name e.g. 'geo/telco'. ZOOM, X and Y are
         the Google-format address of the tile (i.e. origin top-left)"""
 
-        # Get cached database file (if there is one)
-        db_file = self._db_file_for_layer(layer)
+        # Get pool for database file (if there is one)
+        db_pool = self._db_file_for_layer(layer)
 
-        if not db_file:
+        if not db_pool:
             return None
 
-        # Get tile from it (if there is one)
-        return db_file.tile(layer, zoom, x, y)
+        # Discard cached tiles if file has been updated
+        if db_pool.checkForChanges():
+            self._report_progress("File changed:", db_pool.filename)
+            self._discard_tiles_for(db_pool.filename)
+
+        # Case: In memory
+        key = (db_pool.filename, layer, zoom, x, y)
+
+        with self.lock:
+            if key in self.cached_tiles:
+                self.hits += 1
+                self.cached_tiles.move_to_end(key)
+                return self.cached_tiles[key]
+
+            self.misses += 1
+
+        # Get tile from file (if there is one)
+        with db_pool.connection() as db_file:
+            tile = db_file.tile(layer, zoom, x, y)
+
+        if tile is not None:
+            tile = bytes(tile)
+
+        self._cache_tile(key, tile)
+
+        return tile
+
+    def get_tiles(self, layer, zoom, tile_id_range=None, bounds=None, max_tiles=None):
+        """
+        The tiles of LAYER at level ZOOM within a range (a list of (x, y, data) tuples)
+
+        The range is given either as TILE_ID_RANGE, a pair of Google-format tile IDs
+        ((min_x,min_y),(max_x,max_y)), or as BOUNDS, a pair of WGS84 long/lat coords.
+        Tiles are read from the file in a single query. Missing tiles are omitted
+
+        If optional MAX_TILES is given, raises MywError if the range covers more tiles than that"""
+
+        # Get pool for database file (if there is one)
+        db_pool = self._db_file_for_layer(layer)
+
+        if not db_pool:
+            return []
+
+        # Get tiles
+        with db_pool.connection() as db_file:
+            if tile_id_range is None:
+                tile_id_range = db_file._tileIdBoundsFor(bounds, zoom)
+
+            if max_tiles is not None:
+                n_tiles = (tile_id_range[1][0] - tile_id_range[0][0] + 1) * (
+                    tile_id_range[1][1] - tile_id_range[0][1] + 1
+                )
+
+                if n_tiles > max_tiles:
+                    raise MywError("Tile range too large:", n_tiles, "tiles (max", max_tiles, ")")
+
+            return [
+                (x, y, bytes(data)) for x, y, data in db_file.tilesInRange(layer, zoom, tile_id_range)
+            ]
+
+    def stats(self):
+        """
+        Statistics on tile access (a dict)
+        """
+
+        with self.lock:
+            n_requests = self.hits + self.misses
+
+            stats = {
+                "cache": {
+                    "size": len(self.cached_tiles),
+                    "bytes": self.cached_bytes,
+                    "max_bytes": self.cache_max_bytes,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hits / n_requests if n_requests else None,
+                    "evictions": self.evictions,
+                },
+                "files": {},
+            }
+
+            db_pools = dict(self.file_db_files)
+
+        for filename, db_pool in db_pools.items():
+            if db_pool:
+                stats["files"][filename] = db_pool.stats()
+
+        return stats
+
+    def _cache_tile(self, key, tile):
+        """
+        Add TILE to in-memory cache as KEY (discarding least recently used tiles if necessary)
+
+        TILE can be None (meaning 'no such tile')"""
+
+        # Note: Misses are costed nominally, to bound their number
+        size = len(tile) if tile is not None else 64
+
+        if size > self.cache_max_bytes:
+            return
+
+        with self.lock:
+            if key in self.cached_tiles:
+                return
+
+            self.cached_tiles[key] = tile
+            self.cached_bytes += size
+
+            while self.cached_bytes > self.cache_max_bytes:
+                old_key, old_tile = self.cached_tiles.popitem(last=False)
+                self.cached_bytes -= len(old_tile) if old_tile is not None else 64
+                self.evictions += 1
+
+    def _discard_tiles_for(self, filename):
+        """
+        Remove tiles from FILENAME from the in-memory cache
+        """
+
+        with self.lock:
+            keys = [key for key in self.cached_tiles if key[0] == filename]
+
+            for key in keys:
+                tile = self.cached_tiles.pop(key)
+                self.cached_bytes -= len(tile) if tile is not None else 64
 
     def _db_file_for_layer(self, layer):
         """
-        The cached database file for LAYER (if there is one)
+        The database file pool for LAYER (if there is one)
         """
 
         try:
@@ -113,7 +273,7 @@ class MywTilestore:
 
     def _db_file_for(self, layer):
         """
-        The database file for layer (if there is one)
+        The database file pool for layer (if there is one)
         """
 
         # Determine the file in whcih layer resides (if we can)
@@ -124,12 +284,13 @@ class MywTilestore:
             return None
 
         # Get associated DB from cache (or open and cache it)
-        try:
-            db_file = self.file_db_files[filename]
+        with self.lock:
+            try:
+                db_file = self.file_db_files[filename]
 
-        except KeyError:
-            db_file = self._open_file(filename)
-            self.file_db_files[filename] = db_file
+            except KeyError:
+                db_file = self._open_file(filename)
+                self.file_db_files[filename] = db_file
 
         return db_file
 
@@ -139,23 +300,23 @@ class MywTilestore:
         """
 
         # Determine which file to open
-        # ENH: Faster to translate kyes to regex and cache?
-        for (key, filename) in list(self.layer_file_lookup.items()):
-            if fnmatch.fnmatch(layer, key):
-                return filename
+        match = self.layer_spec_regex.match(layer)
 
-        return None
+        if not match:
+            return None
+
+        return self.layer_file_names[int(match.lastgroup[1:])]
 
     def _open_file(self, file):
         """
-        Ope sqlite database FILE
+        Open sqlite database FILE
 
-        Returns connection (None if open failed)"""
+        Returns connection pool (None if open failed)"""
 
         self._report_progress("Opening file", file)
 
         try:
-            db_file = MywTileDB(file, "r")
+            db_file = MywTileDBPool(file, self.pool_size, self.check_interval)
 
         except Exception as e:
             self._report_error("Open failed:", "file=", file, "error=", e)
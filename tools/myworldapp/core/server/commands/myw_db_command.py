@@ -1,6 +1,7 @@
 # Copyright: IQGeo Limited 2010-2023
 
-import os, sys, argparse, glob, re, warnings, json, code, random, string
+import os, sys, argparse, glob, re, warnings, json, code, random, string, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from collections import OrderedDict
 from datetime import datetime, timedelta
 from fnmatch import fnmatch
@@ -61,6 +62,18 @@ def _add_standard_args(op_def):
     grp.add_argument("--password_stdin", action="store_true", help="Take the password from stdin")
 
 
+# Command engine shared with 'load --jobs' worker processes (inherited via fork)
+_load_job_command = None
+
+
+def _run_load_job(job_name, file_paths):
+    """
+    Entry point for a 'load --jobs' worker process
+    """
+
+    return _load_job_command.load_files_job(job_name, file_paths)
+
+
 class EncryptionKeyAction(argparse.Action):
     """
     Action class that sets the following args for --encryption_key:
@@ -119,21 +132,9 @@ class MywDbCommand(MywCommand):
 
         self.progress = MywSimpleProgressHandler(self.args.verbosity)
 
-        # Autodetect sqlite database type
-        if self.args.db_name.endswith(".db"):
-            db_type = "sqlite"
-        else:
-            db_type = None
-
         # ENH: Find a better place for this
-        self.db_server = MywDatabaseServer(
-            db_type=db_type,
-            host=self.args.host,
-            port=self.args.port,
-            username=self.args.username,
-            password=self.parsePassword(),
-            progress=self.progress,
-        )
+        self.db_password = self.parsePassword()
+        self.db_server = self.databaseServerFor(self.progress)
 
         with warnings.catch_warnings():
             warnings.simplefilter("ignore", category=exc.SAWarning)
@@ -158,6 +159,26 @@ class MywDbCommand(MywCommand):
         if self.args.summary:
             self.progress.print_statistics(self.args.summary)
 
+    def databaseServerFor(self, progress):
+        """
+        Engine for connecting to the database server specified in self's args
+        """
+
+        # Autodetect sqlite database type
+        if self.args.db_name.endswith(".db"):
+            db_type = "sqlite"
+        else:
+            db_type = None
+
+        return MywDatabaseServer(
+            db_type=db_type,
+            host=self.args.host,
+            port=self.args.port,
+            username=self.args.username,
+            password=self.db_password,
+            progress=progress,
+        )
+
     def replication_engine(
         self, db, db_type=None, remote_username=None, remote_password=None, ignore_sync_url=False
     ) -> MywReplicationEngine:
@@ -1178,6 +1199,7 @@ class MywDbCommand(MywCommand):
                 ["track_changes", "tracked"],
                 "versioned",
                 "geom_indexed",
+                "mvt_generalised",
                 "editable",
                 ["insert_from_gui", "insert"],
                 ["update_from_gui", "update"],
@@ -2568,8 +2590,46 @@ class MywDbCommand(MywCommand):
     op_def.add_argument(
         "--direct", action="store_true", help="Use native database feature loader (for speed)"
     )
+    op_def.add_argument(
+        "--batch_size",
+        type=int,
+        metavar="N",
+        help="Load features using set-based inserts and updates of N records at a time",
+    )
+    op_def.add_argument(
+        "--defer_indexes",
+        action="store_true",
+        help="When loading into an empty table, suspend triggers and build index records afterwards (for speed)",
+    )
+    op_def.add_argument(
+        "--jobs",
+        type=int,
+        metavar="N",
+        default=1,
+        help="Load data for different feature types in N parallel processes",
+    )
     _add_standard_args(op_def)
 
+    # File types that are not feature data (loaded before data, in order, when using --jobs)
+    config_file_types = [
+        "def",
+        "config",
+        "enum",
+        "datasource",
+        "layer",
+        "layer_group",
+        "localisation",
+        "private_layer",
+        "network",
+        "application",
+        "role",
+        "user",
+        "group",
+        "table_set",
+        "rights",
+        "settings",
+    ]
+
     def operation_load(self):
         """
         Load feature definition, features etc from file
@@ -2579,6 +2639,7 @@ class MywDbCommand(MywCommand):
         db = self.db_server.open(self.args.db_name)
 
         # For each file spec ...
+        all_file_paths = []
         for file_spec in self.args.files:
 
             # Find files to process
@@ -2589,13 +2650,117 @@ class MywDbCommand(MywCommand):
             if not file_paths:
                 self.progress("warning", "File not found:", file_spec)
 
-            # For each file .. load it
-            n_files = 0
-            for file_path in file_paths:
+            all_file_paths += file_paths
+
+        # Load them
+        if self.args.jobs > 1 and self.canRunLoadJobs(db):
+            self.load_files_parallel(db, all_file_paths)
+        else:
+            for file_path in all_file_paths:
                 self.load_file(db, file_path)
 
         # ENH: Return a status code
 
+    def canRunLoadJobs(self, db):
+        """
+        True if files can be loaded in parallel worker processes
+        """
+
+        if db.db_driver.dialect_name == "sqlite":
+            self.progress("warning", "Option --jobs not supported for SQLite databases")
+            return False
+
+        if not "fork" in multiprocessing.get_all_start_methods():
+            self.progress("warning", "Option --jobs not supported on this platform")
+            return False
+
+        return True
+
+    def load_files_parallel(self, db, file_paths):
+        """
+        Load FILE_PATHS using a pool of self.args.jobs worker processes
+
+        Configuration files (.def, .enum, ..) are loaded first, in order, in
+        this process. Data files are then grouped by feature type: each group
+        is loaded in order by a single worker, on its own database session"""
+
+        global _load_job_command
+
+        # Split into configuration files and per-feature-type data
+        config_paths = []
+        data_paths = OrderedDict()
+        for file_path in file_paths:
+            parts = os.path.basename(file_path).split(".")
+
+            if parts[-1] in self.config_file_types:
+                config_paths.append(file_path)
+            else:
+                feature_type = self.args.load_as or parts[0].lower()
+                data_paths.setdefault(feature_type, []).append(file_path)
+
+        # Load configuration (which data may depend on)
+        for file_path in config_paths:
+            self.load_file(db, file_path)
+
+        if not data_paths:
+            return
+
+        # Release our connection (workers open their own)
+        engine = db.session.bind
+        db.session.remove()
+        engine.dispose()
+
+        # Load data
+        n_jobs = min(self.args.jobs, len(data_paths))
+        self.progress(1, "Loading", len(data_paths), "feature types using", n_jobs, "processes")
+
+        _load_job_command = self
+        try:
+            with ProcessPoolExecutor(
+                max_workers=n_jobs, mp_context=multiprocessing.get_context("fork")
+            ) as pool:
+                futures = OrderedDict()
+                for feature_type, paths in data_paths.items():
+                    futures[feature_type] = pool.submit(_run_load_job, feature_type, paths)
+
+                # Merge their statistics into ours
+                for feature_type, future in futures.items():
+                    try:
+                        child_stats = future.result()
+                        self.progress.current_stat["child_stats"] += child_stats
+                    except Exception as cond:
+                        self.progress("error", "Load job failed:", feature_type, ":", cond)
+        finally:
+            _load_job_command = None
+
+    def load_files_job(self, job_name, file_paths):
+        """
+        Load FILE_PATHS in order on a new database session (in a worker process)
+
+        Returns statistics gathered (a list of picklable stat trees)"""
+
+        # Use own progress handler (to gather stats)
+        self.progress = MywSimpleProgressHandler(
+            self.args.verbosity, prefix="[{}] ".format(job_name)
+        )
+
+        db = self.databaseServerFor(self.progress).open(self.args.db_name)
+
+        for file_path in file_paths:
+            self.load_file(db, file_path)
+
+        db.session.remove()
+
+        # Make messages safe to return to parent process
+        def tidy(stat):
+            for prop in ["warnings", "errors"]:
+                stat[prop] = [(self.progress.format_message(msg),) for msg in stat[prop]]
+            for child_stat in stat["child_stats"]:
+                tidy(child_stat)
+            return stat
+
+        return [tidy(stat) for stat in self.progress.stat_stack[0]["child_stats"]]
+
     def load_file(self, db, file_path):
         """
         Helper to load a file (handling errors)
@@ -2639,6 +2804,8 @@ class MywDbCommand(MywCommand):
                 delta=self.args.delta,
                 update_sequence=self.args.update_sequence,
                 direct=self.args.direct,
+                batch_size=self.args.batch_size,
+                defer_indexes=self.args.defer_indexes,
             )
 
             ok = True
@@ -2755,6 +2922,12 @@ class MywDbCommand(MywCommand):
         choices=["true", "false"],
         help="Determines if geometry indexes are created",
     )
+    op_def.add_argument(
+        "--mvt_generalised",
+        type=str,
+        choices=["true", "false"],
+        help="Determines if generalised geometry is maintained for vector tiles",
+    )
     _add_standard_args(op_def)
 
     def operation_configure(self):
@@ -2782,6 +2955,8 @@ class MywDbCommand(MywCommand):
             props["editable"] = self.args.editable == "true"
         if self.args.geom_indexed != None:
             props["geom_indexed"] = self.args.geom_indexed == "true"
+        if self.args.mvt_generalised != None:
+            props["mvt_generalised"] = self.args.mvt_generalised == "true"
 
         # Apply them
         for feature_rec in db.dd.featureTypeRecs(
@@ -4523,6 +4698,13 @@ class MywDbCommand(MywCommand):
         action=EncryptionKeyAction,
         help="Encryption key to use for this extract. If no value is provided a random key will be generated",
     )
+    op_def.add_argument(
+        "--jobs",
+        type=int,
+        metavar="N",
+        default=None,
+        help="Fast extract: read feature tables in N parallel processes and bulk load the extract",
+    )
 
     _add_standard_args(op_def)
 
@@ -4578,6 +4760,7 @@ class MywDbCommand(MywCommand):
             self.args.overwrite,
             self.args.include_deltas,
             self.args.encryption_key,
+            jobs=self.args.jobs,
         )
 
         # Package it
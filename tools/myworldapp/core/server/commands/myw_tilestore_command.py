@@ -1,11 +1,13 @@
 # Copyright: IQGeo Limited 2010-2023
 
-import os, argparse, glob, fnmatch, shutil
+import os, argparse, glob, fnmatch, shutil, json, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 from myworldapp.core.server.base.core.myw_error import MywError
 from myworldapp.core.server.base.core.myw_progress import MywSimpleProgressHandler
 from myworldapp.core.server.base.core.myw_tabulation import MywTableFormatter
 from myworldapp.core.server.base.tilestore.myw_tile_db import MywTileDB
+from myworldapp.core.server.base.tilestore.myw_mvt_seed_db import MywMVTSeedDB
 
 from .myw_command import MywCommand
 from .myw_argparse_help_formatter import MywArgparseHelpFormatter
@@ -36,6 +38,40 @@ def _add_standard_args(op_def):
     )
 
 
+def _add_db_args(op_def):
+    """
+    Define the arguments for connecting to a myWorld database
+    """
+
+    op_def.add_argument("db_name", type=str, help="Name of PostgreSQL database to render from")
+    op_def.add_argument(
+        "--jobs", type=int, metavar="N", default=1, help="Render tiles in N parallel processes"
+    )
+
+    grp = op_def.add_argument_group("connect spec")
+    grp.add_argument(
+        "--host", type=str, help="Server on which Postgres is running (default: localhost)"
+    )
+    grp.add_argument("--port", type=int, help="Port on which server listens (default: from pg_env)")
+    grp.add_argument(
+        "--username", "-U", type=str, help="Postgres user to connect as (default: from pg_env)"
+    )
+    grp.add_argument("--password", "-P", type=str, help="Password for Postgres user")
+    grp.add_argument("--password_stdin", action="store_true", help="Take the password from stdin")
+
+
+# Command engine shared with 'seed --jobs' worker processes (inherited via fork)
+_render_job_command = None
+
+
+def _run_render_job(tile_ids):
+    """
+    Entry point for a 'seed --jobs' or 'refresh --jobs' worker process
+    """
+
+    return _render_job_command.render_tiles_job(tile_ids)
+
+
 class MywTilestoreCommand(MywCommand):
     """
     Engine implementing the tilestore management command line utility
@@ -735,3 +771,314 @@ class MywTilestoreCommand(MywCommand):
 
         self.progress(1, "Upgrading from schema version", tile_db.schemaVersion(), "...")
         tile_db.upgradeSchema()
+
+    # ==============================================================================
+    #                                OPERATION SEED
+    # ==============================================================================
+
+    op_def = _define_operation(
+        arg_subparsers, "seed", help="Pre-render the vector tiles of a layer from a database"
+    )
+    _add_db_args(op_def)
+    op_def.add_argument("layer", type=str, help="Layer to render")
+    op_def.add_argument(
+        "--area", type=str, help="Region to render (lon1,lat1):(lon2,lat2) (default: data extent)"
+    )
+    op_def.add_argument(
+        "--levels", type=str, default=":", help="Tile zoom levels to render: min:max"
+    )
+    op_def.add_argument(
+        "--generalise",
+        type=str,
+        choices=["yes", "no"],
+        default="yes",
+        help="Use generalised geometry (as per render option mvt_generalise)",
+    )
+    op_def.add_argument(
+        "--sub_pixel",
+        type=str,
+        choices=["keep", "drop", "snap"],
+        default="keep",
+        help="Handling of sub-pixel geometries (as per render option mvt_sub_pixel)",
+    )
+    op_def.add_argument(
+        "--mvt_layers",
+        type=str,
+        help="MVT layer scheme: feature_type or JSON mapping (as per render option mvt_layers)",
+    )
+    op_def.add_argument(
+        "--overwrite", action="store_true", help="Overwrite existing file (if there is one)"
+    )
+    _add_standard_args(op_def)
+
+    # Number of tiles rendered per worker task
+    render_batch_size = 100
+
+    def operation_seed(self):
+        """
+        Pre-render the vector tiles of a layer into an MB tiles file
+
+        Renders only tiles touched by the layer's features. The file can be served
+        by the render controller (see render option mvt_seed_dir) and kept up to
+        date using operation 'refresh'"""
+
+        # Check for already exists
+        if os.path.exists(self.args.sqlite_file) and not self.args.overwrite:
+            raise MywError("File already exists:", self.args.sqlite_file)
+
+        # Unpick args
+        options = {
+            "generalise": self.args.generalise == "yes",
+            "sub_pixel": self.args.sub_pixel,
+            "layers": self.args.mvt_layers,
+        }
+
+        if options["layers"] and options["layers"] != "feature_type":
+            try:
+                options["layers"] = json.loads(options["layers"])
+            except ValueError:
+                raise MywError("Bad value for argument 'mvt_layers':", self.args.mvt_layers)
+
+        area = self.parse_bounds_arg("area", self.args.area)
+
+        # Open database
+        db = self.open_database()
+        seeder = self.seeder_for(db, self.args.layer, options)
+        log_id = seeder.logId()
+
+        (min_zoom, max_zoom) = self.parse_levels_arg(self.args.levels, seeder.zoomRange())
+
+        # Create output file
+        seed_db = MywMVTSeedDB(self.args.sqlite_file, "w", progress=self.progress)
+        seed_db.clear()
+
+        # Find extents of features to render
+        self.progress("starting", "Finding features in layer", self.args.layer, "...")
+        search_area = area or ((-180.0, -90.0), (180.0, 90.0))
+
+        n_ftrs = 0
+        for feature_type in seeder.featureTypes():
+            extents = seeder.featureExtentsFor(feature_type, search_area)
+            seed_db.setFeatureExtents(feature_type, extents)
+            self.progress(2, "Feature type", feature_type, ":", len(extents), "features")
+            n_ftrs += len(extents)
+
+        self.progress("finished", features=n_ftrs)
+
+        bounds = area or seed_db.featureExtentsBounds() or search_area
+
+        # Render tiles
+        self.progress("starting", "Rendering tiles for levels", min_zoom, "to", max_zoom, "...")
+
+        n_tiles = 0
+        for zoom in range(min_zoom, max_zoom + 1):
+            tile_ids = seeder.tilesFor(seed_db, zoom, bounds)
+            self.progress(2, "Level", zoom, ":", len(tile_ids), "tiles")
+            n_tiles += self.render_tiles(db, seeder, seed_db, tile_ids)
+
+        self.progress("finished", tiles=n_tiles)
+
+        # Mark seed complete
+        seed_db.setSeedProps(
+            self.args.layer, min_zoom, max_zoom, bounds, seeder.tile_size, options, log_id
+        )
+        seed_db.close()
+
+        self.progress(1, "Seeded layer", self.args.layer, "at transaction log id", log_id)
+
+    # ==============================================================================
+    #                               OPERATION REFRESH
+    # ==============================================================================
+
+    op_def = _define_operation(
+        arg_subparsers,
+        "refresh",
+        help="Re-render seeded vector tiles affected by changes since they were built",
+    )
+    _add_db_args(op_def)
+    _add_standard_args(op_def)
+
+    def operation_refresh(self):
+        """
+        Bring a seeded tile file up to date with the master data of a database
+
+        Uses the database's transaction log to find the features changed since the file
+        was last seeded or refreshed, then re-renders only the tiles that they touch
+        (before or after the change). Changes to the layer's configuration require
+        a re-seed"""
+
+        # Open seed file
+        seed_db = MywMVTSeedDB(self.args.sqlite_file, "u", progress=self.progress)
+        seed_props = seed_db.seedProps()
+
+        if seed_props is None:
+            raise MywError("Not a seeded tile file:", self.args.sqlite_file)
+
+        # Open database
+        db = self.open_database()
+        seeder = self.seeder_for(db, seed_props["layer"], seed_props["options"])
+        log_id = seeder.logId()
+
+        if log_id <= seed_props["log_id"]:
+            self.progress(1, "Tiles already up to date at transaction log id", log_id)
+            return
+
+        # Find tiles affected by changes
+        self.progress(
+            "starting",
+            "Finding changes from transaction log id",
+            seed_props["log_id"],
+            "to",
+            log_id,
+            "...",
+        )
+        tile_ids = seeder.dirtyTilesFor(seed_db, seed_props, log_id)
+        self.progress("finished", tiles=len(tile_ids))
+
+        # Re-render them
+        self.progress("starting", "Rendering", len(tile_ids), "tiles ...")
+        n_tiles = self.render_tiles(db, seeder, seed_db, tile_ids)
+        self.progress("finished", tiles=n_tiles)
+
+        seed_db.setLogId(log_id)
+        seed_db.close()
+
+        self.progress(1, "Refreshed layer", seed_props["layer"], "to transaction log id", log_id)
+
+    # ==============================================================================
+    #                              RENDERING HELPERS
+    # ==============================================================================
+
+    def open_database(self):
+        """
+        Open the database specified in self's args (a MywDatabase)
+        """
+
+        # Imported lazily for speed
+        from myworldapp.core.server.database.myw_database_server import MywDatabaseServer
+
+        if not hasattr(self, "db_password"):
+            self.db_password = self.parsePassword()
+
+        db_server = MywDatabaseServer(
+            host=self.args.host,
+            port=self.args.port,
+            username=self.args.username,
+            password=self.db_password,
+            progress=self.progress,
+        )
+
+        return db_server.open(self.args.db_name)
+
+    def seeder_for(self, db, layer_name, options):
+        """
+        Engine for rendering the tiles of LAYER_NAME from DB
+        """
+
+        # Imported lazily for speed
+        from myworldapp.core.server.database.myw_mvt_tile_seeder import MywMVTTileSeeder
+
+        if db.db_driver.dialect_name != "postgresql":
+            raise MywError("Tile seeding requires a PostgreSQL database")
+
+        return MywMVTTileSeeder(db, layer_name, options, progress=self.progress)
+
+    def render_tiles(self, db, seeder, seed_db, tile_ids):
+        """
+        Render TILE_IDS using SEEDER and store them in SEED_DB
+
+        Uses a pool of self.args.jobs worker processes (if requested). Returns number of
+        non-empty tiles stored"""
+
+        global _render_job_command
+
+        batches = [
+            tile_ids[i : i + self.render_batch_size]
+            for i in range(0, len(tile_ids), self.render_batch_size)
+        ]
+
+        # Case: Render in this process
+        if self.args.jobs <= 1 or len(batches) <= 1:
+            return sum(seed_db.putTiles(seeder.renderTiles(batch)) for batch in batches)
+
+        if not "fork" in multiprocessing.get_all_start_methods():
+            raise MywError("Option --jobs not supported on this platform")
+
+        # Release our connection (workers open their own)
+        engine = db.session.bind
+        db.session.remove()
+        engine.dispose()
+
+        # Case: Render in worker processes (storing results as they arrive)
+        n_tiles = 0
+
+        _render_job_command = self
+        self.job_seeder = None
+        self.job_seeder_props = (seeder.layer_name, seeder.options)
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=self.args.jobs, mp_context=multiprocessing.get_context("fork")
+            ) as pool:
+                for tiles in pool.map(_run_render_job, batches):
+                    n_tiles += seed_db.putTiles(tiles)
+        finally:
+            _render_job_command = None
+
+        return n_tiles
+
+    def render_tiles_job(self, tile_ids):
+        """
+        Render TILE_IDS on this process's own database session (in a worker process)
+
+        Returns a list of (ZOOM,X,Y,DATA) tuples"""
+
+        if self.job_seeder is None:
+            (layer_name, options) = self.job_seeder_props
+            self.job_seeder = self.seeder_for(self.open_database(), layer_name, options)
+
+        return self.job_seeder.renderTiles(tile_ids)
+
+    def parse_levels_arg(self, arg_str, default_range):
+        """
+        Convert string representation of zoom range ARG_STR to (min,max)
+
+        Missing values are taken from DEFAULT_RANGE"""
+
+        zooms = arg_str.split(":")
+        if len(zooms) != 2:
+            raise MywError("Bad value for argument 'levels':", arg_str)
+
+        zoom_range = list(default_range)
+        for i, zoom in enumerate(zooms):
+            if zoom:
+                try:
+                    zoom_range[i] = int(zoom)
+                except ValueError:
+                    raise MywError("Bad value for argument 'levels':", arg_str)
+
+        return tuple(zoom_range)
+
+    def parsePassword(self):
+        """
+        uses password from argument or stdin depending on command arguments used.
+
+        Returns String password
+        """
+
+        """ENH: Duplicate parsePassword in myw_db_command"""
+
+        from myworldapp.core.server.base.core.utils import read_password_from_stdin
+
+        password = self.args.password
+
+        # Warn about using --password
+        if self.args.password is not None:
+            self.progress(
+                "warning", "Using --password via the CLI is insecure. Use --password_stdin"
+            )
+
+        if self.args.password_stdin:
+            password_as_read = read_password_from_stdin()
+            password = password if password_as_read is None else password_as_read
+        return password
@@ -0,0 +1,195 @@
+################################################################################
+# Store of pre-rendered vector tiles
+################################################################################
+# Copyright: IQGeo Limited 2010-2023
+
+import os
+import re
+import time
+import threading
+
+from myworldapp.core.server.base.core.myw_progress import MywSimpleProgressHandler
+from myworldapp.core.server.base.tilestore.myw_tile_db_pool import MywTileDBPool
+from myworldapp.core.server.base.tilestore.myw_mvt_seed_db import MywMVTSeedDB
+
+
+class MywMVTSeedStore:
+    """
+    Pre-rendered vector tiles for layers, read from seed files in a directory
+
+    Seed files are built by 'myw_tilestore seed' and named <layer>.mbtiles
+    (with characters other than letters, digits and '-' replaced by '_').
+    They are detected on first use and re-read when modified or replaced on disk.
+
+    Only says what was seeded: it is up to the caller to check that the
+    seed reflects the current data (see MywMVTSeedDB.seedProps())"""
+
+    # Shared instance (see .instanceFor())
+    instance = None
+    instance_lock = threading.Lock()
+
+    @classmethod
+    def instanceFor(cls, settings):
+        """
+        Shared store configured from pyramid SETTINGS (None if not configured)
+
+        Options are taken from myw.render.options:
+          mvt_seed_dir               Directory containing seed files
+          tile_cache_check_interval  Min time between checks for changed files (in seconds)"""
+
+        options = settings.get("myw.render.options", {})
+
+        if not options.get("mvt_seed_dir"):
+            return None
+
+        with cls.instance_lock:
+            if cls.instance is None:
+                cls.instance = cls(
+                    options["mvt_seed_dir"],
+                    check_interval=options.get("tile_cache_check_interval", 1.0),
+                    progress=MywSimpleProgressHandler(options.get("log_level", 0), "SEED STORE:"),
+                )
+
+        return cls.instance
+
+    @classmethod
+    def renderOptionsFrom(cls, options):
+        """
+        The seed render options equivalent to render options OPTIONS (a dict)
+
+        OPTIONS are as per myw.render.options"""
+
+        return {
+            name: options.get("mvt_" + name, default)
+            for name, default in MywMVTSeedDB.render_option_defaults.items()
+        }
+
+    def __init__(self, seed_dir, check_interval=1.0, progress=MywSimpleProgressHandler(0)):
+        """
+        Init slots of self
+
+        SEED_DIR is the directory containing the seed files"""
+
+        self.seed_dir = seed_dir
+        self.check_interval = check_interval
+        self.progress = progress
+
+        self.lock = threading.Lock()
+        self.entries = {}  # (MywTileDBPool, seed props), keyed by layer name
+        self.last_checks = {}  # Time of last check for a seed file, keyed by layer name
+
+    def fileFor(self, layer_name):
+        """
+        Path to the seed file for LAYER_NAME
+        """
+
+        return os.path.join(self.seed_dir, re.sub(r"[^\w\-]", "_", layer_name) + ".mbtiles")
+
+    def tileFor(self, layer_name, zoom, x, y):
+        """
+        The seeded MVT tile (ZOOM,X,Y) of LAYER_NAME (if there is one)
+
+        Returns (DATA, SEED_PROPS) or None if the tile is not covered by a seed
+        file. DATA is empty if the tile contains no features"""
+
+        entry = self._entryFor(layer_name)
+        if entry is None:
+            return None
+
+        (pool, seed_props) = entry
+
+        # Check for outside seeded levels
+        if not (seed_props["min_zoom"] <= zoom <= seed_props["max_zoom"]):
+            return None
+
+        with pool.connection() as seed_db:
+
+            # Check for outside seeded area
+            ((min_x, min_y), (max_x, max_y)) = seed_db.tileIdRangeFor(zoom, seed_props["bounds"])
+            if not (min_x <= x <= max_x and min_y <= y <= max_y):
+                return None
+
+            data = seed_db.tile(seed_db.layer, zoom, x, y)
+
+        return (data or b"", seed_props)
+
+    def _entryFor(self, layer_name):
+        """
+        The pool and seed properties for LAYER_NAME (None if there is no valid seed file)
+
+        Opens the file on first use and re-reads its properties if it changes"""
+
+        now = time.time()
+
+        with self.lock:
+            entry = self.entries.get(layer_name)
+
+            # Check for time to look for file (again)
+            if entry is None:
+                if now - self.last_checks.get(layer_name, 0.0) < self.check_interval:
+                    return None
+                self.last_checks[layer_name] = now
+
+        # Case: Already open
+        if entry is not None:
+            (pool, seed_props) = entry
+
+            if not pool.checkForChanges():
+                return entry
+
+            seed_props = self._seedPropsFor(layer_name, pool)
+            entry = (pool, seed_props) if seed_props else None
+
+        # Case: Not yet open
+        else:
+            filename = self.fileFor(layer_name)
+            if not os.path.exists(filename):
+                return None
+
+            try:
+                pool = MywTileDBPool(
+                    filename, check_interval=self.check_interval, db_class=MywMVTSeedDB
+                )
+            except Exception as cond:
+                self.progress("warning", "Cannot open seed file:", filename, ":", cond)
+                return None
+
+            seed_props = self._seedPropsFor(layer_name, pool)
+            entry = (pool, seed_props) if seed_props else None
+
+        with self.lock:
+            if entry is None:
+                self.entries.pop(layer_name, None)
+            else:
+                self.entries[layer_name] = entry
+
+        if entry is None:
+            pool.close()
+
+        return entry
+
+    def _seedPropsFor(self, layer_name, pool):
+        """
+        Seed properties of the file in POOL (None if invalid or not for LAYER_NAME)
+        """
+
+        try:
+            with pool.connection() as seed_db:
+                seed_props = seed_db.seedProps()
+
+        except Exception as cond:
+            self.progress("warning", "Cannot read seed file:", pool.filename, ":", cond)
+            return None
+
+        if seed_props is None:
+            return None
+
+        if seed_props["layer"] != layer_name:
+            self.progress(
+                "warning", "Seed file", pool.filename, "is for layer:", seed_props["layer"]
+            )
+            return None
+
+        self.progress(4, "Seed file", pool.filename, ": log id", seed_props["log_id"])
+
+        return seed_props
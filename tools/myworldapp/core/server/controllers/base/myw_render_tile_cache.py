@@ -0,0 +1,705 @@
+################################################################################
+# Cache for rendered vector tiles
+################################################################################
+# Copyright: IQGeo Limited 2010-2023
+
+import os
+import json
+import time
+import hashlib
+import threading
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+
+from myworldapp.core.server.base.core.myw_error import MywError
+from myworldapp.core.server.base.core.myw_progress import MywSimpleProgressHandler
+from myworldapp.core.server.database.myw_transaction_log_cursor import MywTransactionLogCursor
+
+# A cached tile
+#   ETAG           Hash of BODY
+#   BODY           Tile data (bytes)
+#   BUILT_POSITION Transaction log position at which tile was built (see MywRenderTileCache.refresh())
+#   WORLD          World name
+#   DELTA          Delta name ("" for master)
+#   FEATURE_TYPES  Feature types queried to build tile
+#   BOUNDS         Long/lat extent of the data that can affect the tile (minx, miny, maxx, maxy)
+MywRenderTile = namedtuple(
+    "MywRenderTile", "etag body built_position world delta feature_types bounds"
+)
+
+# A change to feature data, from the transaction log
+#   LOG_ID         Id of the log entry recording the change
+#   DELTA          Delta name (None if change is to master)
+#   FEATURE_TYPE   Feature type changed
+#   WORLD          World of changed geometry (None if unknown)
+#   BOUNDS         Long/lat extent of changed geometry (None if unknown)
+MywRenderChange = namedtuple("MywRenderChange", "log_id delta feature_type world bounds")
+
+
+class MywRenderTileCache:
+    """
+    Cache of rendered vector tiles (MVT and GeoJSON)
+
+    Holds tiles in a byte-bounded in-memory LRU plus an optional
+    on-disk tier (shared by all processes using the same directory).
+    The disk tier is also byte-bounded, discarding the least recently
+    used files (by modification time, which is updated on read).
+
+    Cached tiles are validated lazily against a history of feature
+    changes read from the master and delta transaction logs. A tile is
+    discarded only if a change logged after it was built touches one of
+    its feature types within its bounds. Where the location of a change
+    is unknown (e.g. deletion of a feature whose geometry has not been
+    seen) all tiles of that feature type are discarded. Tiles built
+    before the start of the retained history are treated as stale.
+
+    Changes are tracked by log entry id (rather than data version, which
+    is not advanced by feature edits). As entries can commit out of id
+    order, tiles record the position up to which all entries have been
+    read (see MywTransactionLogCursor). Tiles including feature types
+    that are not change tracked are never cached"""
+
+    # Shared instance (see .instanceFor())
+    instance = None
+    instance_lock = threading.Lock()
+
+    # Transaction logs from which changes are read (master changes first)
+    log_table_names = ["transaction_log", "delta_transaction_log"]
+
+    @classmethod
+    def instanceFor(cls, settings):
+        """
+        Shared cache configured from pyramid SETTINGS (None if disabled)
+
+        Options are taken from myw.render.options:
+          tile_cache_max_bytes       Size of in-memory tier (0 disables cache)
+          tile_cache_dir             Directory for on-disk tier (optional)
+          tile_cache_disk_max_bytes  Size of on-disk tier
+          tile_cache_check_interval  Min time between transaction log checks (in seconds)"""
+
+        with cls.instance_lock:
+            if cls.instance is None:
+                options = settings.get("myw.render.options", {})
+
+                cls.instance = cls(
+                    max_bytes=options.get("tile_cache_max_bytes", 64 * 1024 * 1024),
+                    cache_dir=options.get("tile_cache_dir"),
+                    disk_max_bytes=options.get("tile_cache_disk_max_bytes", 1024 * 1024 * 1024),
+                    check_interval=options.get("tile_cache_check_interval", 1.0),
+                    progress=MywSimpleProgressHandler(options.get("log_level", 0), "TILE CACHE:"),
+                )
+
+        if not cls.instance.max_bytes:
+            return None
+
+        return cls.instance
+
+    def __init__(
+        self,
+        max_bytes=64 * 1024 * 1024,
+        cache_dir=None,
+        disk_max_bytes=1024 * 1024 * 1024,
+        check_interval=1.0,
+        history_size=10000,
+        history_preload=1000,
+        wait_timeout=5,
+        progress=MywSimpleProgressHandler(0),
+    ):
+        """
+        Init slots of self
+
+        MAX_BYTES is the size limit for the in-memory tier. Optional CACHE_DIR
+        enables the disk tier, which is limited to DISK_MAX_BYTES. HISTORY_SIZE is the number of feature changes to
+        retain (per transaction log) for validating tiles. HISTORY_PRELOAD is the number
+        of entries to read from each transaction log on first use (so that tiles in the
+        disk tier from previous processes can be validated). WAIT_TIMEOUT is the max time
+        to wait for in-progress transactions on first use (in seconds)"""
+
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.check_interval = check_interval
+        self.history_size = history_size
+        self.history_preload = history_preload
+        self.wait_timeout = wait_timeout
+        self.progress = progress
+
+        self.lock = threading.RLock()
+
+        # In-memory tier
+        self.tiles = OrderedDict()  # MywRenderTiles, keyed by cache key, least recently used first
+        self.n_bytes = 0
+
+        # Disk tier
+        self.disk_lock = threading.Lock()  # Held while pruning
+        self.disk_bytes = None  # Estimated size of disk tier (None if not yet scanned)
+
+        # Change history (one entry per transaction log)
+        self.log_cursors = None  # Read positions in transaction logs (MywTransactionLogCursors)
+        self.log_position = None  # Log ids up to which all entries have been read
+        self.history_start = None  # Log ids before which tiles cannot be validated
+        self.history = [[] for name in self.log_table_names]  # MywRenderChanges, in log id order
+        self.history_ids = [[] for name in self.log_table_names]  # Log ids (for bisecting)
+        self.known_bounds = OrderedDict()  # Last seen geometry bounds, keyed by (delta,feature_type,id)
+        self.known_bounds_size = 100000
+        self.untracked_feature_types = set()  # Feature types whose changes are not logged
+        self.last_check = 0.0
+
+        # Statistics
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.invalidations = 0
+
+    def stats(self):
+        """
+        Statistics on use of self (a dict)
+        """
+
+        with self.lock:
+            return {
+                "size": len(self.tiles),
+                "bytes": self.n_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_bytes": self.disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "disk_evictions": self.disk_evictions,
+                "invalidations": self.invalidations,
+                "log_position": self.log_position,
+                "history_size": sum(len(history) for history in self.history),
+            }
+
+    # ==============================================================================
+    #                                    ACCESS
+    # ==============================================================================
+
+    @staticmethod
+    def keyFor(*parts):
+        """
+        Cache key for request identified by PARTS (JSON-serialisable values)
+        """
+
+        ident = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+
+        return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        The valid cached tile for KEY (a MywRenderTile), if there is one
+        """
+
+        with self.lock:
+
+            # Try memory
+            tile = self.tiles.get(key)
+            if tile is not None:
+                if self._isValid(tile):
+                    self.tiles.move_to_end(key)
+                    self.hits += 1
+                    return tile
+
+                self._discard(key)
+                self.invalidations += 1
+
+        # Try disk
+        tile = self._readTile(key)
+        if tile is not None:
+
+            with self.lock:
+                if self._isValid(tile):
+                    self._add(key, tile)
+                    self.disk_hits += 1
+                    return tile
+
+                self.invalidations += 1
+
+            self._deleteTile(key)
+
+        with self.lock:
+            self.misses += 1
+
+        return None
+
+    def canCache(self, feature_types):
+        """
+        True if tiles including FEATURE_TYPES can be cached
+
+        Changes to feature types that are not change tracked are not
+        logged, so tiles including them could not be validated"""
+
+        with self.lock:
+            return not self.untracked_feature_types.intersection(feature_types)
+
+    def put(self, key, body, built_position, world, delta, feature_types, bounds):
+        """
+        Add tile BODY to cache as KEY
+
+        BUILT_POSITION is the value returned by .refresh() before the tile was built
+
+        Returns the tile added (a MywRenderTile)"""
+
+        etag = hashlib.md5(body).hexdigest()
+        tile = MywRenderTile(
+            etag,
+            body,
+            tuple(built_position),
+            world,
+            delta,
+            tuple(sorted(feature_types)),
+            tuple(bounds),
+        )
+
+        with self.lock:
+            self._add(key, tile)
+
+        self._writeTile(key, tile)
+
+        return tile
+
+    def _add(self, key, tile):
+        """
+        Add TILE to in-memory tier as KEY (discarding least recently used tiles if necessary)
+
+        Must be called holding self.lock"""
+
+        self._discard(key)
+
+        if len(tile.body) > self.max_bytes:
+            return
+
+        self.tiles[key] = tile
+        self.n_bytes += len(tile.body)
+
+        while self.n_bytes > self.max_bytes:
+            old_key, old_tile = self.tiles.popitem(last=False)
+            self.n_bytes -= len(old_tile.body)
+            self.evictions += 1
+
+    def _discard(self, key):
+        """
+        Remove KEY from in-memory tier (if present)
+
+        Must be called holding self.lock"""
+
+        tile = self.tiles.pop(key, None)
+        if tile is not None:
+            self.n_bytes -= len(tile.body)
+
+    # ==============================================================================
+    #                                   VALIDATION
+    # ==============================================================================
+
+    def _isValid(self, tile):
+        """
+        True if no change since TILE was built affects it
+
+        Must be called holding self.lock"""
+
+        return not self.changedSince(
+            tile.built_position, tile.world, tile.delta, tile.feature_types, tile.bounds
+        )
+
+    def changedSince(self, position, world, delta, feature_types, bounds):
+        """
+        True if a change logged after transaction log POSITION may affect a tile
+
+        POSITION is a value returned by .refresh(). Its entry for a log can
+        be None to ignore changes in that log (e.g. for master-only data).
+        WORLD, DELTA, FEATURE_TYPES and BOUNDS are the properties of the tile
+        (see MywRenderTile). Positions before the start of the retained history
+        are treated as changed"""
+
+        with self.lock:
+
+            if position is None or self.history_start is None:
+                return True
+
+            if len(position) != len(self.log_table_names):
+                return True
+
+            for since_id, start_id, history, history_ids in zip(
+                position, self.history_start, self.history, self.history_ids
+            ):
+
+                if since_id is None:
+                    continue
+
+                if since_id < start_id:
+                    return True
+
+                # Check changes logged after position
+                first = bisect_right(history_ids, since_id)
+
+                for change in history[first:]:
+                    if self._affects(change, world, delta, feature_types, bounds):
+                        return True
+
+            return False
+
+    def _affects(self, change, world, delta, feature_types, bounds):
+        """
+        True if CHANGE (a MywRenderChange) may affect a tile with the given properties
+        """
+
+        if change.delta is not None and change.delta != delta:
+            return False
+
+        if change.feature_type not in feature_types:
+            return False
+
+        if change.bounds is None:
+            return True
+
+        if change.world != world:
+            return False
+
+        return self._intersects(change.bounds, bounds)
+
+    def _intersects(self, bounds1, bounds2):
+        """
+        True if bounding boxes BOUNDS1 and BOUNDS2 overlap
+        """
+
+        return not (
+            bounds1[2] < bounds2[0]
+            or bounds1[0] > bounds2[2]
+            or bounds1[3] < bounds2[1]
+            or bounds1[1] > bounds2[3]
+        )
+
+    def refresh(self, db):
+        """
+        Bring self's change history up to date with the transaction logs of DB (a MywDatabase)
+
+        Checks at most once every .check_interval seconds
+
+        Returns the transaction log position to use as built_position for tiles built now
+        (None if history is not available yet)"""
+
+        now = time.time()
+
+        with self.lock:
+            if self.log_cursors is not None and now - self.last_check < self.check_interval:
+                return self.log_position
+
+            self.last_check = now
+
+            # On first use, read recent history (so that disk tier can be validated)
+            if self.log_cursors is None:
+                try:
+                    self.history_start = [
+                        max(
+                            MywTransactionLogCursor.finalPosition(
+                                db, table_name, timeout=self.wait_timeout
+                            )
+                            - self.history_preload,
+                            0,
+                        )
+                        for table_name in self.log_table_names
+                    ]
+                except MywError as cond:
+                    self.progress("warning", "Cannot read change history:", cond)
+                    return None
+
+                self.log_cursors = [
+                    MywTransactionLogCursor(table_name, start_id)
+                    for table_name, start_id in zip(self.log_table_names, self.history_start)
+                ]
+
+            self._readChanges(db)
+            self.untracked_feature_types = self._untrackedFeatureTypes(db)
+            self.log_position = tuple(cursor.position for cursor in self.log_cursors)
+
+            return self.log_position
+
+    def _readChanges(self, db):
+        """
+        Add changes logged since the last read to self's history
+
+        Must be called holding self.lock"""
+
+        for i_log, cursor in enumerate(self.log_cursors):
+            has_delta = cursor.table_name == "delta_transaction_log"
+
+            # Get changed features
+            changed = OrderedDict()  # Keyed by (delta, feature_type) -> feature_id -> (op, log_id)
+
+            columns = ["operation", "feature_type", "feature_id"]
+            if has_delta:
+                columns.append("delta")
+
+            for rec in cursor.read(db, columns):
+                delta = rec["delta"] if has_delta else None
+                ftr_changes = changed.setdefault((delta, rec["feature_type"]), OrderedDict())
+                ftr_changes[str(rec["feature_id"])] = (rec["operation"], rec["id"])
+
+            if not changed:
+                continue
+
+            self.progress(4, "Reading changes:", cursor.table_name, "position", cursor.position)
+
+            # Convert to history entries
+            changes = []
+            for (delta, feature_type), ftr_changes in changed.items():
+                changes += self._changesFor(db, delta, feature_type, ftr_changes)
+
+            changes.sort(key=lambda change: change.log_id)
+
+            # Add to history (discarding oldest entries if necessary)
+            history = self.history[i_log]
+            history_ids = self.history_ids[i_log]
+
+            late = history_ids and changes and changes[0].log_id < history_ids[-1]
+
+            history += changes
+            history_ids += [change.log_id for change in changes]
+
+            # Case: Entries committed out of id order
+            if late:
+                history.sort(key=lambda change: change.log_id)
+                history_ids[:] = [change.log_id for change in history]
+
+            n_excess = len(history) - self.history_size
+            if n_excess > 0:
+                self.history_start[i_log] = history_ids[n_excess - 1]
+                del history[:n_excess]
+                del history_ids[:n_excess]
+
+    def _untrackedFeatureTypes(self, db):
+        """
+        Names of the myWorld feature types of DB whose changes are not logged
+        """
+
+        sql = "SELECT feature_name FROM {} WHERE datasource_name = 'myworld' AND (track_changes IS NULL OR NOT track_changes)".format(
+            db.db_driver.dbNameFor("myw", "dd_feature", True)
+        )
+
+        return set(rec["feature_name"] for rec in db.session.execute(sql))
+
+    def _changesFor(self, db, delta, feature_type, ftr_changes):
+        """
+        History entries for FTR_CHANGES to features of FEATURE_TYPE in DELTA
+
+        FTR_CHANGES is a dict of (OPERATION, LOG_ID) tuples, keyed by feature id
+
+        Returns a list of MywRenderChanges"""
+
+        # Get current bounds of inserted and updated features (in one query)
+        current_ids = [id for id, (op, log_id) in ftr_changes.items() if op != "delete"]
+        current_bounds = {}
+
+        if current_ids:
+            try:
+                table = db.view(delta or "").table(feature_type)
+                for rec in table.getRecs(current_ids):
+                    current_bounds[str(rec._id)] = self._boundsOf(rec)
+
+            except Exception as cond:  # Missing table etc
+                self.progress(4, "Cannot get bounds for", feature_type, ":", cond)
+                current_ids = []
+
+        # Build entries
+        changes = []
+        for id, (op, log_id) in ftr_changes.items():
+            known_key = (delta, feature_type, id)
+
+            # Add old location
+            if op != "insert" or id not in current_bounds:
+                old_bounds = self.known_bounds.pop(known_key, None)
+
+                if old_bounds is None:
+                    changes.append(MywRenderChange(log_id, delta, feature_type, None, None))
+                else:
+                    for world, bounds in old_bounds:
+                        changes.append(MywRenderChange(log_id, delta, feature_type, world, bounds))
+
+            # Add new location
+            new_bounds = current_bounds.get(id)
+            if new_bounds is not None:
+                for world, bounds in new_bounds:
+                    changes.append(MywRenderChange(log_id, delta, feature_type, world, bounds))
+
+                self.known_bounds[known_key] = new_bounds
+                self.known_bounds.move_to_end(known_key)
+
+        while len(self.known_bounds) > self.known_bounds_size:
+            self.known_bounds.popitem(last=False)
+
+        return changes
+
+    def _boundsOf(self, rec):
+        """
+        Extents of the geometries of feature record REC
+
+        Returns a list of (WORLD, BOUNDS) tuples"""
+
+        bounds = []
+
+        for geom_field_name, world_field_name in list(rec._geom_field_info.items()):
+            geom = rec._field(geom_field_name).geom()
+            if geom is None or geom.is_empty:
+                continue
+
+            world = rec[world_field_name] if world_field_name else "geo"
+            bounds.append((world, tuple(geom.bounds)))
+
+        return bounds
+
+    # ==============================================================================
+    #                                   DISK TIER
+    # ==============================================================================
+
+    def _pathFor(self, key):
+        """
+        Path to disk tier file for KEY
+        """
+
+        return os.path.join(self.cache_dir, key[:2], key + ".tile")
+
+    def _readTile(self, key):
+        """
+        Tile for KEY from disk tier (if present)
+        """
+
+        if not self.cache_dir:
+            return None
+
+        path = self._pathFor(key)
+
+        try:
+            with open(path, "rb") as strm:
+                header = json.loads(strm.readline())
+                body = strm.read()
+
+            os.utime(path)  # Mark as recently used (see .pruneDisk())
+
+        except (OSError, ValueError):
+            return None
+
+        # Note: Tiles from before change tracking by log id have no position (so are stale)
+        built_position = header.get("built_position")
+
+        return MywRenderTile(
+            header["etag"],
+            body,
+            tuple(built_position) if built_position else None,
+            header["world"],
+            header["delta"],
+            tuple(header["feature_types"]),
+            tuple(header["bounds"]),
+        )
+
+    def _writeTile(self, key, tile):
+        """
+        Store TILE in disk tier as KEY
+        """
+
+        if not self.cache_dir:
+            return
+
+        path = self._pathFor(key)
+        header = tile._asdict()
+        del header["body"]
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            tmp_path = "{}.{}.{}".format(path, os.getpid(), threading.get_ident())
+            with open(tmp_path, "wb") as strm:
+                strm.write(json.dumps(header).encode("utf-8") + b"\n")
+                strm.write(tile.body)
+
+            os.replace(tmp_path, path)
+
+        except OSError as cond:
+            self.progress("warning", "Cannot write tile to disk cache:", cond)
+            return
+
+        # Discard least recently used tiles (if necessary)
+        with self.lock:
+            if self.disk_bytes is not None:
+                self.disk_bytes += len(tile.body)
+            prune = self.disk_bytes is None or self.disk_bytes > self.disk_max_bytes
+
+        if prune:
+            self.pruneDisk()
+
+    def _deleteTile(self, key):
+        """
+        Remove KEY from disk tier (if present)
+        """
+
+        try:
+            os.remove(self._pathFor(key))
+        except OSError:
+            pass
+
+    def pruneDisk(self):
+        """
+        Discard least recently used files from the disk tier until it is within size limit
+
+        Also re-calculates the size of the disk tier (which is shared
+        with other processes, so may differ from self's estimate)"""
+
+        # Case: Already being pruned by another thread
+        if not self.disk_lock.acquire(blocking=False):
+            return
+
+        try:
+            # Find tile files (oldest first)
+            files = []  # (MTIME, SIZE, PATH) tuples
+            n_bytes = 0
+
+            for dir_entry in os.scandir(self.cache_dir):
+                if not dir_entry.is_dir():
+                    continue
+
+                for file_entry in os.scandir(dir_entry.path):
+                    if not file_entry.name.endswith(".tile"):
+                        continue
+
+                    try:
+                        stat = file_entry.stat()
+                    except OSError:  # Removed by another process
+                        continue
+
+                    files.append((stat.st_mtime, stat.st_size, file_entry.path))
+                    n_bytes += stat.st_size
+
+            files.sort()
+
+            # Discard oldest
+            # Note: Prunes to below limit, to avoid rescanning on every write
+            target_bytes = self.disk_max_bytes * 0.9
+            n_discarded = 0
+
+            for mtime, size, path in files:
+                if n_bytes <= target_bytes:
+                    break
+
+                try:
+                    os.remove(path)
+                    n_discarded += 1
+                except OSError:
+                    pass
+
+                n_bytes -= size
+
+            if n_discarded:
+                self.progress(4, "Discarded", n_discarded, "tiles from disk tier")
+
+            with self.lock:
+                self.disk_bytes = n_bytes
+                self.disk_evictions += n_discarded
+
+        except OSError as cond:
+            self.progress("warning", "Cannot prune disk cache:", cond)
+
+        finally:
+            self.disk_lock.release()
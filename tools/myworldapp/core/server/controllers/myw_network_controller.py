@@ -7,6 +7,7 @@
 
 import json
 from collections import OrderedDict
+from itertools import chain, islice
 from pyramid.view import view_config
 import pyramid.httpexceptions as exc
 from geojson import FeatureCollection
@@ -28,6 +29,9 @@ class MywNetworkController(MywController):
     Controller for accessing myw.network
     """
 
+    # Default max number of start objects in a shortest_paths request (see myw.network.options)
+    max_shortest_paths_from = 100
+
     def __init__(self, request):
         """
         Initialize self
@@ -219,7 +223,9 @@ class MywNetworkController(MywController):
     def trace_out(self):
         """
         Find objects feed by a specified object
-        """
+
+        If result_type is 'stream', returns nodes as newline-delimited JSON
+        as they are found (see stream_result_from())"""
         network = self.request.matchdict["network"]
 
         # Unpick parameters
@@ -234,7 +240,7 @@ class MywNetworkController(MywController):
         max_dist = self.get_param(self.request, "max_dist", type=float)
         max_nodes = self.get_param(self.request, "max_nodes", type=int)
         result_type = self.get_param(
-            self.request, "result_type", values=["features", "tree"], default="features"
+            self.request, "result_type", values=["features", "tree", "stream"], default="features"
         )
         feature_types = self.get_param(self.request, "return", list=True)
         application = self.get_param(self.request, "application")
@@ -246,6 +252,18 @@ class MywNetworkController(MywController):
         # Create engine
         engine = self.network_engine_for(network, delta, extra_filters)
 
+        # Case: Streamed result
+        if result_type == "stream":
+            try:
+                nodes = engine.traceOutNodes(start_feature_urn, direction, max_dist, max_nodes)
+
+                # Get first node before streaming (so that bad start feature etc gives an error status)
+                first_nodes = list(islice(nodes, 1))
+            except MywError as cond:
+                mywAbort(cond)
+
+            return self.stream_result_from(chain(first_nodes, nodes), feature_types, application)
+
         # Perform trace
         try:
             tree = engine.traceOut(start_feature_urn, direction, max_dist, max_nodes)
@@ -261,12 +279,13 @@ class MywNetworkController(MywController):
     def shortest_path(self):
         """
         Find shortest path from one object to another
-        """
+
+        If several end objects are given, finds the path to the nearest one"""
         network = self.request.matchdict["network"]
 
         # Unpick parameters
         start_feature_urn = self.get_param(self.request, "from", mandatory=True)
-        end_feature_urn = self.get_param(self.request, "to", mandatory=True)
+        end_feature_urns = self.get_param(self.request, "to", list=True, mandatory=True)
         extra_filters = self.get_param(self.request, "filters", type="json", default={})
         max_dist = self.get_param(self.request, "max_dist", type=float)
         max_nodes = self.get_param(self.request, "max_nodes", type=int)
@@ -285,13 +304,94 @@ class MywNetworkController(MywController):
 
         # Perform trace
         try:
-            tree = engine.shortestPath(start_feature_urn, end_feature_urn, max_dist, max_nodes)
+            tree = engine.shortestPath(start_feature_urn, end_feature_urns, max_dist, max_nodes)
         except MywError as cond:
             mywAbort(cond)
 
         # Build result
         return self.result_from(tree, result_type, feature_types, application)
 
+    @view_config(
+        route_name="myw_network_controller.shortest_paths",
+        request_method=("GET", "POST"),
+        renderer="json",
+    )
+    def shortest_paths(self):
+        """
+        Find shortest paths from each of a set of objects to each of another
+
+        If no end objects are given, finds paths to all objects reachable.
+        Returns distance, cost and (optionally) path for each pair, keyed
+        by start URN then end URN.
+
+        The number of start objects is limited by option max_shortest_paths_from
+        of myw.network.options (as each requires a separate search)"""
+        network = self.request.matchdict["network"]
+
+        # Unpick parameters
+        start_feature_urns = self.get_param(self.request, "from", list=True, mandatory=True)
+        end_feature_urns = self.get_param(self.request, "to", list=True)
+        direction = self.get_param(
+            self.request, "direction", values=["upstream", "downstream", "both"], default="both"
+        )
+        extra_filters = self.get_param(self.request, "filters", type="json", default={})
+        max_dist = self.get_param(self.request, "max_dist", type=float)
+        max_nodes = self.get_param(self.request, "max_nodes", type=int)
+        include_paths = self.get_param(self.request, "include_paths", type=bool, default=False)
+        application = self.get_param(self.request, "application")
+        delta = self.get_param(self.request, "delta")
+
+        # Check authorised
+        self.current_user.assertAuthorized(self.request)
+
+        # Check request size
+        options = self.request.registry.settings.get("myw.network.options", {})
+        max_from = options.get("max_shortest_paths_from", self.max_shortest_paths_from)
+
+        if len(start_feature_urns) > max_from:
+            raise exc.HTTPBadRequest(
+                "Too many 'from' objects: {} (max {})".format(len(start_feature_urns), max_from)
+            )
+
+        # Create engine
+        engine = self.network_engine_for(network, delta, extra_filters)
+
+        # Find paths
+        try:
+            paths = engine.shortestPaths(
+                start_feature_urns, end_feature_urns, direction, max_dist, max_nodes
+            )
+        except MywError as cond:
+            mywAbort(cond)
+
+        # Build result (excluding inaccessible objects)
+        accessible_feature_types = set(
+            self.current_user.featureTypes("myworld", application_name=application)
+        )
+
+        def accessible(urn):
+            return urn.split("/")[0] in accessible_feature_types
+
+        result = OrderedDict()
+        for start_urn, end_paths in paths.items():
+            if not accessible(start_urn):
+                continue
+
+            start_result = result[start_urn] = OrderedDict()
+
+            for end_urn, (dist, cost, path) in end_paths.items():
+                if not accessible(end_urn):
+                    continue
+
+                end_result = start_result[end_urn] = OrderedDict()
+                end_result["dist"] = dist
+                end_result["cost"] = cost
+
+                if include_paths:
+                    end_result["path"] = list(filter(accessible, path))
+
+        return {"paths": result}
+
     def network_engine_for(self, name, delta, extra_filters={}):
         """
         Returns MywNetworkEngine engine for network NAME (error if not found)
@@ -323,24 +423,8 @@ class MywNetworkController(MywController):
 
         Optional FEATURE_TYPES restricts result to those types only"""
 
-        lang = self.get_param(self.request, "lang", type=str, default=None)
-
-        feature_aspects = {
-            "include_display_values": True,  # TODO: Pass these in
-            "include_lobs": False,
-            "include_geo_geometry": True,
-            "lang": lang,
-        }
-
-        # Prevent return of inaccessible feature types
-        accessible_feature_types = self.current_user.featureTypes(
-            "myworld", application_name=application
-        )
-
-        if feature_types:
-            feature_types = set(feature_types).intersection(accessible_feature_types)
-        else:
-            feature_types = set(accessible_feature_types)
+        feature_aspects = self.feature_aspects()
+        feature_types = self.result_feature_types(feature_types, application)
 
         # Case: List of features
         if result_type == "features":
@@ -358,3 +442,117 @@ class MywNetworkController(MywController):
 
         # Case: Other
         raise MywInternalError("Bad result type:", result_type)
+
+    def stream_result_from(self, nodes, feature_types=None, application=None):
+        """
+        Response streaming trace nodes NODES as newline-delimited JSON
+
+        NODES is an iterator yielding MywTraceNodes in distance order, each
+        referencing its parent (see MywNetworkEngine.traceOutNodes()). The
+        trace is performed as the response is sent. Emits lines:
+          {"metadata": ..., "metadata_unit_scales": ...}
+          {"id": ..., "parent": ..., "feature": ..., "dist": ..., "feature_def": ...}
+          ...
+          {"complete": true, "count": ...}   or  {"error": ...}
+
+        Node lines are as per MywTraceNode.definition(). The feature_def is
+        included only for the first node of each feature. Optional FEATURE_TYPES
+        restricts result to those types only"""
+
+        feature_aspects = self.feature_aspects()
+        feature_types = self.result_feature_types(feature_types, application)
+
+        def included(node):
+            return node.feature.feature_type in feature_types
+
+        def lines():
+            n_nodes = 0
+            feature_urns = set()
+            geo_json_cache = {}
+            header_sent = False
+
+            try:
+                for node in nodes:
+
+                    # Add header
+                    if not header_sent:
+                        header = OrderedDict()
+                        header["metadata"] = node.metadata
+                        header["metadata_unit_scales"] = node.metadata_unit_scales
+                        yield self._json_line(header)
+                        header_sent = True
+
+                    if not included(node):
+                        continue
+
+                    # Find nearest included ancestor
+                    parent = node.parent
+                    while parent and not included(parent):
+                        parent = parent.parent
+
+                    n_nodes += 1
+                    node.result_id = n_nodes
+
+                    # Build node props
+                    props = OrderedDict([("id", n_nodes)])
+                    props.update(node.definition(parent.result_id if parent else 0))
+
+                    feature_urn = props["feature"]
+                    if not feature_urn in feature_urns:
+                        feature_urns.add(feature_urn)
+                        props["feature_def"] = node.feature.asGeojsonFeature(
+                            cache=geo_json_cache, **feature_aspects
+                        )
+
+                    yield self._json_line(props)
+
+                yield self._json_line(OrderedDict([("complete", True), ("count", n_nodes)]))
+
+            except MywError as cond:
+                yield self._json_line({"error": str(cond)})
+
+            finally:
+                Session.remove()  # Response is sent after request completes
+
+        response = self.request.response
+        response.content_type = "application/x-ndjson"
+        response.app_iter = lines()
+
+        return response
+
+    def _json_line(self, props):
+        """
+        PROPS as a line of newline-delimited JSON (bytes)
+        """
+
+        return (json.dumps(props, default=str) + "\n").encode("utf-8")
+
+    def feature_aspects(self):
+        """
+        Options for building feature properties in trace results
+        """
+
+        lang = self.get_param(self.request, "lang", type=str, default=None)
+
+        return {
+            "include_display_values": True,  # TODO: Pass these in
+            "include_lobs": False,
+            "include_geo_geometry": True,
+            "lang": lang,
+        }
+
+    def result_feature_types(self, feature_types=None, application=None):
+        """
+        Feature types to include in a trace result (a set)
+
+        FEATURE_TYPES restricts result to those types. Inaccessible types are excluded"""
+
+        # Prevent return of inaccessible feature types
+        accessible_feature_types = self.current_user.featureTypes(
+            "myworld", application_name=application
+        )
+
+        if feature_types:
+            return set(feature_types).intersection(accessible_feature_types)
+
+        return set(accessible_feature_types)
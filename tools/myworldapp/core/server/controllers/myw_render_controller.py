@@ -8,7 +8,8 @@
 # General imports
 import json, urllib.request, urllib.error, urllib.parse
 from pyramid.view import view_config
-from pyramid.httpexceptions import HTTPNotImplemented, HTTPBadRequest
+from pyramid.httpexceptions import HTTPNotImplemented, HTTPBadRequest, HTTPNotModified
+from pyramid.renderers import render
 import sqlalchemy.exc
 from geojson import FeatureCollection
 
@@ -20,6 +21,8 @@ import myworldapp.core.server.controllers.base.myw_globals as myw_globals
 from myworldapp.core.server.controllers.base.myw_controller import MywController
 from myworldapp.core.server.controllers.base.myw_feature_collection import MywFeatureCollection
 from myworldapp.core.server.controllers.base.myw_utils import filterFor
+from myworldapp.core.server.controllers.base.myw_render_tile_cache import MywRenderTileCache
+from myworldapp.core.server.controllers.base.myw_mvt_seed_store import MywMVTSeedStore
 from myworldapp.core.server.base.tilestore.globalmaptiles import GlobalMercator
 from myworldapp.core.server.base.db.myw_postgis_mvt_query import (
     MywPostGISMVTQuery,
@@ -51,6 +54,7 @@ class MywRenderController(MywController):
 
         # Unpick layer name (which is encoded in JS using encodeURIComponent())
         layer_name = urllib.parse.unquote(layer_name)
+        self.layer_name = layer_name
 
         # Make sure that we have a valid request
         self.current_user.assertAuthorized(self.request, layer_names=[layer_name])
@@ -61,6 +65,7 @@ class MywRenderController(MywController):
         self.lang = self.get_param(self.request, "lang")
         self.world = self.get_param(self.request, "world_name", default="geo")
         feature_types = self.get_param(self.request, "feature_types")
+        self.feature_types = feature_types
         self.required_fields = self.get_param(
             self.request, "requiredFields", type="json", default={}
         )
@@ -76,13 +81,15 @@ class MywRenderController(MywController):
             else unfiltered_layer_details
         )
 
-        svars = self.get_param(self.request, "svars", type="json", default={})
-        delta = self.get_param(self.request, "delta")
-        schema = self.get_param(self.request, "schema", default="data")
-        self.db_view = self.db.view(delta, schema)
+        self.svars = self.get_param(self.request, "svars", type="json", default={})
+        self.delta = self.get_param(self.request, "delta")
+        self.schema = self.get_param(self.request, "schema", default="data")
+        self.db_view = self.db.view(self.delta, self.schema)
 
-        application = self.get_param(self.request, "application")
-        self.session_vars = self.current_user.sessionVars(application=application, **svars)
+        self.application = self.get_param(self.request, "application")
+        self.session_vars = self.current_user.sessionVars(
+            application=self.application, **self.svars
+        )
 
     @view_config(route_name="myw_render_controller.get", request_method="GET", renderer="json")
     def get(self):
@@ -202,7 +209,7 @@ class MywRenderController(MywController):
         box_geom = MywPolygon.newBox(minLon, minLat, maxLon, maxLat)
         box_wkb = box_geom.asWKBElement(4326)
 
-        all_features = []
+        features_to_query = {}
         zoomRange = self.featureTypeDetails.zoomRange(view_zoom)
         # For each feature type ...
         for feature_type, details in self.featureTypeDetails.items():
@@ -210,11 +217,20 @@ class MywRenderController(MywController):
             if not featureRequiredAtZoom(details, zoomRange):
                 continue
 
-            features = self.getRenderFeatures(feature_type, details, box_wkb)
-            all_features.extend(features)
+            features_to_query[feature_type] = details
+
+        def build_tile():
+            all_features = []
+            for feature_type, details in features_to_query.items():
+                features = self.getRenderFeatures(feature_type, details, box_wkb)
+                all_features.extend(features)
 
-        feature_col = FeatureCollection(all_features)
-        return feature_col
+            feature_col = FeatureCollection(all_features)
+            return render("json", feature_col, request=self.request).encode("utf-8")
+
+        return self._tileResponse(
+            "json", (x, y, zoom), features_to_query, "application/json", build_tile
+        )
 
     def getRenderFeatures(
         self,
@@ -287,17 +303,14 @@ class MywRenderController(MywController):
 
             features_to_query[feature_type] = details
 
-        mvt_bytes = self.getMVT(
-            features_to_query,
+        return self._tileResponse(
+            "mvt",
             (x, y, zoom),
+            features_to_query,
+            "application/octet-stream",
+            lambda: self._layerMVT(features_to_query, (x, y, zoom)),
         )
 
-        self.request.response.content_type = "application/octet-stream"
-        self.request.response.content_length = len(mvt_bytes)
-        self.request.response.body = mvt_bytes
-
-        return self.request.response
-
     @view_config(route_name="myw_render_controller.mvt_tile_by_params", request_method="POST")
     def mvt_tile_by_params(self):
         """Fully-parameterised MVT request
@@ -313,9 +326,11 @@ class MywRenderController(MywController):
             "required_fields": [...],
             "svars": {},
             "delta": "",
+            "mvt_layers": "feature_type" | {<feature_type>: <mvt_layer_name>, ...}
         }
         Supports:
         * multiple layers in one tile,
+        * one MVT layer per feature type, or per group of feature types (see mvt_layers),
         * arbitrarily large session vars or required fields.
         Could be ENHanced to support:
         * arbitrary bounding boxes (not aligned to web mercator XY/Z, requires changes in
@@ -400,6 +415,7 @@ class MywRenderController(MywController):
         mvt_bytes = self.getMVT(
             features_to_query,
             tile[:2] + [zoom],
+            mvt_layers=props.get("mvt_layers"),
         )
 
         self.request.response.content_type = "application/octet-stream"
@@ -408,16 +424,191 @@ class MywRenderController(MywController):
 
         return self.request.response
 
-    def getMVT(self, feature_types_details, tile_coords):
+    def _tileResponse(self, kind, tile_coords, features_to_query, content_type, build_proc):
+        """
+        Response for tile TILE_COORDS (x,y,z), taken from the tile cache if possible
+
+        BUILD_PROC is called to build the tile body if no valid cached tile
+        exists. Sets an ETag on the response and returns 304 if the
+        client already has the current version of the tile"""
+
+        response = self.request.response
+        response.content_type = content_type
+        response.cache_control = "private, no-cache"
+
+        cache = MywRenderTileCache.instanceFor(self.request.registry.settings)
+
+        # Case: Caching disabled or not possible
+        if cache is None or self.schema == "delta":
+            body = build_proc()
+            response.content_length = len(body)
+            response.body = body
+            return response
+
+        # Bring change history up to date (so that stale tiles get discarded)
+        built_position = cache.refresh(self.db)
+
+        # Case: Changes to data are not logged (or history not available yet)
+        if built_position is None or not cache.canCache(features_to_query.keys()):
+            body = build_proc()
+            response.content_length = len(body)
+            response.body = body
+            return response
+
+        # Case: Cached
+        key = self._tileCacheKey(kind, tile_coords, features_to_query)
+        tile = cache.get(key)
+
+        # Case: Must build it
+        if tile is None:
+            body = build_proc()
+
+            (x, y, zoom) = tile_coords
+            tile = cache.put(
+                key,
+                body,
+                built_position,
+                self.world,
+                self.delta or "",
+                list(features_to_query.keys()),
+                tile_bounds_wgs84(x, y, zoom, self.tile_size),
+            )
+
+        # Case: Client already has it
+        if tile.etag in self.request.if_none_match:
+            not_modified = HTTPNotModified()
+            not_modified.etag = tile.etag
+            not_modified.cache_control = "private, no-cache"
+            return not_modified
+
+        response.etag = tile.etag
+        response.content_length = len(tile.body)
+        response.body = tile.body
+
+        return response
+
+    def _tileCacheKey(self, kind, tile_coords, features_to_query):
+        """
+        Key identifying the tile TILE_COORDS of type KIND for the current request
+        """
+
+        # Include user identity only if result depends on it (authorisation already checked)
+        user_ident = None
+        if any(details.get("filter") for details in features_to_query.values()):
+            user_ident = [self.current_user.name(), sorted(self.current_user.roleNames())]
+
+        return MywRenderTileCache.keyFor(
+            kind,
+            self.layer_name,
+            list(tile_coords),
+            self.tile_size,
+            self.world,
+            self.delta or "",
+            self.schema,
+            self.lang,
+            self.required_fields,
+            features_to_query,
+            self.svars,
+            self.application,
+            user_ident,
+        )
+
+    def _layerMVT(self, features_to_query, tile_coords):
+        """
+        Body for MVT tile TILE_COORDS (x,y,z) of self's layer
+
+        Taken from the layer's seed file if it holds a current version of the tile"""
+
+        body = self._seededMVT(features_to_query, tile_coords)
+
+        if body is None:
+            body = self.getMVT(features_to_query, tile_coords)
+
+        return body
+
+    def _seededMVT(self, features_to_query, tile_coords):
+        """
+        Pre-rendered MVT tile TILE_COORDS (x,y,z) for the current request (if there is a current one)
+
+        Returns None if the tile cannot be served from a seed file (see MywMVTSeedStore)"""
+
+        store = MywMVTSeedStore.instanceFor(self.request.registry.settings)
+        if store is None:
+            return None
+
+        # Seed files hold geo world master data for the layer's full set of features only
+        if self.delta or self.schema != "data" or self.world != "geo":
+            return None
+
+        if self.feature_types or self.required_fields:
+            return None
+
+        if any(details.get("filter") for details in features_to_query.values()):
+            return None
+
+        # Get tile
+        (x, y, zoom) = tile_coords
+        seeded = store.tileFor(self.layer_name, zoom, x, y)
+        if seeded is None:
+            return None
+
+        (body, seed_props) = seeded
+
+        # Check it was rendered as we would render it
+        options = self.request.registry.settings.get("myw.render.options", {})
+
+        if seed_props["tile_size"] != self.tile_size:
+            return None
+
+        if seed_props["options"] != MywMVTSeedStore.renderOptionsFrom(options):
+            return None
+
+        # Check for data changed since it was rendered
+        cache = MywRenderTileCache.instanceFor(self.request.registry.settings)
+
+        if cache is None:
+            if self.db.transactionLogPosition() != seed_props["log_id"]:
+                return None
+
+        elif not cache.canCache(features_to_query.keys()):
+            return None
+
+        elif cache.changedSince(
+            (seed_props["log_id"], None),
+            self.world,
+            "",
+            list(features_to_query.keys()),
+            tile_bounds_wgs84(x, y, zoom, self.tile_size),
+        ):
+            return None
+
+        return body
+
+    def getMVT(self, feature_types_details, tile_coords, mvt_layers=None):
+        """
+        Build MVT tile TILE_COORDS (x,y,z) from the features in FEATURE_TYPES_DETAILS
+
+        Optional MVT_LAYERS determines how features are split into MVT layers (see
+        MywPostGISMVTQuery). Defaults to option mvt_layers of myw.render.options"""
         # ENH: also build a Spatialite MVT query, if needed.
+        options = self.request.registry.settings.get("myw.render.options", {})
+
         try:
             query = MywPostGISMVTQuery(
-                self.db.db_driver, self.current_user, self.session_vars, tile_coords, self.world
+                self.db.db_driver,
+                self.current_user,
+                self.session_vars,
+                tile_coords,
+                self.world,
+                generalise=options.get("mvt_generalise", True),
+                sub_pixel=options.get("mvt_sub_pixel", "keep"),
+                layers=mvt_layers or options.get("mvt_layers"),
+                prepared=options.get("mvt_prepared", True),
             )
-        except ValueError:
+        except ValueError as cond:
             self.progress(
                 "error",
-                f"Invalid parameter in tile coords {tile_coords}",
+                f"Invalid parameter in tile request {tile_coords}: {cond}",
             )
             raise HTTPBadRequest()
 
@@ -430,11 +621,7 @@ class MywRenderController(MywController):
             )
 
         try:
-            sql = query.generate_sql()
-            result_proxy = self.db.executeSQL(sql)
-            # This query should give us one big tile.
-            memory = result_proxy.fetchall()[0][0]
-            return memory.tobytes()
+            return query.execute()
         except MywNoFeaturesError:
             return b""
         except sqlalchemy.exc.ProgrammingError as e:
@@ -547,3 +734,17 @@ def tile_coords_wgs84(x, y, z, tile_size=256):
     y = pow(2, z) - 1 - y
     (minLat, minLon, maxLat, maxLon) = gm.TileLatLonBounds(x, y, z)  # Returns lat1,lon1,lat2,lon2
     return [minLon, minLat, maxLon, maxLat]
+
+
+def tile_bounds_wgs84(x, y, z, tile_size=256, buffer=0.25):
+    """
+    Bounding box in long/lat coordinates of the data that can affect a tile
+
+    Expands the tile extent by fraction BUFFER on each side (to allow for
+    symbols and labels that overlap the tile boundary)"""
+
+    (minLon, minLat, maxLon, maxLat) = tile_coords_wgs84(x, y, z, tile_size)
+    dx = (maxLon - minLon) * buffer
+    dy = (maxLat - minLat) * buffer
+
+    return [minLon - dx, minLat - dy, maxLon + dx, maxLat + dy]
@@ -5,11 +5,13 @@
 
 # General imports
 import os
+import struct
 import pyramid.httpexceptions as exc
 
 from pyramid.view import view_config
 from pyramid.response import Response, FileResponse
 
+from myworldapp.core.server.base.core.myw_error import MywError
 from myworldapp.core.server.base.db.globals import Session
 from myworldapp.core.server.database.myw_database import MywDatabase
 
@@ -30,6 +32,13 @@ class MywTileController(MywController):
     Controller for tile access requests
     """
 
+    # Maximum number of tiles that can be requested in one bundle
+    max_bundle_tiles = 4096
+
+    # Identifier at start of a tile bundle (see .get_tiles())
+    bundle_magic = b"MWTB"
+    bundle_version = 1
+
     @view_config(route_name="myw_tile_controller.get_tile", request_method="GET")
     def get_tile(self):
         """
@@ -80,6 +89,86 @@ class MywTileController(MywController):
 
         return response
 
+    @view_config(route_name="myw_tile_controller.get_tiles", request_method="GET")
+    def get_tiles(self):
+        """
+        Bundle of tiles within a range at a single zoom level
+
+        Range is specified by request params x_min, y_min, x_max, y_max
+        (Google-format tile IDs) or bbox (min_lon,min_lat,max_lon,max_lat).
+
+        Response is a length-prefixed binary bundle (all integers big-endian):
+          header   "MWTB" <version:uint8> <n_tiles:uint32>
+          tile     <zoom:uint8> <x:uint32> <y:uint32> <length:uint32> <data>
+
+        Missing tiles are omitted. Content format of each tile is as for
+        .get_tile(), and is returned in header X-Tile-Format"""
+
+        universe = self.request.matchdict["universe"]
+        layer_or_world = self.request.matchdict["layer_or_world"]
+        zoom = int(self.request.matchdict["zoom"])
+        format = self.request.matchdict["format"]
+
+        # Check user is authorised to access the data
+        if universe == "geo":
+            self.current_user.assertAuthorized(
+                self.request, tile_layer=layer_or_world, ignore_csrf=True
+            )
+        else:
+            self.current_user.assertAuthorized(self.request, tile_layer=universe, ignore_csrf=True)
+
+        # Unpick range
+        bbox = self.get_param(self.request, "bbox", type=float, list=True)
+
+        if bbox:
+            if len(bbox) != 4:
+                raise exc.HTTPBadRequest()
+            bounds = ((bbox[0], bbox[1]), (bbox[2], bbox[3]))
+            tile_id_range = None
+
+        else:
+            x_min = self.get_param(self.request, "x_min", type=int, mandatory=True)
+            y_min = self.get_param(self.request, "y_min", type=int, mandatory=True)
+            x_max = self.get_param(self.request, "x_max", type=int, mandatory=True)
+            y_max = self.get_param(self.request, "y_max", type=int, mandatory=True)
+            bounds = None
+            tile_id_range = ((x_min, y_min), (x_max, y_max))
+
+            if x_max < x_min or y_max < y_min:
+                raise exc.HTTPBadRequest()
+
+        # Get tile data from tilestore
+        full_world = universe + "/" + layer_or_world
+
+        try:
+            tiles = TILESTORE.get_tiles(
+                full_world,
+                zoom,
+                tile_id_range=tile_id_range,
+                bounds=bounds,
+                max_tiles=self.max_bundle_tiles,
+            )
+        except MywError as cond:
+            print("Malformed request:", self.request.url, ":", cond)
+            raise exc.HTTPBadRequest()
+
+        # Build bundle
+        parts = [self.bundle_magic, struct.pack(">BI", self.bundle_version, len(tiles))]
+
+        for x, y, data in tiles:
+            parts.append(struct.pack(">BIII", zoom, x, y, len(data)))
+            parts.append(data)
+
+        body = b"".join(parts)
+
+        response = Response()
+        response.body = body
+        response.content_length = len(body)
+        response.content_type = "application/octet-stream"
+        response.headers["X-Tile-Format"] = format
+
+        return response
+
     def _get_tile(self, universe, layer_or_world, zoom, x, y):
         """
         Entry point from tests
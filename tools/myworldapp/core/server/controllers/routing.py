@@ -25,6 +25,11 @@ def add_routes(config):
         "myw_tile_controller",
         "get_tile",
     )
+    config.add_route(
+        "/tiles/{universe}/{layer_or_world}/{zoom}.{format}",
+        "myw_tile_controller",
+        "get_tiles",
+    )
 
     # Feature data access (from client, view limited by current user's roles)
     config.add_route("/select", "myw_select_controller", "select_near")
@@ -49,6 +54,9 @@ def add_routes(config):
     # Network operations
     config.add_route("/network/{network}/trace_out", "myw_network_controller", "trace_out")
     config.add_route("/network/{network}/shortest_path", "myw_network_controller", "shortest_path")
+    config.add_route(
+        "/network/{network}/shortest_paths", "myw_network_controller", "shortest_paths"
+    )
 
     # Data download
     config.add_route("/export_csv", "myw_export_csv_controller", "generate")
@@ -11,15 +11,19 @@ import traceback
 import json
 import ast
 import codecs
+import copy
 from datetime import datetime
 from collections import OrderedDict
+from itertools import islice
 from decimal import Decimal
+from sqlalchemy import bindparam, inspect
 from sqlalchemy import types as sqa_types
 from sqlalchemy.exc import DataError
 
 from myworldapp.core.server.base.core.myw_error import MywDataLoadError, MywError
 from myworldapp.core.server.base.core.myw_progress import MywProgressHandler
 from myworldapp.core.server.base.core.utils import interpret_data_error
+from myworldapp.core.server.base.geom.myw_geometry import MywGeometry
 
 from myworldapp.core.server.io.myw_feature_istream import MywFeatureIStream
 from myworldapp.core.server.io.myw_feature_ostream import MywFeatureOStream
@@ -63,6 +67,9 @@ class MywDataLoader:
     feature definitions, enum definitons etc.
     """
 
+    # Number of features whose geometries are transformed together (when no batch size given)
+    transform_chunk_size = 10000
+
     def __init__(self, db, progress=MywProgressHandler()):
         """
         Init slots of self
@@ -74,6 +81,8 @@ class MywDataLoader:
         self.progress = progress
         self.dd = MywDD(self.db.session, progress=progress)
 
+        self._feature_def_cache = {}  # Parsed .def files, keyed by (path, encoding)
+
     # ==============================================================================
     #                                    FILE LOADING
     # ==============================================================================
@@ -349,14 +358,18 @@ class MywDataLoader:
         localiser=None,
         date_format=None,
         timestamp_format=None,
+        skip_unchanged=False,
     ):
         """
         Create myWorld feature types from the definition(s) in file FILEPATH
 
         File contains a JSON feature type definition (or list of
-        such definitions). See doc for definition of format"""
+        such definitions). See doc for definition of format
+
+        If SKIP_UNCHANGED is True, existing feature types whose definition
+        would not be changed by the update are left untouched"""
 
-        feature_defs = self.loadJsonFile(filepath, file_encoding, localiser, True)
+        feature_defs = self.featureTypeDefsFrom(filepath, file_encoding, localiser)
 
         for feature_def in feature_defs:
             if rename:
@@ -383,11 +396,47 @@ class MywDataLoader:
             # Create or mutate it
             if not feature_rec:
                 feature_rec = self.createFeatureType(feature_def)
+            elif skip_unchanged and not self.featureTypeChangedBy(feature_rec, feature_def):
+                self.progress(2, "Feature type unchanged:", feature_rec)
             else:
                 self.alterFeatureType(feature_rec, feature_def, date_format, timestamp_format)
 
         return len(feature_defs)
 
+    def featureTypeDefsFrom(self, filepath, file_encoding=None, localiser=None):
+        """
+        The feature type definitions in .def file FILEPATH (a list of dicts)
+
+        Parsed files are cached for the life of self (invalidated if the
+        file is modified). Returns copies, so callers may mutate them"""
+
+        # Localised definitions depend on the localiser, so are not cached
+        if localiser:
+            return self.loadJsonFile(filepath, file_encoding, localiser, True)
+
+        stat = os.stat(filepath)
+        cache_key = (os.path.abspath(filepath), file_encoding)
+        file_sig = (stat.st_mtime_ns, stat.st_size)
+
+        cached = self._feature_def_cache.get(cache_key)
+        if not cached or cached[0] != file_sig:
+            feature_defs = self.loadJsonFile(filepath, file_encoding, None, True)
+            cached = self._feature_def_cache[cache_key] = (file_sig, feature_defs)
+
+        return copy.deepcopy(cached[1])
+
+    def featureTypeChangedBy(self, feature_rec, props):
+        """
+        True if applying .def format dict PROPS would change the definition of FEATURE_REC
+        """
+
+        current_desc = self.dd.featureTypeDescriptor(feature_rec)
+
+        new_desc = current_desc.deepcopy()
+        new_desc.update(props, add_defaults=True)
+
+        return new_desc.definition() != current_desc.definition()
+
     def createFeatureType(self, feature_def):
         """
         Create myWorld feature type from dict FEATURE_DEF
@@ -552,6 +601,8 @@ class MywDataLoader:
         update_sequence=False,
         direct=False,
         delta="",
+        batch_size=None,
+        defer_indexes=False,
     ):
         """
         Loads features from file FILEPATH
@@ -562,6 +613,15 @@ class MywDataLoader:
         doesn't already exist. If optional RELOAD is true, and the
         feature type already exists, truncate before loading
 
+        If optional BATCH_SIZE is given, features are loaded using
+        set-based inserts and updates of that many records at a time
+        (see loadFeaturesFrom())
+
+        If optional DEFER_INDEXES is true and the target table is empty
+        (e.g. after RELOAD), feature triggers are suspended during the load
+        and the geometry index, search string and transaction log records
+        are then rebuilt using set-based SQL (see _rebuildDerivedDataFor())
+
         Returns vector:
           [0] number of records inserted
           [1] number of records updated
@@ -588,11 +648,6 @@ class MywDataLoader:
         if not feature_rec:
             raise MywDataLoadError("No such feature type: ", feature_type)
 
-        # Check for can't handle
-        # ENH: Return file_max_id from direct load and remove this
-        if direct and update_sequence:
-            raise MywError("Direct load does not support sequence update")
-
         # Get feature table
         table = self.db.view(delta).table(feature_type, versioned_only=True)
 
@@ -602,25 +657,47 @@ class MywDataLoader:
             self.progress(1, "Truncating", feature_type)
             table.truncate()
 
+        # Check for loading into empty table (when triggers can be suspended)
+        db_driver = self.db.db_driver
+        defer_indexes = (
+            defer_indexes
+            and not delta
+            and bool(db_driver.disableTriggersSql(feature_type))
+            and self.dd.featureTableIsEmpty(feature_type)
+        )
+
+        if defer_indexes:
+            self.progress(1, "Suspending triggers for", feature_type)
+            db_driver.disableTriggersFor(feature_type)
+
         # Load data
-        # ENH: If loading into empty table, disable triggers and build index records later (for speed)
-        if direct and not delta:
-            # ENH: Warn about bad format, non-WGS84 coord system, ..
-            table_desc = table.descriptor.tableDescriptor()
-            res = self.db.db_driver.loadFeaturesFrom(
-                table_desc, filepath, file_encoding, date_format, timestamp_format
-            )
-        else:
-            res = self.loadFeaturesFrom(
-                table,
-                filepath,
-                file_encoding,
-                date_format,
-                timestamp_format,
-                coord_sys,
-                geom_heuristics=geom_heuristics,
-                skip_bad_records=skip_bad_records,
-            )
+        try:
+            if direct and not delta:
+                # ENH: Warn about bad format, non-WGS84 coord system, ..
+                table_desc = table.descriptor.tableDescriptor()
+                res = db_driver.loadFeaturesFrom(
+                    table_desc, filepath, file_encoding, date_format, timestamp_format
+                )
+            else:
+                res = self.loadFeaturesFrom(
+                    table,
+                    filepath,
+                    file_encoding,
+                    date_format,
+                    timestamp_format,
+                    coord_sys,
+                    geom_heuristics=geom_heuristics,
+                    skip_bad_records=skip_bad_records,
+                    batch_size=batch_size,
+                )
+
+        finally:
+            if defer_indexes:
+                db_driver.enableTriggersFor(feature_type)
+
+        # Build the records the triggers would have created
+        if defer_indexes:
+            self._rebuildDerivedDataFor(feature_rec)
 
         # Update ID generator sequence (if requested)
         if update_sequence:
@@ -628,6 +705,33 @@ class MywDataLoader:
 
         return res[0:3]
 
+    def _rebuildDerivedDataFor(self, feature_rec):
+        """
+        Build geometry index, search string and transaction log records for
+        all records of FEATURE_REC (after a load with triggers suspended)
+        """
+
+        db_driver = self.db.db_driver
+
+        with self.progress.operation("Building index records for:", feature_rec.feature_name):
+
+            with self.progress.operation("Building geometry indexes") as op:
+                op["recs"] = db_driver.rebuildGeomIndexesFor("data", feature_rec)
+
+            if feature_rec.mvt_generalised:
+                with self.progress.operation("Building generalised tile geometry") as op:
+                    op["recs"] = db_driver.rebuildMvtGeomsFor(feature_rec)
+
+            with self.progress.operation("Building search strings") as op:
+                op["recs"] = 0
+                for search_rule_rec in feature_rec.search_rule_recs:
+                    op["recs"] += db_driver.rebuildSearchStringsFor(
+                        "data", feature_rec, search_rule_rec
+                    )
+
+            with self.progress.operation("Logging inserts") as op:
+                op["recs"] = db_driver.logFeatureInsertsFor("data", feature_rec)
+
     def createFeatureTypeFrom(
         self,
         feature_type,
@@ -680,12 +784,17 @@ class MywDataLoader:
         key_field=None,
         geom_heuristics=False,
         skip_bad_records=True,
+        batch_size=None,
     ):
         """
         Loads features from file FILEPATH
 
         TABLE is a MywFeatureTable
 
+        If BATCH_SIZE is given and TABLE is not versioned, features are
+        read BATCH_SIZE at a time and written with one key lookup, one
+        bulk insert and one bulk update per batch (see _loadFeatureBatch())
+
         Returns vector:
           [0] number of records inserted
           [1] number of records updated
@@ -730,9 +839,16 @@ class MywDataLoader:
                 coord_sys = strm.coordSystem()  # pylint: disable=assignment-from-none
 
             # If we will apply a transform .. inform user
+            features = strm
             if coord_sys and (coord_sys != db_coord_sys):
                 self.progress(1, "Transforming data from coordinate system:", coord_sys)
 
+                # Transform geometries a chunk at a time (much faster than per record)
+                features = self._transformedFeatures(
+                    table, strm, coord_sys, batch_size or self.transform_chunk_size
+                )
+                coord_sys = None
+
             # Check for any fields that aren't in the feature model
             if hasattr(strm, "findUnmodelledFields"):
                 unmodelled_fields = strm.findUnmodelledFields(table)
@@ -744,21 +860,31 @@ class MywDataLoader:
                         ", ".join(unmodelled_fields),
                     )
 
-            # For each feature in file ...
-            for feature in strm:
-                self.progress(8, "Processing input feature:", feature)
-
-                # Create or update record (handling errors)
-                (change_type, key_val) = self._loadFeature(
+            # Create or update records (handling errors)
+            if batch_size and not table.versioned:
+                results = self._loadFeatureBatches(
                     table,
                     key_field_name,
-                    feature,
+                    features,
+                    batch_size,
+                    date_format,
+                    timestamp_format,
+                    coord_sys,
+                    skip_bad_records,
+                )
+            else:
+                results = self._loadFeatureEach(
+                    table,
+                    key_field_name,
+                    features,
                     date_format,
                     timestamp_format,
                     coord_sys,
                     skip_bad_records,
                 )
 
+            for (change_type, key_val) in results:
+
                 # Update stats
                 stats[change_type] += 1
 
@@ -768,6 +894,242 @@ class MywDataLoader:
 
         return stats["insert"], stats["update"], stats["skip"], max_key_val
 
+    def _transformedFeatures(self, table, strm, coord_sys, chunk_size):
+        """
+        Generator yielding the features in STRM with geometries transformed to TABLE's coordinate system
+
+        Geometries are read CHUNK_SIZE features at a time and transformed in a single
+        batch per field (see MywGeometry.geoTransformAll()). Values that cannot be
+        decoded are left unchanged (so they get reported when the record is built)"""
+
+        geom_field_names = [
+            name for name, desc in table.descriptor.storedFields().items() if desc.isGeometry()
+        ]
+
+        features = iter(strm)
+
+        while True:
+            chunk = list(islice(features, chunk_size))
+            if not chunk:
+                break
+
+            for field_name in geom_field_names:
+                self._transformGeomsIn(chunk, field_name, coord_sys, table.coord_sys)
+
+            for feature in chunk:
+                yield feature
+
+    def _transformGeomsIn(self, features, field_name, from_coord_sys, to_coord_sys):
+        """
+        Replace values of FIELD_NAME in dicts FEATURES by MywGeometries in TO_COORD_SYS
+        """
+
+        # Decode values
+        ftrs = []
+        geoms = []
+        for feature in features:
+            value = feature.get(field_name)
+            if not value or value.__class__.__name__ == "Default":
+                continue
+
+            try:
+                geoms.append(MywGeometry.decode(value))
+                ftrs.append(feature)
+            except ValueError:
+                pass
+
+        # Transform them
+        geoms = MywGeometry.geoTransformAll(geoms, from_coord_sys, to_coord_sys)
+
+        for feature, geom in zip(ftrs, geoms):
+            feature[field_name] = geom
+
+    def _loadFeatureEach(
+        self,
+        table,
+        key_field_name,
+        strm,
+        date_format,
+        timestamp_format,
+        coord_sys,
+        skip_bad_records,
+    ):
+        """
+        Create or update a record for each feature in STRM, one at a time
+
+        Yields a (CHANGE_TYPE,KEY_VAL) tuple for each feature"""
+
+        for feature in strm:
+            self.progress(8, "Processing input feature:", feature)
+
+            yield self._loadFeature(
+                table,
+                key_field_name,
+                feature,
+                date_format,
+                timestamp_format,
+                coord_sys,
+                skip_bad_records,
+            )
+
+    def _loadFeatureBatches(
+        self,
+        table,
+        key_field_name,
+        strm,
+        batch_size,
+        date_format,
+        timestamp_format,
+        coord_sys,
+        skip_bad_records,
+    ):
+        """
+        Create or update records for the features in STRM, BATCH_SIZE at a time
+
+        Yields a (CHANGE_TYPE,KEY_VAL) tuple for each feature"""
+
+        features = iter(strm)
+
+        while True:
+            batch = list(islice(features, batch_size))
+            if not batch:
+                break
+
+            self.progress(6, "Processing batch of", len(batch), "input features")
+
+            for result in self._loadFeatureBatch(
+                table,
+                key_field_name,
+                batch,
+                date_format,
+                timestamp_format,
+                coord_sys,
+                skip_bad_records,
+            ):
+                yield result
+
+    def _loadFeatureBatch(
+        self,
+        table,
+        key_field_name,
+        features,
+        date_format,
+        timestamp_format,
+        coord_sys,
+        skip_bad_records,
+    ):
+        """
+        Create or update records from dicts FEATURES using set-based SQL
+
+        Existing keys are found with a single IN query. New records are
+        written with one multi-row insert and existing ones with one
+        multi-row update (per distinct set of columns). Records whose
+        values cannot be converted are skipped or raise as for _loadFeature()
+
+        TABLE must be an unversioned MywFeatureTable
+
+        Returns a list of (CHANGE_TYPE,KEY_VAL) tuples, in FEATURES order"""
+
+        model = table.model
+        columns = model.__table__.columns
+        key_column = model._key_column()
+        db_driver = self.db.session.myw_db_driver
+
+        # Build detached records (converting values)
+        results = []
+        recs = []
+        for feature in features:
+            self.progress(8, "Processing input feature:", feature)
+
+            key_val = feature.get(key_field_name)
+
+            # Prevent problems with null value in key
+            if (not key_val) and (key_field_name in feature):
+                del feature[key_field_name]
+
+            try:
+                rec = table._new_detached()
+                rec.updateFrom(
+                    feature,
+                    date_format=date_format,
+                    timestamp_format=timestamp_format,
+                    coord_sys=coord_sys,
+                )
+
+            except (ValueError, UnicodeWarning) as cond:
+                ftr_ident = "{}({})".format(table.feature_type, key_val)
+
+                if skip_bad_records and isinstance(cond, ValueError):
+                    self.warning(ftr_ident, ":", cond)
+                    results.append(("skip", None))
+                    continue
+
+                raise MywDataLoadError(ftr_ident, cond)
+
+            results.append(None)
+            recs.append((len(results) - 1, key_val, rec))
+
+        # Find which keys already exist (in one query)
+        keys = set(rec[key_field_name] for (_, _, rec) in recs if rec[key_field_name] is not None)
+        existing_keys = set()
+        if keys:
+            query = self.db.session.query(key_column).filter(key_column.in_(keys))
+            existing_keys = set(row[0] for row in query)
+
+        # Split into inserts and updates (later duplicates in batch update earlier ones)
+        inserts = OrderedDict()
+        updates = OrderedDict()
+        for (pos, key_val, rec) in recs:
+            rec_key = rec[key_field_name]
+
+            if rec_key is None or rec_key not in existing_keys:
+                db_driver.prepareForInsert(table.feature_type, rec)
+                values = self._dbValuesFor(rec, columns)
+                inserts.setdefault(tuple(sorted(values)), []).append(values)
+                results[pos] = ("insert", key_val)
+                if rec_key is not None:
+                    existing_keys.add(rec_key)
+            else:
+                values = self._dbValuesFor(rec, columns)
+                values.pop(key_field_name, None)
+                values = {"_v_" + name: value for name, value in values.items()}
+                values["_v_key"] = rec_key
+                updates.setdefault(tuple(sorted(values)), []).append(values)
+                results[pos] = ("update", key_val)
+
+        # Write them (triggers run as normal)
+        try:
+            for rows in inserts.values():
+                self.db.session.execute(model.__table__.insert(), rows)
+
+            for names, rows in updates.items():
+                set_values = {name[3:]: bindparam(name) for name in names if name != "_v_key"}
+                if not set_values:
+                    continue
+                update = (
+                    model.__table__.update()
+                    .where(key_column == bindparam("_v_key"))
+                    .values(set_values)
+                )
+                self.db.session.execute(update, rows)
+
+        except UnicodeWarning as cond:
+            raise MywDataLoadError(table.feature_type, cond)
+
+        return results
+
+    def _dbValuesFor(self, rec, columns):
+        """
+        The column values that have been set on detached record REC (a dict)
+        """
+
+        values = OrderedDict()
+        for name, value in inspect(rec).dict.items():
+            if name in columns:
+                values[name] = value
+
+        return values
+
     def _loadFeature(
         self,
         table,
@@ -1066,8 +1428,7 @@ class MywDataLoader:
         with self.featureOStreamFor(
             file_name, field_descs, file_encoding=file_encoding, file_options=file_options
         ) as strm:
-            for rec in recs:
-                strm.writeFeature(rec)
+            strm.writeFeatures(recs)
 
     def _featureRecChunks(
         self, feature_type, delta=None, feature_ids=None, pred=None, chunk_size=None
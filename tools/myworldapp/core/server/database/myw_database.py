@@ -642,6 +642,27 @@ class MywDatabase(MywRawDatabase):
 
         return False
 
+    def transactionLogPosition(self, table_name="transaction_log", delta=None):
+        """
+        Id of the latest entry in transaction log TABLE_NAME (0 if there are none)
+
+        If optional DELTA is given, considers only entries for that
+        delta. Provided for tracking changes incrementally: unlike the
+        data version stamp, this advances with every change logged"""
+        # Note: Can't use SQLAlchemy query here as can miss trigger changes
+
+        # Ensure any pending updates are written to DB
+        self.session.flush()
+
+        sql = "SELECT MAX(id) FROM {}".format(
+            self.session.myw_db_driver.dbNameFor("myw", table_name, True)
+        )
+
+        if delta is not None:
+            sql += " WHERE delta = '{}'".format(self.session.myw_db_driver.sqlEscape(delta))
+
+        return self.session.execute(sql).scalar() or 0
+
     def featureChanges(self, feature_type, since_version):
         """
         Changes made to table FEATURE_TYPE since transaction SINCE_VERSION
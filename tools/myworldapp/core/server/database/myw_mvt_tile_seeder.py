@@ -0,0 +1,363 @@
+################################################################################
+# Engine for pre-rendering the vector tiles of a layer
+################################################################################
+# Copyright: IQGeo Limited 2010-2023
+
+from collections import OrderedDict
+
+from myworldapp.core.server.base.core.myw_error import MywError
+from myworldapp.core.server.base.core.myw_progress import MywProgressHandler
+from myworldapp.core.server.base.db.myw_postgis_mvt_query import (
+    MywPostGISMVTQuery,
+    MywNoFeaturesError,
+)
+
+from .myw_transaction_log_cursor import MywTransactionLogCursor
+
+
+class MywMVTTileSeeder:
+    """
+    Engine for pre-rendering the vector tiles of a layer into a MywMVTSeedDB
+
+    Renders the geo world tiles of the layer from master data, using the same
+    query as the render controller. Only tiles that are touched by the
+    extent of some feature (plus a buffer, for symbols and labels) are rendered.
+
+    Also provides facilities for finding the tiles affected by changes to
+    master data since a seed was built (see .dirtyTilesFor())
+
+    Layers with feature filters cannot be seeded (as their tiles depend on the
+    requesting user). Nor can layers including feature types that are not change
+    tracked (as changes to them cannot be found)"""
+
+    # Fraction of a tile by which feature extents are expanded when finding
+    # the tiles they touch (as per the render controller's tile bounds)
+    tile_buffer = 0.25
+
+    # Max number of ids in a single IN clause
+    max_ids_per_query = 1000
+
+    # Max time to wait for in-progress transactions (in seconds)
+    wait_timeout = 300
+
+    def __init__(self, db, layer_name, options={}, progress=MywProgressHandler()):
+        """
+        Init slots of self
+
+        DB is the MywDatabase to render from. OPTIONS are the render options
+        (see MywMVTSeedDB.render_option_defaults)"""
+
+        self.db = db
+        self.layer_name = layer_name
+        self.options = options
+        self.progress = progress
+
+        # Get layer definition
+        layer_rec = db.config_manager.layerRec(layer_name)
+        if layer_rec is None:
+            raise MywError("No such layer:", layer_name)
+
+        self.tile_size = layer_rec.get_spec_property("tileSize") or 512
+        self.max_tile_zoom = layer_rec.get_spec_property("maxTileZoom") or 17
+        self.feature_details = layer_rec.render_feature_details()
+
+        # Check tiles do not depend on user
+        for feature_type, details in self.feature_details.items():
+            if details.get("filter"):
+                raise MywError(
+                    "Layer {}: Cannot seed layer with filters: {}".format(layer_name, feature_type)
+                )
+
+        # Check changes to tiles can be found
+        for feature_type in self.feature_details:
+            feature_rec = db.dd.featureTypeRec("myworld", feature_type)
+            if feature_rec and not feature_rec.track_changes:
+                raise MywError(
+                    "Layer {}: Cannot seed layer with untracked feature type: {}".format(
+                        layer_name, feature_type
+                    )
+                )
+
+        self.tables = {}
+
+    def logId(self):
+        """
+        Id of the latest entry in the master transaction log (once all entries up to it are committed)
+
+        Used to identify the master changes that a seed reflects (the data version
+        is not sufficient, as it is not advanced by feature edits). Waits for
+        in-progress transactions, as these can commit entries with lower ids
+        (see MywTransactionLogCursor.finalPosition())"""
+
+        return MywTransactionLogCursor.finalPosition(self.db, timeout=self.wait_timeout)
+
+    def zoomRange(self):
+        """
+        Default range of tile zoom levels to seed (MIN_ZOOM, MAX_ZOOM)
+
+        Zoom levels are those of the layer's tiles (which may differ from view zoom levels)"""
+
+        zoom_offset = self.tile_size // 256 - 1
+        min_vis = min([details["min_vis"] for details in self.feature_details.values()] or [0])
+
+        return (max(min_vis - zoom_offset, 0), self.max_tile_zoom)
+
+    def featureTypes(self):
+        """
+        Names of the feature types rendered by self's layer that have geometry
+        """
+
+        return [ft for ft, details in self.feature_details.items() if details["field_names"]]
+
+    def featureDetailsAt(self, zoom):
+        """
+        Render details of the feature types visible at tile zoom level ZOOM (a dict)
+        """
+
+        # Same test as render controller
+        view_zoom = zoom + self.tile_size // 256 - 1
+        (min_zoom, max_zoom) = self.feature_details.zoomRange(view_zoom)
+
+        details_at_zoom = OrderedDict()
+        for feature_type, details in self.feature_details.items():
+            if max_zoom < details["min_vis"] or min_zoom > details["max_vis"]:
+                continue
+
+            details_at_zoom[feature_type] = details
+
+        return details_at_zoom
+
+    def tableFor(self, feature_type):
+        """
+        Master table for FEATURE_TYPE (cached)
+        """
+
+        table = self.tables.get(feature_type)
+
+        if table is None:
+            table = self.tables[feature_type] = self.db.view().table(feature_type)
+
+        return table
+
+    # ==============================================================================
+    #                                   RENDERING
+    # ==============================================================================
+
+    def renderTile(self, zoom, x, y):
+        """
+        Build MVT tile (ZOOM,X,Y) (Google-format tile ID)
+
+        Returns the tile data (bytes, empty if tile contains no features)"""
+
+        query = MywPostGISMVTQuery(
+            self.db.db_driver,
+            None,
+            {},
+            (x, y, zoom),
+            "geo",
+            generalise=self.options.get("generalise", True),
+            sub_pixel=self.options.get("sub_pixel", "keep"),
+            layers=self.options.get("layers"),
+            prepared=True,
+        )
+
+        for feature_type, details in self.featureDetailsAt(zoom).items():
+            table = self.tableFor(feature_type)
+            query.add_geometries(
+                (table, geom_field, details["required_fields"], details["filter"])
+                for geom_field in details["field_names"]
+            )
+
+        try:
+            return query.execute()
+        except MywNoFeaturesError:
+            return b""
+
+    def renderTiles(self, tile_ids):
+        """
+        Build the MVT tiles TILE_IDS (a list of (ZOOM,X,Y) tuples)
+
+        Returns a list of (ZOOM,X,Y,DATA) tuples (DATA is None for empty tiles)"""
+
+        tiles = []
+
+        for zoom, x, y in tile_ids:
+            data = self.renderTile(zoom, x, y)
+            tiles.append((zoom, x, y, data or None))
+
+        # Don't hold a transaction open between batches
+        self.db.session.rollback()
+
+        return tiles
+
+    # ==============================================================================
+    #                                  TILE SELECTION
+    # ==============================================================================
+
+    def tilesFor(self, seed_db, zoom, bounds):
+        """
+        IDs of the tiles at ZOOM within BOUNDS touched by features recorded in SEED_DB
+
+        Returns a sorted list of Google-format tile IDs (ZOOM,X,Y)"""
+
+        feature_types = set(self.featureDetailsAt(zoom).keys())
+        tile_ids = set()
+
+        for feature_type, id, ftr_bounds in seed_db.featureExtents():
+            if feature_type in feature_types:
+                tile_ids.update(self.tilesTouchedBy(seed_db, zoom, ftr_bounds, bounds))
+
+        return sorted(tile_ids)
+
+    def dirtyTilesFor(self, seed_db, seed_props, to_log_id):
+        """
+        IDs of the tiles in SEED_DB affected by changes to master data up to transaction log entry TO_LOG_ID
+
+        Reads the transaction log for changes since SEED_PROPS log id. Also updates
+        the feature extents recorded in SEED_DB
+
+        Returns a sorted list of Google-format tile IDs (ZOOM,X,Y)"""
+
+        # Find changed features
+        changed = self.changedFeatures(seed_props["log_id"], to_log_id)
+
+        # Find their old and new extents
+        changed_extents = []  # (FEATURE_TYPE, BOUNDS) tuples
+
+        for feature_type, ids in changed.items():
+            self.progress(3, "Feature type", feature_type, ":", len(ids), "changed features")
+
+            old_extents = seed_db.featureExtentsFor(feature_type, ids)
+            new_extents = self.featureExtentsFor(feature_type, seed_props["bounds"], ids)
+
+            changed_extents += [(feature_type, bounds) for bounds in old_extents.values()]
+            changed_extents += [(feature_type, bounds) for bounds in new_extents.values()]
+
+            seed_db.setFeatureExtents(feature_type, {id: new_extents.get(id) for id in ids})
+
+        # Find the tiles they touch
+        tile_ids = set()
+
+        for zoom in range(seed_props["min_zoom"], seed_props["max_zoom"] + 1):
+            feature_types = set(self.featureDetailsAt(zoom).keys())
+
+            for feature_type, ftr_bounds in changed_extents:
+                if feature_type in feature_types:
+                    tile_ids.update(
+                        self.tilesTouchedBy(seed_db, zoom, ftr_bounds, seed_props["bounds"])
+                    )
+
+        return sorted(tile_ids)
+
+    def tilesTouchedBy(self, seed_db, zoom, ftr_bounds, bounds):
+        """
+        Yields IDs of the tiles at ZOOM within BOUNDS whose rendering may be affected by a feature within FTR_BOUNDS
+
+        Yields Google-format tile IDs (ZOOM,X,Y)"""
+
+        # Expand feature bounds by tile buffer (approximating tile height by width, which is larger)
+        buffer = self.tile_buffer * 360.0 / 2**zoom
+        ftr_bounds = (
+            (ftr_bounds[0][0] - buffer, ftr_bounds[0][1] - buffer),
+            (ftr_bounds[1][0] + buffer, ftr_bounds[1][1] + buffer),
+        )
+
+        ((min_x, min_y), (max_x, max_y)) = seed_db.tileIdRangeFor(zoom, ftr_bounds)
+        ((area_min_x, area_min_y), (area_max_x, area_max_y)) = seed_db.tileIdRangeFor(
+            zoom, bounds
+        )
+
+        for x in range(max(min_x, area_min_x), min(max_x, area_max_x) + 1):
+            for y in range(max(min_y, area_min_y), min(max_y, area_max_y) + 1):
+                yield (zoom, x, y)
+
+    # ==============================================================================
+    #                                  FEATURE EXTENTS
+    # ==============================================================================
+
+    def changedFeatures(self, from_log_id, to_log_id):
+        """
+        Features of self's layer changed in master transaction log entries FROM_LOG_ID+1 .. TO_LOG_ID
+
+        Returns a dict of feature id lists, keyed by feature type"""
+
+        feature_types = self.featureTypes()
+        if not feature_types:
+            return {}
+
+        sql = "SELECT DISTINCT feature_type, feature_id FROM {} WHERE id > {} AND id <= {} AND feature_type IN ({})".format(
+            self.db.db_driver.dbNameFor("myw", "transaction_log", True),
+            int(from_log_id),
+            int(to_log_id),
+            ",".join("'{}'".format(ft) for ft in feature_types),
+        )
+
+        changed = OrderedDict()
+        for rec in self.db.session.execute(sql):
+            changed.setdefault(rec["feature_type"], []).append(str(rec["feature_id"]))
+
+        return changed
+
+    def featureExtentsFor(self, feature_type, bounds, ids=None):
+        """
+        Long/lat extents of the geo world geometries of FEATURE_TYPE that intersect BOUNDS
+
+        Optional IDS restricts the query to the given features
+
+        Returns a dict of bounds ((min_x,min_y),(max_x,max_y)), keyed by feature id"""
+
+        if ids is None:
+            return self._featureExtentsFor(feature_type, bounds)
+
+        extents = {}
+        for i in range(0, len(ids), self.max_ids_per_query):
+            extents.update(
+                self._featureExtentsFor(feature_type, bounds, ids[i : i + self.max_ids_per_query])
+            )
+
+        return extents
+
+    def _featureExtentsFor(self, feature_type, bounds, ids=None):
+        """
+        Long/lat extents of the geo world geometries of FEATURE_TYPE that intersect BOUNDS (in a single query)
+        """
+
+        db_driver = self.db.db_driver
+        table = self.tableFor(feature_type)
+        key_field_name = table.descriptor.key_field_name
+
+        area_sql = "ST_MakeEnvelope({},{},{},{},4326)".format(
+            float(bounds[0][0]), float(bounds[0][1]), float(bounds[1][0]), float(bounds[1][1])
+        )
+
+        # Build query selecting each rendered geometry
+        selects = []
+        for geom_field_name in self.feature_details[feature_type]["field_names"]:
+            world_field_name = table.model._geom_field_info[geom_field_name]
+
+            sql = "SELECT {key} AS id, {geom} AS geom FROM {table} WHERE {geom} && {area}".format(
+                key=key_field_name,
+                geom=geom_field_name,
+                table=db_driver.dbNameFor("data", feature_type, True),
+                area=area_sql,
+            )
+
+            if world_field_name:
+                sql += " AND {} {}".format(world_field_name, db_driver.geomWorldTypeClause("geo"))
+
+            if ids is not None:
+                sql += " AND {} IN ({})".format(
+                    key_field_name, ",".join("'{}'".format(id.replace("'", "''")) for id in ids)
+                )
+
+            selects.append(sql)
+
+        sql = "SELECT id, ST_XMin(b), ST_YMin(b), ST_XMax(b), ST_YMax(b) FROM (SELECT id, ST_Extent(geom) AS b FROM ({}) geoms GROUP BY id) extents".format(
+            " UNION ALL ".join(selects)
+        )
+
+        extents = {}
+        for rec in self.db.session.execute(sql):
+            extents[str(rec[0])] = ((rec[1], rec[2]), (rec[3], rec[4]))
+
+        return extents
@@ -0,0 +1,115 @@
+# ==============================================================================
+# myw_transaction_log_cursor
+# ==============================================================================
+# Copyright: IQGeo Limited 2010-2023
+
+import time
+
+from myworldapp.core.server.base.core.myw_error import MywError
+
+
+class MywTransactionLogCursor:
+    """
+    Position in a transaction log table, for reading new entries incrementally
+
+    Log entry ids are allocated from a sequence, so where writers can
+    overlap (Postgres) an entry can commit after entries with higher
+    ids. Tracking MAX(id) would then skip it. Instead, self re-reads
+    entries above .position until all transactions that might still
+    commit entries below them have ended (see MywDbDriver.transactionIdHorizon()).
+
+    Entries are returned by .read() once only, in id order within each call"""
+
+    # Time between checks for in-progress transactions (in seconds)
+    poll_interval = 0.1
+
+    @classmethod
+    def finalPosition(cls, db, table_name="transaction_log", timeout=60):
+        """
+        Id of the latest entry in log TABLE_NAME, once all entries up to it are committed
+
+        Waits until all transactions that might commit entries with lower ids have
+        ended. Raises MywError if this takes longer than TIMEOUT seconds.
+
+        Returns an id that can be safely recorded as 'all changes up to here seen'"""
+
+        position = db.transactionLogPosition(table_name)
+        horizon = db.db_driver.transactionIdHorizon()
+
+        # Case: Writes serialised
+        if horizon is None:
+            return position
+
+        # Note: Log triggers run after the feature write, so a transaction has its id before it gets an entry id
+        start = time.time()
+        while db.db_driver.transactionIdHorizon()[0] < horizon[1]:
+            if time.time() - start > timeout:
+                raise MywError(
+                    "Timed out waiting for in-progress transactions to complete:", table_name
+                )
+            time.sleep(cls.poll_interval)
+
+        return position
+
+    def __init__(self, table_name="transaction_log", position=0):
+        """
+        Init slots of self
+
+        POSITION is an id up to which all entries are known to have been seen (see .finalPosition())"""
+
+        self.table_name = table_name
+        self.position = position  # Id up to which all entries have been read
+        self.seen = set()  # Ids above .position already returned
+        self.pending = []  # (max_id, xmax) tuples, for reads whose entries may not yet be complete
+
+    def read(self, db, columns, filter_sql=None):
+        """
+        Entries of self's log not previously returned
+
+        COLUMNS is a list of column names. Optional FILTER_SQL is an SQL
+        condition selecting the entries of interest.
+
+        Returns a list of rows (ID,<column values>) in id order"""
+        # Note: Can't use SQLAlchemy query here as can miss trigger changes
+
+        driver = db.db_driver
+
+        # Ensure any pending updates are written to DB
+        db.session.flush()
+
+        horizon = driver.transactionIdHorizon()
+
+        # Get entries
+        sql = "SELECT {} FROM {} WHERE id > {}".format(
+            ", ".join(["id"] + columns),
+            driver.dbNameFor("myw", self.table_name, True),
+            int(self.position),
+        )
+
+        if filter_sql:
+            sql += " AND ({})".format(filter_sql)
+
+        sql += " ORDER BY id"
+
+        rows = db.session.execute(sql).fetchall()
+        new_rows = [row for row in rows if not row[0] in self.seen]
+        max_id = rows[-1][0] if rows else self.position
+
+        # Case: Writes serialised
+        if horizon is None:
+            self.position = max_id
+            self.seen = set()
+            return new_rows
+
+        # Advance past reads whose transactions had all ended before this one started
+        while self.pending and self.pending[0][1] <= horizon[0]:
+            self.position = max(self.position, self.pending.pop(0)[0])
+
+        if max_id > self.position and (not self.pending or max_id > self.pending[-1][0]):
+            self.pending.append((max_id, driver.transactionIdHorizon()[1]))
+
+        # Forget ids that will no longer be re-read
+        self.seen.update(row[0] for row in new_rows)
+        self.seen = set(id for id in self.seen if id > self.position)
+
+        return new_rows
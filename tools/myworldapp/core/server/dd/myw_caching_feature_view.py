@@ -1,5 +1,7 @@
 # Copyright: IQGeo Limited 2010-2023
 
+from collections import OrderedDict
+
 from myworldapp.core.server.dd.myw_reference import MywReference
 from .myw_feature_view import MywFeatureView
 
@@ -10,7 +12,10 @@ class MywCachingFeatureView(MywFeatureView):
 
     For use cases where a short-lived read-only instance is useful. This class does not prevent
     you from writing to the database, which will invalidate its cache, so use it with
-    appropriate caution."""
+    appropriate caution.
+
+    The cache holds up to MAX_SIZE records (including misses), discarding the
+    least recently used one when full"""
 
     def __init__(self, db_view, cache_max_size=10000):
         """
@@ -19,15 +24,33 @@ class MywCachingFeatureView(MywFeatureView):
 
         super().__init__(db_view.db, db_view.delta, db_view.schema)
 
-        self.features = {}  # Keyed by urn
+        self.features = OrderedDict()  # Keyed by unqualified urn, least recently used first
         self.max_size = cache_max_size
 
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
     def getCachingView(self):
         """
         For API-compatibility with the base class, we override this since this is already a caching view.
         """
         return self
 
+    def cacheStats(self):
+        """
+        Statistics on use of self's cache (a dict)
+        """
+
+        return {
+            "size": len(self.features),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
     def getRecs(self, refs, error_if_bad=True):
         """
         Returns records referenced by REFS (a list of MywReferences or URNs)
@@ -36,29 +59,39 @@ class MywCachingFeatureView(MywFeatureView):
 
         If ERROR_IF_BAD is True, raises ValueError on malformed URNs
 
-        Subclassed to return feature from cache (if easy)"""
+        Subclassed to return features from cache where possible, reading the
+        others in one query per feature type"""
 
-        if len(refs) == 1:
-            rec = self.get(refs[0], error_if_bad)
-            if rec:
-                return [rec]
-            return []
+        recs = []
+        missing_refs = []
+        urns = set()
 
-        recs = super().getRecs(refs, error_if_bad=error_if_bad)
+        for ref in refs:
+            urn = self._cacheKeyFor(ref, error_if_bad)
 
-        # Clear cache if it's full:
-        if self.max_size and len(self.features) + len(recs) > self.max_size:
-            self.features = {}
+            # Case: Not cacheable
+            if urn is None:
+                missing_refs.append(ref)
+                continue
 
-        # Cache the features before we return them.
-        for rec in recs:
-            # Build cache key
-            if isinstance(rec, MywReference):
-                urn = rec.urn()
+            # Avoid returning duplicates
+            if urn in urns:
+                continue
+            urns.add(urn)
+
+            # Case: In cache
+            if urn in self.features:
+                rec = self._cachedRec(urn)
+                if rec is not None:
+                    recs.append(rec)
+
+            # Case: Must read it
             else:
-                urn = rec
+                missing_refs.append(ref)
 
-            self.features[urn] = rec
+        # Read missing features (and cache them)
+        if missing_refs:
+            recs += self._readRecs(missing_refs, error_if_bad)
 
         return recs
 
@@ -71,19 +104,120 @@ class MywCachingFeatureView(MywFeatureView):
         Subclassed to return feature from cache (if present)"""
 
         # Build cache key
-        if isinstance(ref, MywReference):
-            urn = ref.urn()
-        else:
-            urn = ref
+        urn = self._cacheKeyFor(ref, error_if_bad)
+        if urn is None:
+            return super().get(ref, error_if_bad=error_if_bad)
+
+        # Case: In cache
+        if urn in self.features:
+            return self._cachedRec(urn)
+
+        # Case: Must read it
+        self.misses += 1
+        rec = super().get(ref, error_if_bad=error_if_bad)
+        self._addToCache(urn, rec)
+
+        return rec
+
+    def prefetch(self, refs, error_if_bad=False):
+        """
+        Ensure records referenced by REFS (a list of MywReferences or URNs) are in cache
+
+        Features not already cached are read in one query per feature type. Can be used
+        to warm the cache before a sequence of get() calls
+
+        Returns number of references read"""
+
+        missing_refs = []
+        urns = set()
+
+        for ref in refs:
+            urn = self._cacheKeyFor(ref, error_if_bad)
+
+            if urn is None or urn in urns or urn in self.features:
+                continue
+
+            urns.add(urn)
+            missing_refs.append(ref)
+
+        if missing_refs:
+            self._readRecs(missing_refs, error_if_bad)
+
+        return len(missing_refs)
+
+    # ==============================================================================
+    #                                  CACHE MANAGEMENT
+    # ==============================================================================
 
-        # Read feature (if necessary)
-        if not urn in self.features:
+    def _readRecs(self, refs, error_if_bad):
+        """
+        Read records referenced by REFS from the database, adding them to cache
+
+        References that do not identify a record are cached as misses
+
+        Returns records found"""
+
+        recs = super().getRecs(refs, error_if_bad=error_if_bad)
+
+        # Cache the features we got
+        found_urns = set()
+        for rec in recs:
+            urn = rec._urn()
+            found_urns.add(urn)
+            self._addToCache(urn, rec)
 
-            # Clear cache if it's full:
-            if self.max_size and len(self.features) >= self.max_size:
-                self.features = {}
+        # Remember the ones that don't exist
+        for ref in refs:
+            urn = self._cacheKeyFor(ref, False)
+            if urn is not None and urn not in found_urns:
+                self._addToCache(urn, None)
+
+        self.misses += len(refs)
+
+        return recs
+
+    def _cachedRec(self, urn):
+        """
+        The cached record for URN (which must be in cache), marking it as recently used
+        """
 
-            self.features[urn] = super().get(ref, error_if_bad=error_if_bad)
+        self.hits += 1
+        self.features.move_to_end(urn)
 
-        # Return it
         return self.features[urn]
+
+    def _addToCache(self, urn, rec):
+        """
+        Add REC to cache as URN, discarding least recently used entries if full
+
+        REC can be None (meaning 'no such feature')"""
+
+        self.features[urn] = rec
+        self.features.move_to_end(urn)
+
+        if self.max_size:
+            while len(self.features) > self.max_size:
+                self.features.popitem(last=False)
+                self.evictions += 1
+
+    def _cacheKeyFor(self, ref, error_if_bad):
+        """
+        Cache key for REF (a MywReference or URN)
+
+        Returns the unqualified URN of REF, or None if REF is not a cacheable
+        myWorld reference"""
+
+        # Case: Simple URN (fast path)
+        if not isinstance(ref, MywReference):
+            if not "?" in ref and ref.count("/") == 1:
+                return ref
+
+            ref = MywReference.parseUrn(ref, error_if_bad=error_if_bad)
+            if not ref:
+                return None
+
+        # Case: External reference
+        if ref.datasource != "myworld":
+            return None
+
+        return ref.urn(include_qualifiers=False)
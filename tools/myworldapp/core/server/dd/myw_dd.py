@@ -836,6 +836,7 @@ class MywDD:
             remote_spec=feature_rec.get_property("remote_spec"),
             editor_options=feature_rec.editor_options,
             geom_indexed=feature_rec.geom_indexed,
+            mvt_generalised=feature_rec.mvt_generalised or False,
         )
 
         # Add substructure
@@ -940,6 +941,7 @@ class MywDD:
             delete_from_gui=feature_desc.delete_from_gui,
             editor_options=feature_desc.editor_options,
             geom_indexed=feature_desc.geom_indexed,
+            mvt_generalised=feature_desc.mvt_generalised,
         )
 
         feature_rec.set_property("remote_spec", feature_desc.remote_spec)
@@ -1144,7 +1146,7 @@ class MywDD:
         elif prop in ["track_changes"]:
             tasks["rebuild_triggers"] = True
 
-        elif prop in ["geom_indexed"]:
+        elif prop in ["geom_indexed", "mvt_generalised"]:
             tasks["rebuild_triggers"] = True
             tasks["rebuild_geom_indexes"] = True
 
@@ -1614,6 +1616,9 @@ class MywDD:
                 with self.progress.operation("Building index records for schema:", "delta") as op:
                     op["recs"] = self.db_driver.rebuildGeomIndexesFor("delta", feature_rec)
 
+            with self.progress.operation("Building generalised tile geometry") as op:
+                op["recs"] = self.db_driver.rebuildMvtGeomsFor(feature_rec)
+
             self.db_driver.commit()  # Helps avoids huge transactions (slow on PostgreSQL)
 
     def rebuildAllSearchStringsFor(self, feature_rec):
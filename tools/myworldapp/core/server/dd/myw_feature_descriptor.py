@@ -46,6 +46,7 @@ class MywFeatureDescriptor:
         "remote_spec",
         "editor_options",
         "geom_indexed",
+        "mvt_generalised",
     ]
 
     # ==============================================================================
@@ -90,6 +91,7 @@ class MywFeatureDescriptor:
         remote_spec=None,
         editor_options=None,
         geom_indexed=True,
+        mvt_generalised=False,
     ):
         """
         Construct with basic properties
@@ -110,6 +112,7 @@ class MywFeatureDescriptor:
         self.remote_spec = remote_spec
         self.editor_options = editor_options
         self.geom_indexed = geom_indexed
+        self.mvt_generalised = mvt_generalised
 
         # Init compound properties
         # ENH: key groups etc by name
@@ -241,6 +244,9 @@ class MywFeatureDescriptor:
         ftr_def["versioned"] = self.versioned
         ftr_def["geom_indexed"] = self.geom_indexed
 
+        if self.mvt_generalised:
+            ftr_def["mvt_generalised"] = True
+
         if not self.editable:
             ftr_def["editable"] = False
         else:
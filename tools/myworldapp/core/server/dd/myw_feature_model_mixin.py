@@ -125,11 +125,13 @@ class MywFeatureModelMixin(MywModelMixin):
         for_file=False,
         lang=None,
         fields=[],
+        geoms=None,
     ):
         """
         Return self as a Geojson feature structure
 
-        Optional CACHE is used to cache geo-world geometries between calls (for speed)"""
+        Optional CACHE is used to cache geo-world geometries between calls (for speed).
+        Optional GEOMS is a dict of geometries already in COORD_SYS, keyed by field name"""
 
         # Deal with defaults
         # Note: Cannot add this as arg default
@@ -158,7 +160,10 @@ class MywFeatureModelMixin(MywModelMixin):
 
             # Case: Geometry
             if field_desc.isGeometry():
-                geom = self._field(field_name).geom(coord_sys=coord_sys)
+                if geoms and field_name in geoms:
+                    geom = geoms[field_name]
+                else:
+                    geom = self._field(field_name).geom(coord_sys=coord_sys)
                 if field_name == primary_geom_name:
                     primary_geom = geom
                 else:
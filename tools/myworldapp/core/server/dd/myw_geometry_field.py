@@ -24,7 +24,7 @@ class MywGeometryField(MywField):
         """
         Cast property VALUE to GeoAlchemy field format
 
-        VALUE can be None
+        VALUE can be None or a MywGeometry
         """
         # ENH: For Postgres, skip conversion to shapely
 
@@ -37,8 +37,11 @@ class MywGeometryField(MywField):
             # For Oracle
             return Session.myw_db_driver.null_geometry  # pylint: disable=no-member
 
-        # Convert to in-memory geometry
-        geom = MywGeometry.decode(value)
+        # Convert to in-memory geometry (if necessary)
+        if isinstance(value, MywGeometry):
+            geom = value
+        else:
+            geom = MywGeometry.decode(value)
 
         # If no explicit coordinate system supplied, use the one from geometry (if present)
         if geom.srid and not coord_sys:
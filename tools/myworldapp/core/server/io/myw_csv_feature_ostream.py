@@ -54,11 +54,40 @@ class MywCsvFeatureOStream(MywFeatureOStream):
 
         return self
 
-    def writeFeature(self, rec):
+    def writeFeatures(self, recs):
+        """
+        Write feature records RECS to the file
+
+        If a transform is required, geometries are transformed for all RECS at once"""
+
+        recs = list(recs)
+
+        if not self.coord_sys or not recs or isinstance(recs[0], dict):
+            return super().writeFeatures(recs)
+
+        # Find geometry fields
+        geom_field_names = [
+            field_name
+            for field_name in self.field_descs
+            if any(hasattr(rec[field_name], "geom_from") for rec in recs)
+        ]
+
+        # Transform their values
+        geoms = {}
+        for field_name in geom_field_names:
+            geoms[field_name] = self._transformedGeomsFor(recs, field_name)
+
+        # Write records
+        for i_rec, rec in enumerate(recs):
+            rec_geoms = {field_name: field_geoms[i_rec] for field_name, field_geoms in geoms.items()}
+            self.writeFeature(rec, rec_geoms)
+
+    def writeFeature(self, rec, geoms=None):
         """
         Write feature REC to the file
 
-        REC is a database record or dict."""
+        REC is a database record or dict. Optional GEOMS is a dict of
+        geometries already in self's coordinate system, keyed by field name"""
 
         # Format record for output (handling special types)
         rec_as_dict = {}
@@ -69,7 +98,10 @@ class MywCsvFeatureOStream(MywFeatureOStream):
                 pass
 
             if hasattr(value, "geom_from"):  # ENH: Find a better test
-                value = rec._field(field_name).encode(self.geom_encoding, self.coord_sys)
+                if geoms and geoms.get(field_name) is not None:
+                    value = geoms[field_name].geoEncode(self.coord_sys.srid, self.geom_encoding)
+                else:
+                    value = rec._field(field_name).encode(self.geom_encoding, self.coord_sys)
 
             elif isinstance(value, datetime.datetime):
                 value = datetime.datetime.strftime(value, self.timestamp_format)
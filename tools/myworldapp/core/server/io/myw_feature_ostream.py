@@ -12,7 +12,9 @@ class MywFeatureOStream:
       __init__(file_name,field_descs,encoding,...)
       __enter__()
       writeFeature()
-      __exit__()"""
+      __exit__()
+
+    Subclasses may also implement writeFeatures() to write a chunk of records at once"""
 
     @classmethod
     def streamFor(self, filepath, field_descs, encoding=None, **file_options):
@@ -39,3 +41,33 @@ class MywFeatureOStream:
             return MywOgrFeatureOStream(
                 filepath, field_descs, file_format=ext, coord_sys=file_options.get("coord_sys")
             )
+
+    def writeFeatures(self, recs):
+        """
+        Write feature records RECS to the file
+
+        Backstop implementation writes them one at a time"""
+
+        for rec in recs:
+            self.writeFeature(rec)
+
+    def _transformedGeomsFor(self, recs, field_name):
+        """
+        Geometries of field FIELD_NAME of database records RECS, in self's coordinate system
+
+        Geometries are transformed in a single batch (see MywGeometry.geoTransformAll()).
+        Returns a list of MywGeometries, in RECS order (None where field is unset)"""
+
+        from myworldapp.core.server.base.geom.myw_geometry import MywGeometry
+
+        geoms = []
+        db_coord_sys = None
+        for rec in recs:
+            field = rec._field(field_name)
+            db_coord_sys = field.coord_sys
+            geoms.append(field.geom())
+
+        if db_coord_sys is None:
+            return geoms
+
+        return MywGeometry.geoTransformAll(geoms, db_coord_sys, self.coord_sys)
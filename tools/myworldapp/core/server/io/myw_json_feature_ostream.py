@@ -86,11 +86,34 @@ class MywJsonFeatureOStream(MywFeatureOStream):
 
         return self
 
-    def writeFeature(self, rec):
+    def writeFeatures(self, recs):
+        """
+        Write feature records RECS to the file
+
+        If a transform is required, geometries are transformed for all RECS at once"""
+
+        recs = list(recs)
+
+        if not self.coord_sys or not recs or isinstance(recs[0], dict):
+            return super().writeFeatures(recs)
+
+        # Transform geometries
+        geoms = {}
+        for field_name, field_desc in recs[0]._descriptor.storedFields().items():
+            if field_desc.isGeometry() and field_name in self.field_descs:
+                geoms[field_name] = self._transformedGeomsFor(recs, field_name)
+
+        # Write records
+        for i_rec, rec in enumerate(recs):
+            rec_geoms = {field_name: field_geoms[i_rec] for field_name, field_geoms in geoms.items()}
+            self.writeFeature(rec, rec_geoms)
+
+    def writeFeature(self, rec, geoms=None):
         """
         Write feature REC to the file
 
-        REC is a database record."""
+        REC is a database record. Optional GEOMS is a dict of
+        geometries already in self's coordinate system, keyed by field name"""
 
         if isinstance(rec, dict):
             feature = geojson.Feature(**rec)  # ENH: Transform geometry (if requested)
@@ -100,6 +123,7 @@ class MywJsonFeatureOStream(MywFeatureOStream):
                 include_titles=False,
                 coord_sys=self.coord_sys,
                 fields=list(self.field_descs.keys()),
+                geoms=geoms,
             )
 
         self.features.append(feature)
@@ -80,11 +80,34 @@ class MywOgrFeatureOStream(MywFeatureOStream):
 
         return self
 
-    def writeFeature(self, rec):
+    def writeFeatures(self, recs):
+        """
+        Write feature records RECS to the file
+
+        If a transform is required, geometries are transformed for all RECS at once"""
+
+        recs = list(recs)
+
+        if not self.coord_sys:
+            return super().writeFeatures(recs)
+
+        # Transform geometries
+        geoms = {}
+        for fld_name, fld_desc in list(self.field_descs.items()):
+            if fld_desc.isGeometry():
+                geoms[fld_name] = self._transformedGeomsFor(recs, fld_name)
+
+        # Write records
+        for i_rec, rec in enumerate(recs):
+            rec_geoms = {fld_name: fld_geoms[i_rec] for fld_name, fld_geoms in geoms.items()}
+            self.writeFeature(rec, rec_geoms)
+
+    def writeFeature(self, rec, geoms=None):
         """
         Write feature REC to the file
 
-        REC is a database record or dict."""
+        REC is a database record or dict. Optional GEOMS is a dict of
+        geometries already in self's coordinate system, keyed by field name"""
 
         ftr = ogr.Feature(self.layer.GetLayerDefn())
 
@@ -92,7 +115,10 @@ class MywOgrFeatureOStream(MywFeatureOStream):
         for fld_name, fld_desc in list(self.field_descs.items()):
 
             if fld_desc.isGeometry():
-                geom_wkt = rec._field(fld_name).encode("wkt", self.coord_sys)
+                if geoms and geoms.get(fld_name) is not None:
+                    geom_wkt = geoms[fld_name].geoEncode(self.srid, "wkt")
+                else:
+                    geom_wkt = rec._field(fld_name).encode("wkt", self.coord_sys)
                 geom_ogr = ogr.CreateGeometryFromWkt(geom_wkt)
                 ftr.SetGeometry(geom_ogr)
             else:
@@ -35,6 +35,7 @@ class MywDDFeature(ModelBase, MywModelMixin):
     delete_from_gui = Column(Boolean)
     editor_options = Column(JSON(none_as_null=True))
     geom_indexed = Column(Boolean, default=True)
+    mvt_generalised = Column(Boolean, default=False)
 
     # ==============================================================================
     #                                INDENT
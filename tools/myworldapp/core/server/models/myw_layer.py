@@ -11,6 +11,7 @@ import json, re
 
 from myworldapp.core.server.base.core.myw_error import MywError
 from myworldapp.core.server.base.core.myw_progress import MywProgressHandler
+from myworldapp.core.server.base.core.utils import PropertyDict
 from myworldapp.core.server.base.db.globals import Session
 from myworldapp.core.server.models.base import ModelBase, MywModelMixin
 from myworldapp.core.server.models.myw_datasource import MywDatasource
@@ -492,6 +493,54 @@ class MywLayer(ModelBase, MywModelMixin):
 
         return zoomRange
 
+    def render_feature_details(self):
+        """
+        Details of the feature types to query when rendering self (a PropertyDict)
+
+        A feature can have multiple geometry fields to render. Returns the details
+        necessary to do one query per feature type, keyed by feature type. Also has
+        property .zoomRange (see zoomRangeFn())"""
+
+        # Get and sort items (slow because involves getting feild geom types)
+        feature_item_defs = self.feature_item_defs(in_draw_order=True, with_defaults=True)
+
+        featureTypeDetails = PropertyDict()
+        featureTypeDetails.zoomRange = self.zoomRangeFn()
+
+        # gather item details per feature type
+        for feature_item_def in feature_item_defs:
+            feature_type = feature_item_def["name"]
+
+            field_name = feature_item_def.get("field_name")
+            if feature_type not in featureTypeDetails:
+                featureTypeDetails[feature_type] = {
+                    "field_names": [],
+                    "required_fields": ["myw_geometry_world_name"],
+                    "min_vis": 100,
+                    "max_vis": 0,
+                }
+
+            details = featureTypeDetails[feature_type]
+            if field_name:
+                details["field_names"].append(field_name)
+                details["required_fields"].extend(
+                    [field_name, "myw_gwn_" + field_name, "myw_orientation_" + field_name]
+                )
+
+            # include fields used by text styles in results
+            text_style = feature_item_def.get("text_style", "")
+            text_field = text_style.split(":")[0]
+            if text_field:
+                details["required_fields"].append(text_field)
+
+            details["min_vis"] = min(details["min_vis"], feature_item_def["min_vis"])
+            details["max_vis"] = max(details["max_vis"], feature_item_def["max_vis"])
+            details["filter"] = feature_item_def.get(
+                "filter"
+            )  # filter should be the same if several items
+
+        return featureTypeDetails
+
     def set_feature_items(self, ftr_item_defs, skip_unknown=False, progress=MywProgressHandler()):
         """
         Update the layer feature item records associated with SELF
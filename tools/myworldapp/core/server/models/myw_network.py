@@ -96,7 +96,7 @@ class MywNetwork(ModelBase, MywModelMixin):
 
             item_data = OrderedDict()
 
-            for prop in ["upstream", "downstream", "length", "filter"]:
+            for prop in ["upstream", "downstream", "length", "filter", "cost"]:
                 value = item_rec[prop]
 
                 if value != None:
@@ -44,6 +44,38 @@ class MywGraphNetworkEngine(MywNetworkEngine):
 
         return nodes
 
+    def prefetchConnections(self, nodes, direction):
+        """
+        Read the features referenced by NODES into the cache
+
+        Reads each feature type in a single query"""
+
+        urns = []
+
+        for node in nodes:
+            for field_direction in self._fieldDirectionsFor(direction):
+                field_name = self.featurePropFieldName(node.feature.feature_type, field_direction)
+                if not field_name:
+                    continue
+
+                field = node.feature._field(field_name)
+                if not hasattr(field, "refs"):  # Calculated reference
+                    continue
+
+                urns += [ref.urn(include_qualifiers=False) for ref in field.refs()]
+
+        self.prefetchFeatureRecs(urns)
+
+    def _fieldDirectionsFor(self, direction):
+        """
+        The configured field properties to follow when tracing in DIRECTION
+        """
+
+        if direction == "both" or not self.network_def["directed"]:
+            return ["upstream", "downstream"]
+
+        return [direction]
+
     def connectedFeaturesFor(self, feature, direction):
         """
         Returns features directly reachable from FEATURE
@@ -0,0 +1,650 @@
+################################################################################
+# myWorld Graph NetworkEngine using an in-memory graph
+################################################################################
+# Copyright: IQGeo Limited 2010-2023
+
+from heapq import heappush, heappop
+from itertools import count
+from collections import OrderedDict
+
+from myworldapp.core.server.base.core.myw_error import MywError
+from myworldapp.core.server.base.core.myw_progress import MywProgressHandler
+
+from .myw_graph_network_engine import MywGraphNetworkEngine
+from .myw_network_graph import (
+    MywNetworkGraph,
+    NODE_EXISTS,
+    NODE_INCLUDED,
+    EDGE_UPSTREAM,
+    EDGE_DOWNSTREAM,
+)
+from .myw_trace_node import MywTraceNode
+
+
+class MywMemoryGraphNetworkEngine(MywGraphNetworkEngine):
+    """
+    A 'simple graph' network engine that traces over a shared in-memory graph
+
+    The connectivity of the network is held in a MywNetworkGraph, built
+    on first use and kept current from the transaction log. Traces run
+    over that without database access, reading only the records of the
+    features in the result.
+
+    Falls back to database tracing if the network cannot be represented
+    in memory, or if extra filters are supplied"""
+
+    stream_chunk_size = 1000  # Number of records to read in one go when streaming results
+
+    def __init__(self, db_view, network_def, extra_filters={}, progress=MywProgressHandler()):
+        """
+        Init slots of self
+
+        See MywNetworkEngine.__init__()"""
+
+        super().__init__(db_view, network_def, extra_filters=extra_filters, progress=progress)
+
+        # Case: Filters are per-request .. so can't use shared graph
+        if extra_filters:
+            self.graph = None
+        else:
+            self.graph = MywNetworkGraph.graphFor(self)
+
+    # ==============================================================================
+    #                                   TRACING
+    # ==============================================================================
+
+    def traceOutNodes(self, from_urn, direction="both", max_dist=None, max_nodes=None):
+        """
+        Find objects reachable from FROM_URN, yielding trace nodes as they are reached
+
+        Subclassed to trace over self's in-memory graph (where possible),
+        reading records in chunks. See MywNetworkEngine.traceOutNodes()"""
+
+        overlay, i_root = self._graphRootFor(from_urn)
+
+        if i_root is None:
+            return super().traceOutNodes(
+                from_urn, direction, max_dist=max_dist, max_nodes=max_nodes
+            )
+
+        return self._streamTraceGraph(i_root, overlay, direction, max_dist, max_nodes)
+
+    def pathCosts(self, from_urn, to_urns=None, direction="both", max_dist=None, max_nodes=None):
+        """
+        Find shortest paths from FROM_URN to each of TO_URNS
+
+        Subclassed to compute paths from self's in-memory graph without
+        reading feature records. See MywNetworkEngine.pathCosts() for details"""
+
+        overlay, i_root = self._graphRootFor(from_urn)
+
+        if i_root is None or (to_urns is not None and not to_urns):
+            return super().pathCosts(
+                from_urn, to_urns, direction, max_dist=max_dist, max_nodes=max_nodes
+            )
+
+        # Find nodes reached
+        with self.graph.lock:
+            entries, stop_entries = self._traceGraph(
+                i_root, overlay, direction, to_urns or [], max_dist, max_nodes, find_all=True
+            )
+
+        if to_urns is None:
+            stop_entries = range(len(entries))
+
+        # Build result
+        paths = OrderedDict()
+        for i_entry in stop_entries:
+            urn, dist, i_parent_entry, full_dist, partial, cost = entries[i_entry]
+            paths[urn] = (dist, cost, self._entryPathFor(entries, i_entry))
+
+        return paths
+
+    def _trace(
+        self, from_urn, direction, stop_urns=[], max_dist=None, max_nodes=None, found_nodes=None
+    ):
+        """
+        Find objects reachable from FROM_URN (in cost order)
+
+        Subclassed to trace over self's in-memory graph (where possible). If
+        looking for the nearest of STOP_URNS, searches from both ends. See
+        MywNetworkEngine._trace() for details"""
+
+        overlay, i_root = self._graphRootFor(from_urn)
+
+        if i_root is None:
+            return super()._trace(
+                from_urn,
+                direction,
+                stop_urns=stop_urns,
+                max_dist=max_dist,
+                max_nodes=max_nodes,
+                found_nodes=found_nodes,
+            )
+
+        # Find nodes reached
+        with self.graph.lock:
+
+            # Case: Path to nearest stop node
+            # Note: Partial links can be stop nodes .. so only if no distance limit
+            if stop_urns and found_nodes is None and not max_dist:
+                entries, stop_entries = self._traceBidirectional(
+                    i_root, overlay, direction, stop_urns, max_nodes
+                )
+
+            # Case: Trace out
+            else:
+                entries, stop_entries = self._traceGraph(
+                    i_root,
+                    overlay,
+                    direction,
+                    stop_urns,
+                    max_dist,
+                    max_nodes,
+                    find_all=found_nodes is not None,
+                )
+
+        # Build result (only paths to stop nodes, if looking for them)
+        if stop_urns:
+            root_node, stop_nodes = self._traceNodesFor(entries, stop_entries)
+        else:
+            root_node, stop_nodes = self._traceNodesFor(entries)
+
+        if found_nodes is not None:
+            for node in stop_nodes:
+                found_nodes[node.feature._urn()] = node
+            return root_node, None
+
+        return root_node, stop_nodes[0] if stop_nodes else None
+
+    def _graphRootFor(self, from_urn):
+        """
+        Graph overlay and node index from which to trace from FROM_URN
+
+        Brings self's graph up to date. Returns (None,None) if trace
+        cannot be done in memory"""
+
+        if self.graph is None:
+            return None, None
+
+        self.graph.refresh(self.caching_view.db)
+        overlay = self.graph.overlayFor(self.caching_view)
+
+        with self.graph.lock:
+            i_root = self.graph.nodeFor(from_urn, overlay)
+
+            if i_root is None or not self.graph.nodeInfo(i_root, overlay)[3] & NODE_EXISTS:
+                self.progress(4, "Not in network graph:", from_urn)
+                return None, None
+
+        return overlay, i_root
+
+    def _directionMaskFor(self, direction):
+        """
+        The EDGE_XX flags of the graph edges to follow when tracing in DIRECTION
+        """
+
+        if direction == "both" or not self.network_def["directed"]:
+            return EDGE_UPSTREAM | EDGE_DOWNSTREAM
+
+        if direction == "upstream":
+            return EDGE_UPSTREAM
+
+        return EDGE_DOWNSTREAM
+
+    def _traceGraph(
+        self, i_root, overlay, direction, stop_urns, max_dist, max_nodes, find_all=False
+    ):
+        """
+        Find nodes reachable from graph node I_ROOT (in cost order)
+
+        Stops when one of STOP_URNS is found (or all of them, if FIND_ALL
+        is True). Must be called holding self.graph.lock
+
+        Returns:
+          ENTRIES       (urn,dist,i_parent_entry,full_dist,partial,cost) tuples, in order found
+          STOP_ENTRIES  Indices in ENTRIES of the stop nodes found"""
+
+        graph = self.graph
+        direction_mask = self._directionMaskFor(direction)
+        stop_urns = set(stop_urns)
+
+        entries = []
+        stop_entries = []
+        active_entries = []  # (cost,i_entry,i_node) tuples in the 'wave front'
+        visited_nodes = set([i_root])
+
+        # Add start node
+        urn = graph.nodeInfo(i_root, overlay)[0]
+        entries.append((urn, 0.0, None, 0.0, False, 0.0))
+        heappush(active_entries, (0.0, 0, i_root))
+
+        # Propagate wavefront (in cost order)
+        while active_entries:
+            cost, i_entry, i_node = heappop(active_entries)
+            urn, length, node_cost, flags, targets, directions = graph.nodeInfo(i_node, overlay)
+
+            # Check for found stop node
+            if urn in stop_urns:
+                stop_entries.append(i_entry)
+
+                if not find_all or len(stop_entries) == len(stop_urns):
+                    return entries, stop_entries
+
+            # Check for node beyond distance limit
+            if entries[i_entry][4]:
+                continue
+
+            # Add connected nodes to wavefront
+            for i_target, entry in self._graphConnectionsFrom(
+                overlay,
+                i_entry,
+                entries[i_entry],
+                targets,
+                directions,
+                visited_nodes,
+                direction_mask,
+                max_dist,
+                max_nodes,
+            ):
+                entries.append(entry)
+                heappush(active_entries, (entry[5], len(entries) - 1, i_target))
+
+        return entries, stop_entries
+
+    def _streamTraceGraph(self, i_root, overlay, direction, max_dist, max_nodes):
+        """
+        Yield MywTraceNodes for the nodes reachable from graph node I_ROOT, as they are taken from the wavefront
+
+        Nodes are yielded in cost order (as per _traceGraph()). The search
+        is performed in steps of .stream_chunk_size nodes (holding
+        self.graph.lock), reading the records for each step in one go.
+        Nodes are not added to their parent's children, and are discarded
+        once all their children have been built"""
+
+        graph = self.graph
+        direction_mask = self._directionMaskFor(direction)
+        seq = count()
+
+        active_entries = []  # (cost,i_entry,i_node,entry) tuples in the 'wave front'
+        visited_nodes = set([i_root])
+        n_active_children = {}  # Number of children in wavefront, keyed by entry index
+        nodes = {}  # Nodes that may have children still to build, keyed by entry index
+
+        # Add start node
+        with graph.lock:
+            urn = graph.nodeInfo(i_root, overlay)[0]
+        heappush(active_entries, (0.0, next(seq), i_root, (urn, 0.0, None, 0.0, False, 0.0)))
+
+        while active_entries:
+
+            # Take next nodes from wavefront (in cost order), adding their connections
+            step_entries = []  # (i_entry,entry) tuples, in order taken
+
+            with graph.lock:
+                while active_entries and len(step_entries) < self.stream_chunk_size:
+                    cost, i_entry, i_node, entry = heappop(active_entries)
+                    step_entries.append((i_entry, entry))
+
+                    # Check for node beyond distance limit
+                    if entry[4]:
+                        continue
+
+                    targets, directions = graph.nodeInfo(i_node, overlay)[4:]
+
+                    for i_target, target_entry in self._graphConnectionsFrom(
+                        overlay,
+                        i_entry,
+                        entry,
+                        targets,
+                        directions,
+                        visited_nodes,
+                        direction_mask,
+                        max_dist,
+                        max_nodes,
+                    ):
+                        heappush(
+                            active_entries, (target_entry[5], next(seq), i_target, target_entry)
+                        )
+                        n_active_children[i_entry] = n_active_children.get(i_entry, 0) + 1
+
+            # Get records (in one query per feature type)
+            recs = {}
+            for rec in self.caching_view.getRecs([entry[0] for i_entry, entry in step_entries]):
+                recs[rec._urn()] = rec
+
+            # Build nodes (skipping those whose record or parent has gone)
+            for i_entry, entry in step_entries:
+                urn, dist, i_parent_entry, full_dist, partial, cost = entry
+
+                parent = None
+                if i_parent_entry is not None:
+                    parent = nodes.get(i_parent_entry)
+
+                    n_active_children[i_parent_entry] -= 1
+                    if not n_active_children[i_parent_entry]:
+                        del n_active_children[i_parent_entry]
+                        nodes.pop(i_parent_entry, None)
+
+                    if parent is None:
+                        continue
+
+                rec = recs.get(urn)
+                if rec is None:
+                    self.progress(5, "  No such feature:", urn)
+                    continue
+
+                node = self._traceNodeFor(rec, entry, parent)
+
+                if i_entry in n_active_children:
+                    nodes[i_entry] = node
+
+                yield node
+
+    def _graphConnectionsFrom(
+        self,
+        overlay,
+        i_entry,
+        entry,
+        targets,
+        directions,
+        visited_nodes,
+        direction_mask,
+        max_dist,
+        max_nodes,
+    ):
+        """
+        Trace result entries for the unvisited nodes connected to trace result ENTRY
+
+        TARGETS and DIRECTIONS are the edges of ENTRY's graph node. I_ENTRY is the
+        index of ENTRY (for use as parent). Adds the nodes found to VISITED_NODES.
+        Must be called holding self.graph.lock
+
+        Yields (I_TARGET, TARGET_ENTRY) tuples (see _traceGraph())"""
+
+        graph = self.graph
+        required_flags = NODE_EXISTS | NODE_INCLUDED
+        dist = entry[1]
+        cost = entry[5]
+
+        for i_target, edge_direction in zip(targets, directions):
+
+            if not edge_direction & direction_mask:
+                continue
+
+            if i_target in visited_nodes:
+                continue
+
+            target_urn, target_length, target_cost, target_flags = graph.nodeInfo(
+                i_target, overlay
+            )[:4]
+
+            # Check for missing or filtered out
+            if target_flags & required_flags != required_flags:
+                continue
+
+            full_dist = target_dist = dist + target_length
+            target_cost = cost + target_cost
+            partial = False
+
+            # Check for end beyond distance limit
+            if max_dist and target_dist > max_dist:
+                if target_cost == full_dist:  # Cost is just length
+                    target_cost = max_dist
+                target_dist = max_dist
+                partial = True
+
+            # Prevent cycles
+            visited_nodes.add(i_target)
+
+            # Prevent memory overflow etc
+            if max_nodes and len(visited_nodes) > max_nodes:
+                self.progress("warning", "Trace size limit exceeded:", max_nodes)
+                raise MywError("Trace size limit exceeded")
+
+            yield i_target, (target_urn, target_dist, i_entry, full_dist, partial, target_cost)
+
+    def _traceBidirectional(self, i_root, overlay, direction, stop_urns, max_nodes):
+        """
+        Find cheapest path from graph node I_ROOT to the nearest of STOP_URNS
+
+        Searches forwards from I_ROOT and backwards from the stop nodes at the
+        same time, expanding whichever wavefront is smaller, until the
+        wavefronts meet. Must be called holding self.graph.lock
+
+        Returns ENTRIES and STOP_ENTRIES, as per _traceGraph()"""
+
+        graph = self.graph
+        direction_mask = self._directionMaskFor(direction)
+        required_flags = NODE_EXISTS | NODE_INCLUDED
+        seq = count()
+
+        root_entry = (graph.nodeInfo(i_root, overlay)[0], 0.0, None, 0.0, False, 0.0)
+
+        # Find stop nodes
+        i_stops = set()
+        for urn in stop_urns:
+            i_node = graph.nodeFor(urn, overlay)
+
+            if i_node == i_root:
+                return [root_entry], [0]
+
+            if i_node is not None:
+                if graph.nodeInfo(i_node, overlay)[3] & required_flags == required_flags:
+                    i_stops.add(i_node)
+
+        if not i_stops:
+            return [root_entry], []
+
+        # Init wavefronts
+        # Note: Costs are those of the links after the node (forwards) or before it (backwards)
+        fwd_costs = {i_root: 0.0}
+        fwd_parents = {i_root: None}
+        fwd_active = [(0.0, next(seq), i_root)]
+        fwd_done = set()
+
+        bwd_costs = {}
+        bwd_nexts = {}
+        bwd_active = []
+        bwd_done = set()
+
+        for i_stop in i_stops:
+            bwd_costs[i_stop] = 0.0
+            bwd_nexts[i_stop] = None
+            heappush(bwd_active, (0.0, next(seq), i_stop))
+
+        best_cost = float("inf")
+        i_meet = None
+
+        # Propagate wavefronts until they meet
+        while fwd_active and bwd_active:
+
+            # Check for no cheaper path possible
+            if fwd_active[0][0] + bwd_active[0][0] >= best_cost:
+                break
+
+            # Case: Expand forwards
+            if len(fwd_active) <= len(bwd_active):
+                cost, _, i_node = heappop(fwd_active)
+                if i_node in fwd_done:
+                    continue
+                fwd_done.add(i_node)
+
+                targets, directions = graph.nodeInfo(i_node, overlay)[4:]
+
+                for i_target, edge_direction in zip(targets, directions):
+                    if not edge_direction & direction_mask:
+                        continue
+
+                    target_cost, target_flags = graph.nodeInfo(i_target, overlay)[2:4]
+                    if target_flags & required_flags != required_flags:
+                        continue
+
+                    target_cost += cost
+                    if target_cost >= fwd_costs.get(i_target, best_cost):
+                        continue
+
+                    fwd_costs[i_target] = target_cost
+                    fwd_parents[i_target] = i_node
+                    heappush(fwd_active, (target_cost, next(seq), i_target))
+
+                    if i_target in bwd_costs and target_cost + bwd_costs[i_target] < best_cost:
+                        best_cost = target_cost + bwd_costs[i_target]
+                        i_meet = i_target
+
+            # Case: Expand backwards
+            else:
+                cost, _, i_node = heappop(bwd_active)
+                if i_node in bwd_done:
+                    continue
+                bwd_done.add(i_node)
+
+                source_cost = cost + graph.nodeInfo(i_node, overlay)[2]
+                sources, directions = graph.reverseEdgesOf(i_node, overlay)
+
+                for i_source, edge_direction in zip(sources, directions):
+                    if not edge_direction & direction_mask:
+                        continue
+
+                    if i_source != i_root:
+                        source_flags = graph.nodeInfo(i_source, overlay)[3]
+                        if source_flags & required_flags != required_flags:
+                            continue
+
+                    if source_cost >= bwd_costs.get(i_source, best_cost):
+                        continue
+
+                    bwd_costs[i_source] = source_cost
+                    bwd_nexts[i_source] = i_node
+                    heappush(bwd_active, (source_cost, next(seq), i_source))
+
+                    if i_source in fwd_costs and fwd_costs[i_source] + source_cost < best_cost:
+                        best_cost = fwd_costs[i_source] + source_cost
+                        i_meet = i_source
+
+            # Prevent memory overflow etc
+            if max_nodes and len(fwd_costs) + len(bwd_costs) > max_nodes:
+                self.progress("warning", "Trace size limit exceeded:", max_nodes)
+                raise MywError("Trace size limit exceeded")
+
+        # Case: No path
+        if i_meet is None:
+            return [root_entry], []
+
+        # Build path
+        path = []
+        i_node = i_meet
+        while i_node is not None:
+            path.append(i_node)
+            i_node = fwd_parents[i_node]
+        path.reverse()
+
+        i_node = bwd_nexts[i_meet]
+        while i_node is not None:
+            path.append(i_node)
+            i_node = bwd_nexts[i_node]
+
+        self.progress(6, "Found path:", len(path), "nodes", "cost=", best_cost)
+
+        # Convert to entries
+        entries = [root_entry]
+        dist = cost = 0.0
+
+        for i_node in path[1:]:
+            urn, length, node_cost = graph.nodeInfo(i_node, overlay)[:3]
+            dist += length
+            cost += node_cost
+            entries.append((urn, dist, len(entries) - 1, dist, False, cost))
+
+        return entries, [len(entries) - 1]
+
+    # ==============================================================================
+    #                                 RESULT BUILDING
+    # ==============================================================================
+
+    def _entryPathFor(self, entries, i_entry):
+        """
+        URNs of the path from the root of ENTRIES to entry I_ENTRY
+        """
+
+        urns = []
+
+        while i_entry is not None:
+            urns.append(entries[i_entry][0])
+            i_entry = entries[i_entry][2]
+
+        return list(reversed(urns))
+
+    def _traceNodesFor(self, entries, stop_entries=None):
+        """
+        Build MywTraceNode tree for trace result ENTRIES (see _traceGraph())
+
+        If STOP_ENTRIES is given, builds only the paths to those entries
+
+        Returns ROOT_NODE and a list of nodes for STOP_ENTRIES"""
+
+        # Determine entries to build
+        if stop_entries is not None:
+            i_entries = set()
+
+            for i_entry in stop_entries:
+                while i_entry is not None and not i_entry in i_entries:
+                    i_entries.add(i_entry)
+                    i_entry = entries[i_entry][2]
+
+            i_entries = sorted(i_entries)  # Parents come before children
+        else:
+            i_entries = range(len(entries))
+            stop_entries = []
+
+        # Get records (in one query per feature type)
+        urns = [entries[i_entry][0] for i_entry in i_entries]
+        recs = {}
+        for rec in self.caching_view.getRecs(urns):
+            recs[rec._urn()] = rec
+
+        self.progress(6, "Building trace result:", len(urns), "nodes")
+
+        # Build nodes (skipping those whose record has gone)
+        nodes = {}
+
+        for i_entry in i_entries:
+            urn, dist, i_parent_entry, full_dist, partial, cost = entries[i_entry]
+
+            rec = recs.get(urn)
+            if rec is None:
+                self.progress(5, "  No such feature:", urn)
+                continue
+
+            parent = None
+            if i_parent_entry is not None:
+                parent = nodes.get(i_parent_entry)
+                if parent is None:
+                    continue
+
+            node = nodes[i_entry] = self._traceNodeFor(rec, entries[i_entry], parent)
+
+            if parent:
+                parent.children.append(node)
+
+        stop_nodes = [nodes[i_entry] for i_entry in stop_entries if i_entry in nodes]
+
+        return nodes.get(0), stop_nodes
+
+    def _traceNodeFor(self, rec, entry, parent):
+        """
+        Build MywTraceNode for feature REC from trace result ENTRY (see _traceGraph())
+        """
+
+        urn, dist, i_parent_entry, full_dist, partial, cost = entry
+
+        if parent is None:
+            node = MywTraceNode(rec, dist)
+        else:
+            node = MywTraceNode(rec, full_dist, parent)
+            if partial:
+                node.stopAt(dist)
+
+        node.cost = cost
+
+        return node
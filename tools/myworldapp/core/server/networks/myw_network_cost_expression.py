@@ -0,0 +1,138 @@
+################################################################################
+# Parser for network cost expressions
+################################################################################
+# Copyright: IQGeo Limited 2010-2023
+
+import re
+import ast
+import operator
+
+from myworldapp.core.server.base.core.myw_error import MywError
+
+
+class MywNetworkCostExpression:
+    """
+    Helper to parse a network cost expression
+
+    A cost expression gives the cost of tracing through a feature. It is an
+    arithmetic expression over field refs, numeric literals and the
+    pseudo-field {length} (the trace length of the feature, in m) e.g.
+        {length} * 1.5
+        {length} / [speed] + [delay]
+        max([impedance], 1)
+
+    Supports operators + - * / and brackets, and functions min() and max().
+    Null field values are treated as 0. Division by zero gives an infinite
+    cost (i.e. the feature cannot be traced through)"""
+
+    # Binary operators permitted
+    bin_op_procs = {
+        ast.Add: operator.add,
+        ast.Sub: operator.sub,
+        ast.Mult: operator.mul,
+        ast.Div: operator.truediv,
+    }
+
+    # Functions permitted
+    func_procs = {"min": min, "max": max}
+
+    # Regexps for field and pseudo-field refs
+    field_regex = re.compile(r"\[\s*(\w+)\s*\]")
+    length_regex = re.compile(r"\{\s*length\s*\}")
+
+    def __init__(self, expr):
+        """
+        Create a parser for expression string EXPR
+        """
+
+        self.expr = expr
+
+    def compile(self):
+        """
+        Self as a python function PROC(REC,LENGTH) -> float
+
+        Raises MywError if the expression is malformed"""
+
+        # Convert refs to python names
+        py_expr = self.field_regex.sub(r"__field_\1", self.expr)
+        py_expr = self.length_regex.sub("__length", py_expr)
+
+        # Parse it
+        try:
+            tree = ast.parse(py_expr.strip(), mode="eval")
+        except SyntaxError:
+            raise MywError("Bad cost expression:", self.expr)
+
+        return self._compileNode(tree.body)
+
+    def fields(self):
+        """
+        Names of the fields in self's expression (sorted)
+        """
+
+        return sorted(set(self.field_regex.findall(self.expr)))
+
+    def _compileNode(self, node):
+        """
+        Python function PROC(REC,LENGTH) computing parse node NODE (recursive)
+        """
+
+        # Case: Literal
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            value = float(node.value)
+            return lambda rec, length: value
+
+        # Case: Field or pseudo-field
+        if isinstance(node, ast.Name):
+            if node.id == "__length":
+                return lambda rec, length: length
+
+            if node.id.startswith("__field_"):
+                field_name = node.id[len("__field_") :]
+                return lambda rec, length: float(getattr(rec, field_name) or 0.0)
+
+        # Case: Operator
+        if isinstance(node, ast.BinOp) and type(node.op) in self.bin_op_procs:
+            op_proc = self.bin_op_procs[type(node.op)]
+            left = self._compileNode(node.left)
+            right = self._compileNode(node.right)
+
+            if op_proc is operator.truediv:
+                return lambda rec, length: self._divide(left(rec, length), right(rec, length))
+
+            return lambda rec, length: op_proc(left(rec, length), right(rec, length))
+
+        # Case: Negation
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self._compileNode(node.operand)
+
+            if isinstance(node.op, ast.USub):
+                return lambda rec, length: -operand(rec, length)
+
+            return operand
+
+        # Case: Function
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in self.func_procs
+            and node.args
+            and not node.keywords
+        ):
+            func_proc = self.func_procs[node.func.id]
+            args = [self._compileNode(arg) for arg in node.args]
+
+            return lambda rec, length: func_proc(arg(rec, length) for arg in args)
+
+        raise MywError("Bad cost expression:", self.expr)
+
+    @staticmethod
+    def _divide(num, denom):
+        """
+        NUM / DENOM (infinite if DENOM is 0)
+        """
+
+        if not denom:
+            return float("inf")
+
+        return num / denom
@@ -4,7 +4,8 @@
 # Copyright: IQGeo Limited 2010-2023
 
 from abc import ABC, abstractmethod
-from heapq import heappush, heappop
+from heapq import heappush, heappop, nsmallest
+from collections import OrderedDict
 
 import os
 from myworldapp.core.server.base.system.myw_product import MywProduct
@@ -15,6 +16,8 @@ from myworldapp.core.server.base.db.myw_filter_parser import MywFilterParser
 
 from myworldapp.core.server.dd.myw_reference import MywReference
 
+from .myw_network_cost_expression import MywNetworkCostExpression
+
 
 class MywNetworkEngine(ABC):
     """
@@ -34,11 +37,14 @@ class MywNetworkEngine(ABC):
       traceOut(self,from_urn,direction,max_dist)
       shortestPath(self,from_urn,to_urn,max_dist)
       lengthOf(feature_rec)
+      costOf(feature_rec,length)
+      prefetchConnections(self,nodes,direction)
       euclidean"""
 
     product = MywProduct()  # Used for finding engine classes
     engine_classes = {}  # Cache of engine classes
     euclidean = True  # Controls whether A* optimisation using great circle distances can be enabled
+    frontier_batch_size = 200  # Number of wavefront nodes to read connections for in one go (0 to disable)
 
     # ==============================================================================
     #                                    CLASS METHODS
@@ -132,11 +138,14 @@ class MywNetworkEngine(ABC):
         self._length_scale = None  # Init lazily
 
         self._buildPredicates()
+        self._buildCostProcs()
 
     def _buildPredicates(self):
         """
         Compile predicate for each feature type
-        """
+
+        Sets self.predicates, a dict of PROC(REC) -> bool functions
+        (see MywDbPredicate.compile()), keyed by feature type"""
 
         self.predicates = {}
 
@@ -156,10 +165,27 @@ class MywNetworkEngine(ABC):
 
             # Compile it
             if combined_filter:
-                self.predicates[feature_type] = MywFilterParser(
+                pred = MywFilterParser(
                     combined_filter, self.progress
                 ).parse()  # ENH: Modify progress level
 
+                self.predicates[feature_type] = pred.compile()
+
+    def _buildCostProcs(self):
+        """
+        Compile cost expression for each feature type
+
+        Sets self.cost_procs, a dict of PROC(REC,LENGTH) -> float functions
+        (see MywNetworkCostExpression.compile()), keyed by feature type"""
+
+        self.cost_procs = {}
+
+        for feature_type, props in list(self.network_def["feature_types"].items()):
+            cost_expr = props.get("cost")
+
+            if cost_expr:
+                self.cost_procs[feature_type] = MywNetworkCostExpression(cost_expr).compile()
+
     @property
     def length_scale(self):
         """
@@ -194,6 +220,19 @@ class MywNetworkEngine(ABC):
 
         raise NotImplementedError()
 
+    def prefetchConnections(self, nodes, direction):
+        """
+        Read the records that connectedNodes() will need for NODES into the cache
+
+        Called by the trace with the next nodes of the wavefront (in distance
+        order) before they are expanded. Should read records in one query per
+        feature type (see prefetchFeatureRecs()). Must not change the result
+        of connectedNodes()
+
+        Default implementation does nothing"""
+
+        pass
+
     # ==============================================================================
     #                                  TRACING OPS
     # ==============================================================================
@@ -229,22 +268,56 @@ class MywNetworkEngine(ABC):
 
         return root_node.tidy()
 
+    def traceOutNodes(self, from_urn, direction="both", max_dist=None, max_nodes=None):
+        """
+        Find objects reachable from FROM_URN, yielding trace nodes as they are reached
+
+        Args are as for traceOut(). Yields MywTraceNodes in distance order,
+        starting with the root node. Nodes reference their parent but are not
+        added to its children, so memory use is proportional to the size of
+        the wavefront rather than the whole result.
+
+        Note: Nodes are not post-processed (see MywTraceNode.tidy())"""
+
+        self.progress(
+            2,
+            "Streaming trace from",
+            from_urn,
+            ":",
+            "direction=",
+            direction,
+            ":",
+            "max_dist=",
+            max_dist,
+        )
+
+        return self._traceNodes(
+            from_urn, direction, max_dist=max_dist, max_nodes=max_nodes, build_tree=False
+        )
+
     def shortestPath(self, from_urn, to_urn, max_dist=None, max_nodes=None):
         """
         Find shortest path from FROM_URN to TO_URN (if there is one)
 
-        Optional MAX_DIST is maximum distance to trace for (in metres)
+        TO_URN can also be a list of URNs, in which case the path to
+        the nearest of them is found. Path length is measured using
+        the network's cost expressions (if configured). Optional
+        MAX_DIST is maximum distance to trace for (in metres)
 
         Returns a MywTraceNode tree"""
 
-        # ENH: Support multiple targets, predicate targets
-        # ENH: Support cost function, A* cost estimator
+        # ENH: Support predicate targets
 
-        self.progress(2, "Finding path", from_urn, "->", to_urn)
+        if isinstance(to_urn, str):
+            to_urns = [to_urn]
+        else:
+            to_urns = list(to_urn)
+
+        self.progress(2, "Finding path", from_urn, "->", *to_urns)
 
         # Do trace out
         (from_node, to_node) = self._trace(
-            from_urn, "both", stop_urns=[to_urn], max_dist=max_dist, max_nodes=max_nodes
+            from_urn, "both", stop_urns=to_urns, max_dist=max_dist, max_nodes=max_nodes
         )
 
         # Get path from -> to
@@ -253,25 +326,159 @@ class MywNetworkEngine(ABC):
 
         return to_node.pruneToRootPath().tidy()
 
-    def _trace(self, from_urn, direction, stop_urns=[], max_dist=None, max_nodes=None):
+    def shortestPaths(
+        self, from_urns, to_urns=None, direction="both", max_dist=None, max_nodes=None
+    ):
+        """
+        Find shortest paths from each of FROM_URNS to each of TO_URNS
+
+        If TO_URNS is omitted, finds paths to all objects reachable. Other args
+        are as for traceOut(). Start objects that do not exist are skipped
+
+        Returns a dict of dicts of (DIST,COST,PATH) tuples (see pathCosts()), keyed
+        by start URN then end URN"""
+
+        self.progress(2, "Finding paths from", len(from_urns), "objects")
+
+        self.prefetchFeatureRecs(from_urns)
+
+        paths = OrderedDict()
+        for from_urn in from_urns:
+            if not self.featureRecFor(from_urn):
+                continue
+
+            paths[from_urn] = self.pathCosts(
+                from_urn, to_urns, direction, max_dist=max_dist, max_nodes=max_nodes
+            )
+
+        return paths
+
+    def pathCosts(self, from_urn, to_urns=None, direction="both", max_dist=None, max_nodes=None):
+        """
+        Find shortest paths from FROM_URN to each of TO_URNS
+
+        If TO_URNS is omitted, finds paths to all objects reachable. Other args
+        are as for traceOut()
+
+        Returns a dict of tuples, keyed by URN of the objects found:
+          DIST   Distance along path (in m)
+          COST   Cost of path (as per network cost expressions)
+          PATH   URNs of the path objects (starting with FROM_URN)"""
+
+        if to_urns is not None and not to_urns:
+            return OrderedDict()
+
+        # Case: Specified targets
+        if to_urns is not None:
+            found_nodes = OrderedDict()
+            self._trace(
+                from_urn,
+                direction,
+                stop_urns=to_urns,
+                max_dist=max_dist,
+                max_nodes=max_nodes,
+                found_nodes=found_nodes,
+            )
+            nodes = list(found_nodes.values())
+
+        # Case: Everything reachable
+        else:
+            (root_node, stop_node) = self._trace(
+                from_urn, direction, max_dist=max_dist, max_nodes=max_nodes
+            )
+            nodes = root_node.subTreeNodes()
+
+        # Build result
+        paths = OrderedDict()
+        for node in nodes:
+            urn = node.feature._urn()
+
+            if not urn in paths:
+                path = [path_node.feature._urn() for path_node in node.pathToRoot()]
+                paths[urn] = (node.dist, node.cost, list(reversed(path)))
+
+        return paths
+
+    def _trace(
+        self, from_urn, direction, stop_urns=[], max_dist=None, max_nodes=None, found_nodes=None
+    ):
         """
-        Find objects reachable from FROM_URN (in distance order)
+        Find objects reachable from FROM_URN (in cost order)
 
         Optional MAX_DIST is distance at which to stop tracing (in
         metres). Optional STOP_URNS is a list of feature urns we are
         trying to find. Tracing terminates when one of these is encourtered.
 
+        If optional dict FOUND_NODES is supplied, tracing continues until all
+        of STOP_URNS have been found instead. The nodes found are added to it,
+        keyed by URN.
+
         Returns MywTraceNodes:
          ROOT_NODE   The node from which tracing started
          STOP_NODE   The node which caused tracing to stop (if any)"""
 
+        stop_urns = set(stop_urns)
+        root_node = None
+
+        # Note: Great circle distance is only valid for finding the nearest stop node
+        nodes = self._traceNodes(
+            from_urn,
+            direction,
+            stop_urns=stop_urns,
+            max_dist=max_dist,
+            max_nodes=max_nodes,
+            use_estimator=found_nodes is None,
+        )
+
+        for node in nodes:
+            if root_node is None:
+                root_node = node
+
+            # Check for found stop node
+            node_urn = node.feature._urn()
+            if node_urn in stop_urns:
+                if found_nodes is None:
+                    return root_node, node
+
+                found_nodes[node_urn] = node
+                if len(found_nodes) == len(stop_urns):
+                    return root_node, None
+
+        return root_node, None
+
+    def _traceNodes(
+        self,
+        from_urn,
+        direction,
+        stop_urns=[],
+        max_dist=None,
+        max_nodes=None,
+        use_estimator=True,
+        build_tree=True,
+    ):
+        """
+        Find objects reachable from FROM_URN, yielding trace nodes as they are reached
+
+        Yields MywTraceNodes in cost order (the order in which they are
+        taken from the wavefront), starting with the root node. Partial
+        nodes are yielded but not traced beyond.
+
+        If USE_ESTIMATOR is True, orders nodes using great circle
+        distance to STOP_URNS (A* algorithm). If BUILD_TREE is False,
+        nodes are not added to their parent's children"""
+
         # ENH: Support start from specified location along FROM_URN
         # ENH: Make ordering by distance optional (for speed)
 
         active_nodes = []  # MywTraceNodes in the 'wave front'
         visited_nodes = set()  # Paths we have encountered so far
+        prefetched_nodes = set()  # Ids of wavefront nodes whose connections have been read
+
+        # Note: Great circle distance is only a lower bound on cost if cost is length
+        use_estimator = use_estimator and self.euclidean and not self.cost_procs
+        stop_geoms = None
 
-        if self.euclidean:
+        if use_estimator:
             # Get stop geoms to use when calculating node to end point distances for A*
             stop_geoms = self._stop_geoms(stop_urns)
 
@@ -285,17 +492,19 @@ class MywNetworkEngine(ABC):
 
             # Move to next closest node
             node = heappop(active_nodes)
-            node_urn = node.feature._urn()
             self.progress(4, "Processing:", node)
 
-            # Check for found stop node
-            if node_urn in stop_urns:
-                return root_node, node
+            yield node
 
             # Check for node beyond distance limit
             if node.partial:
                 continue
 
+            # Read connections for next band of wavefront (in one go)
+            if self.frontier_batch_size and not id(node) in prefetched_nodes:
+                self._prefetchFrontier(node, active_nodes, prefetched_nodes, direction)
+            prefetched_nodes.discard(id(node))
+
             # Add end nodes of connected items to wavefront
             for conn_node in self.connectedNodes(node, direction, root_node):
                 self.progress(5, "  Connection:", conn_node)
@@ -305,6 +514,12 @@ class MywNetworkEngine(ABC):
                     self.progress(8, "  Already visited")
                     continue
 
+                # Compute cost to reach it (if not just length)
+                if self.cost_procs:
+                    conn_node.cost = node.cost + self.costOf(
+                        conn_node.feature, conn_node.dist - node.dist
+                    )
+
                 # Check for end beyond distance limit
                 # Note: This may change the node_id
                 if max_dist and conn_node.dist > max_dist:
@@ -323,16 +538,34 @@ class MywNetworkEngine(ABC):
                 self.progress(6, "  Activating:", conn_node)
 
                 # Include distance to stop nodes as part of A* algrorithm
-                if self.euclidean and stop_geoms:
+                if use_estimator and stop_geoms:
                     conn_node.min_possible_dist = conn_node.dist + conn_node.minDistanceTo(
                         stop_geoms
                     )
 
                 heappush(active_nodes, conn_node)
 
-                node.children.append(conn_node)
+                if build_tree:
+                    node.children.append(conn_node)
 
-        return root_node, None
+    def _prefetchFrontier(self, node, active_nodes, prefetched_nodes, direction):
+        """
+        Read the connections of NODE and the nodes that follow it in ACTIVE_NODES
+
+        Takes up to .frontier_batch_size nodes in distance order. PREFETCHED_NODES
+        is the set of ids of nodes already processed (updated)"""
+
+        frontier = [node] + nsmallest(self.frontier_batch_size - 1, active_nodes)
+        frontier = [
+            f_node
+            for f_node in frontier
+            if not f_node.partial and not id(f_node) in prefetched_nodes
+        ]
+
+        prefetched_nodes.update(id(f_node) for f_node in frontier)
+
+        self.progress(6, "Reading connections for", len(frontier), "nodes")
+        self.prefetchConnections(frontier, direction)
 
     # ==============================================================================
     #                                   HELPERS
@@ -364,6 +597,19 @@ class MywNetworkEngine(ABC):
 
         return rec
 
+    def prefetchFeatureRecs(self, urns):
+        """
+        Read the feature records for URNS into the cache (where not already present)
+
+        Reads each feature type in a single query, making subsequent calls
+        to featureRecFor() for these URNs cheap"""
+
+        try:
+            self.caching_view.prefetch(urns)
+
+        except MywError as cond:  # Missing table etc .. will get reported by featureRecFor()
+            self.progress(8, "  Prefetch failed:", cond)
+
     def includes(self, rec):
         """
         True if feature REC is in self
@@ -378,7 +624,7 @@ class MywNetworkEngine(ABC):
         if pred is None:
             return True
 
-        return pred.matches(rec)
+        return pred(rec)
 
     def lengthOf(self, feature_rec):
         """
@@ -399,6 +645,24 @@ class MywNetworkEngine(ABC):
         self.progress(10, feature_rec, "Computed length:", length)
         return length
 
+    def costOf(self, feature_rec, length):
+        """
+        Cost of tracing through FEATURE_REC
+
+        LENGTH is the trace length of FEATURE_REC (in m). Uses the cost
+        expression configured for the feature type (if there is one)
+
+        Negative and null costs are treated as 0"""
+
+        proc = self.cost_procs.get(feature_rec.feature_type)
+        if proc is None:
+            return length
+
+        cost = proc(feature_rec, length)
+        self.progress(10, feature_rec, "Computed cost:", cost)
+
+        return max(cost or 0.0, 0.0)
+
     def featureProp(self, feature_rec, prop, unit=None):
         """
         The value of FEATURE_REC's configured property PROP (if set)
@@ -472,6 +736,8 @@ class MywNetworkEngine(ABC):
         Returns geometries for STOP_URNS
         """
 
+        self.prefetchFeatureRecs(stop_urns)
+
         stop_geoms = []
         for stop_urn in stop_urns:
             stop_ftr = self.featureRecFor(stop_urn)
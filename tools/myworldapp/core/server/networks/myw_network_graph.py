@@ -0,0 +1,690 @@
+################################################################################
+# In-memory connectivity graph for a network
+################################################################################
+# Copyright: IQGeo Limited 2010-2023
+
+import json
+import time
+import threading
+from array import array
+
+from myworldapp.core.server.base.core.myw_bounded_cache import MywBoundedCache
+from myworldapp.core.server.base.core.myw_error import MywError
+from myworldapp.core.server.database.myw_transaction_log_cursor import MywTransactionLogCursor
+
+# Node flags
+NODE_EXISTS = 1  # Feature record exists
+NODE_INCLUDED = 2  # Feature passes network filter
+
+# Edge direction flags
+EDGE_UPSTREAM = 1  # From upstream field
+EDGE_DOWNSTREAM = 2  # From downstream field
+
+
+class MywNetworkGraph:
+    """
+    Compact in-memory connectivity graph for a 'simple graph' network
+
+    Holds one node per feature of the network's feature types (plus
+    placeholders for referenced features that do not exist). For each
+    node stores:
+      .lengths     Trace length of the feature (in m)
+      .costs       Cost of tracing through the feature (see MywNetworkEngine.costOf())
+      .flags       NODE_EXISTS, NODE_INCLUDED
+
+    Outgoing edges are held in .csr, a tuple of:
+      OFFSETS      Start of each node's outgoing edges in TARGETS (CSR format)
+      TARGETS      Indices of the nodes referenced by its upstream and downstream fields
+      DIRECTIONS   EDGE_UPSTREAM / EDGE_DOWNSTREAM flags for each edge
+      OVERRIDES    Edges of nodes whose connections have changed since the arrays were built
+
+    Incoming edges are held in the same way (in .rev_csr) for use in
+    bidirectional searches. Each is replaced as a whole when rebuilt (so
+    readers never see a mix of old and new arrays).
+
+    Built once from master data (see .graphFor()) and then kept current by
+    applying entries from the transaction log (see .refresh()). Changed
+    connections are held as overrides until the graph is compacted.
+
+    Changes in a delta are applied as an overlay (see .overlayFor())"""
+
+    # Shared instances, keyed by database and network name
+    instances = {}
+    instances_lock = threading.Lock()
+
+    # Min time between checks for data changes (in seconds)
+    check_interval = 1.0
+
+    # Max time to wait for in-progress transactions when building (in seconds)
+    wait_timeout = 5
+
+    # Proportion of nodes with overridden adjacency at which CSR arrays are rebuilt
+    compact_threshold = 0.1
+
+    @classmethod
+    def graphFor(cls, engine):
+        """
+        The shared graph for the network of ENGINE (a MywGraphNetworkEngine), built if necessary
+
+        ENGINE is used for reading records and computing lengths and filters. Returns
+        None if the network cannot be represented (e.g. uses calculated reference fields)"""
+
+        db = engine.caching_view.db
+        network_def = engine.network_def
+
+        key = (repr(db.session.get_bind().url), network_def["name"])
+        def_ident = json.dumps(network_def, sort_keys=True, default=str)
+
+        with cls.instances_lock:
+            graph = cls.instances.get(key)
+
+            if graph is None or graph.def_ident != def_ident:
+                graph = cls.instances[key] = cls(network_def, def_ident, engine.progress)
+
+        if not graph.build(engine):
+            return None
+
+        return graph
+
+    def __init__(self, network_def, def_ident, progress):
+        """
+        Init slots of self
+
+        NETWORK_DEF is a dict of network properties (as returned by MywNetwork.definition())"""
+
+        self.network_def = network_def
+        self.def_ident = def_ident
+        self.progress = progress
+
+        self.lock = threading.RLock()
+        self.built = False
+        self.supported = True
+        self.log_cursor = None  # Master transaction log entries applied (a MywTransactionLogCursor)
+        self.revision = 0  # Incremented when master changes are applied
+        self.last_check = 0.0
+
+        # Nodes
+        self.node_index = {}  # Node index, keyed by feature URN
+        self.urns = []  # Feature URN of each node
+        self.lengths = array("d")
+        self.costs = array("d")
+        self.flags = bytearray()
+
+        # Edges (overrides are (targets,directions) tuples, keyed by node index)
+        self.csr = (array("q", [0]), array("q"), bytearray(), {})
+
+        # Incoming edges (overrides are (sources,directions) tuples, keyed by node index)
+        self.rev_csr = (array("q", [0]), array("q"), bytearray(), {})
+
+        # Delta overlays
+        self.overlays = MywBoundedCache(max_size=20)
+        self.delta_logs = {}  # (check time, cursor, revision) tuples, keyed by delta name
+
+    # ==============================================================================
+    #                                  BUILDING
+    # ==============================================================================
+
+    def build(self, engine):
+        """
+        Build self from the master data of ENGINE's database (if not already built)
+
+        Returns False if self's network cannot be represented"""
+
+        with self.lock:
+            if self.built:
+                return self.supported
+
+            db = engine.caching_view.db
+            self.progress(1, "Building network graph:", self.network_def["name"])
+
+            # Check for unsupported configuration
+            for feature_type in self.network_def["feature_types"]:
+                for field_name in self._connectionFieldNames(engine, feature_type):
+                    table = db.view().table(feature_type, error_if_none=False)
+                    field_desc = table.descriptor.fields.get(field_name) if table else None
+
+                    if field_desc and not field_desc.isStored():
+                        self.progress(
+                            1, "Network uses calculated field:", feature_type, field_name
+                        )
+                        self.supported = False
+
+            if not self.supported:
+                self.built = True
+                return False
+
+            # Find log position (waiting for in-progress changes to complete)
+            try:
+                log_id = MywTransactionLogCursor.finalPosition(db, timeout=self.wait_timeout)
+            except MywError as cond:
+                self.progress("warning", "Cannot build network graph:", cond)
+                return False
+
+            # Read data
+            self.log_cursor = MywTransactionLogCursor("transaction_log", log_id)
+            master_engine = self._masterEngineFor(db)
+            adjacency = []
+
+            for feature_type in self.network_def["feature_types"]:
+                table = db.view().table(feature_type, error_if_none=False)
+                if not table:
+                    continue
+
+                for rec in table:
+                    i_node = self._nodeIndexFor(rec._urn())
+                    length, cost, flags, targets, directions = self._nodeDataFor(
+                        master_engine, rec
+                    )
+
+                    self.lengths[i_node] = length
+                    self.costs[i_node] = cost
+                    self.flags[i_node] = flags
+                    adjacency.append((i_node, targets, directions))
+
+            self._buildCsr(dict((i_node, (t, d)) for i_node, t, d in adjacency))
+
+            self.built = True
+            self.last_check = time.time()
+            self.progress(
+                1, "Built network graph:", len(self.urns), "nodes", len(self.csr[1]), "edges"
+            )
+
+            return True
+
+    def _masterEngineFor(self, db):
+        """
+        Engine for computing node data from records of DB (a MywGraphNetworkEngine)
+        """
+
+        from .myw_graph_network_engine import MywGraphNetworkEngine
+
+        return MywGraphNetworkEngine(db.view(), self.network_def, progress=self.progress)
+
+    def _buildCsr(self, adjacency):
+        """
+        Rebuild self's CSR arrays from ADJACENCY
+
+        ADJACENCY is a dict of (targets,directions) tuples, keyed by node index.
+        Nodes not in ADJACENCY take their edges from the current arrays.
+        Also rebuilds the incoming edge arrays. Must be called holding self.lock"""
+
+        offsets = array("q", [0])
+        targets = array("q")
+        directions = bytearray()
+
+        for i_node in range(len(self.urns)):
+            if i_node in adjacency:
+                node_targets, node_directions = adjacency[i_node]
+            else:
+                node_targets, node_directions = self._edgesOf(i_node)
+
+            targets.extend(node_targets)
+            directions.extend(node_directions)
+            offsets.append(len(targets))
+
+        # Note: Old and new incoming edges describe the same connections, so can swap them separately
+        self.csr = (offsets, targets, directions, {})
+        self.rev_csr = self._reverseCsrFor(offsets, targets, directions)
+
+    def _reverseCsrFor(self, offsets, targets, directions):
+        """
+        Incoming edge arrays for outgoing edge arrays OFFSETS, TARGETS and DIRECTIONS
+
+        Returns a tuple (REV_OFFSETS, REV_SOURCES, REV_DIRECTIONS, REV_OVERRIDES)"""
+
+        n_nodes = len(self.urns)
+
+        # Count incoming edges of each node
+        rev_offsets = array("q", [0]) * (n_nodes + 1)
+        for i_target in targets:
+            rev_offsets[i_target + 1] += 1
+
+        for i_node in range(n_nodes):
+            rev_offsets[i_node + 1] += rev_offsets[i_node]
+
+        # Fill them in
+        rev_sources = array("q", [0]) * len(targets)
+        rev_directions = bytearray(len(targets))
+        next_pos = array("q", rev_offsets)
+
+        for i_node in range(n_nodes):
+            for pos in range(offsets[i_node], offsets[i_node + 1]):
+                i_target = targets[pos]
+                rev_pos = next_pos[i_target]
+                rev_sources[rev_pos] = i_node
+                rev_directions[rev_pos] = directions[pos]
+                next_pos[i_target] = rev_pos + 1
+
+        return (rev_offsets, rev_sources, rev_directions, {})
+
+    def _nodeIndexFor(self, urn):
+        """
+        Index of node for URN (creating a placeholder if necessary)
+        """
+
+        i_node = self.node_index.get(urn)
+
+        if i_node is None:
+            i_node = self.node_index[urn] = len(self.urns)
+            self.urns.append(urn)
+            self.lengths.append(0.0)
+            self.costs.append(0.0)
+            self.flags.append(0)
+
+            for offsets in (self.csr[0], self.rev_csr[0]):
+                offsets.append(offsets[-1])
+
+        return i_node
+
+    def _nodeDataFor(self, engine, rec, index_proc=None):
+        """
+        Node data for feature REC
+
+        INDEX_PROC is used to map URNs to node indices (default: self._nodeIndexFor)
+
+        Returns:
+          LENGTH      Trace length of REC
+          COST        Cost of tracing through REC
+          FLAGS       NODE_XX flags
+          TARGETS     Node indices of features referenced by REC
+          DIRECTIONS  EDGE_XX flags for TARGETS"""
+
+        index_proc = index_proc or self._nodeIndexFor
+
+        flags = NODE_EXISTS
+        if engine.includes(rec):
+            flags |= NODE_INCLUDED
+
+        length = engine.lengthOf(rec)
+        cost = engine.costOf(rec, length)
+
+        # Determine fields holding connections
+        upstream_field = engine.featurePropFieldName(rec.feature_type, "upstream")
+        downstream_field = engine.featurePropFieldName(rec.feature_type, "downstream")
+
+        if upstream_field and upstream_field == downstream_field:
+            fields = [(upstream_field, EDGE_UPSTREAM | EDGE_DOWNSTREAM)]
+        else:
+            fields = [(upstream_field, EDGE_UPSTREAM), (downstream_field, EDGE_DOWNSTREAM)]
+
+        # Get connections (preserving order, as per MywGraphNetworkEngine.connectedFeaturesFor())
+        network_feature_types = self.network_def["feature_types"]
+        targets = []
+        directions = []
+
+        for field_name, direction in fields:
+            if not field_name:
+                continue
+
+            field_targets = set()
+
+            for ref in rec._field(field_name).refs():
+                if ref.datasource != "myworld" or not ref.feature_type in network_feature_types:
+                    continue
+
+                i_target = index_proc(ref.urn(include_qualifiers=False))
+
+                if i_target in field_targets:
+                    continue
+                field_targets.add(i_target)
+
+                targets.append(i_target)
+                directions.append(direction)
+
+        return length, cost, flags, targets, directions
+
+    def _connectionFieldNames(self, engine, feature_type):
+        """
+        Names of the fields of FEATURE_TYPE that hold connections
+        """
+
+        names = []
+        for prop in ["upstream", "downstream"]:
+            field_name = engine.featurePropFieldName(feature_type, prop)
+            if field_name:
+                names.append(field_name)
+
+        return names
+
+    # ==============================================================================
+    #                                  REFRESH
+    # ==============================================================================
+
+    def refresh(self, db):
+        """
+        Apply changes made to master data since self was last updated
+
+        Checks at most once every .check_interval seconds"""
+
+        now = time.time()
+
+        with self.lock:
+            if now - self.last_check < self.check_interval:
+                return
+            self.last_check = now
+
+            # Find changed features
+            # Note: Uses log entries rather than data version, as feature edits don't advance it
+            driver = db.db_driver
+            filter_sql = "feature_type IN ({})".format(
+                ", ".join(
+                    "'{}'".format(driver.sqlEscape(feature_type))
+                    for feature_type in self.network_def["feature_types"]
+                )
+            )
+
+            changes = {}  # Changed feature ids, keyed by feature type
+            for row in self.log_cursor.read(db, ["feature_type", "feature_id"], filter_sql):
+                changes.setdefault(row[1], set()).add(row[2])
+
+            if not changes:
+                return
+
+            self.progress(
+                2,
+                "Network graph",
+                self.network_def["name"],
+                ":",
+                sum(len(ids) for ids in changes.values()),
+                "changes",
+            )
+
+            # Apply them
+            # Note: Re-reads current state, so entries can be applied in any order (and more than once)
+            engine = self._masterEngineFor(db)
+
+            for feature_type, ids in changes.items():
+                table = db.view().table(feature_type, error_if_none=False)
+                recs = table.getRecs(list(ids)) if table else []
+
+                # Mark changed features as deleted ...
+                for id in ids:
+                    i_node = self._nodeIndexFor("{}/{}".format(feature_type, id))
+                    self.flags[i_node] = 0
+                    self._setEdges(i_node, [], [])
+
+                # ... then set data for those that exist
+                for rec in recs:
+                    i_node = self._nodeIndexFor(rec._urn())
+                    length, cost, flags, targets, directions = self._nodeDataFor(engine, rec)
+
+                    self.lengths[i_node] = length
+                    self.costs[i_node] = cost
+                    self.flags[i_node] = flags
+                    self._setEdges(i_node, targets, directions)
+
+            self.revision += 1
+
+            # Rebuild arrays (if necessary)
+            adjacency_overrides = self.csr[3]
+            if len(adjacency_overrides) > self.compact_threshold * len(self.urns):
+                self._buildCsr(adjacency_overrides)
+
+    def _setEdges(self, i_node, targets, directions):
+        """
+        Set the outgoing edges of master node I_NODE (updating incoming edges of the nodes affected)
+        """
+
+        old_targets, old_directions = self._edgesOf(i_node)
+
+        self._updateReverseEdges(
+            i_node, old_targets, targets, directions, self._reverseEdgesOf, self.rev_csr[3]
+        )
+
+        self.csr[3][i_node] = (targets, directions)
+
+    def _updateReverseEdges(
+        self, i_node, old_targets, targets, directions, reverse_proc, reverse_overrides
+    ):
+        """
+        Update incoming edges for a change to the outgoing edges of node I_NODE
+
+        OLD_TARGETS are the nodes it previously connected to. REVERSE_PROC(I_NODE)
+        returns the current incoming edges of a node. New incoming edges are
+        stored in REVERSE_OVERRIDES"""
+
+        for i_target in set(old_targets) | set(targets):
+            sources, source_directions = reverse_proc(i_target)
+
+            new_sources = []
+            new_directions = []
+
+            for i_source, direction in zip(sources, source_directions):
+                if i_source != i_node:
+                    new_sources.append(i_source)
+                    new_directions.append(direction)
+
+            for i_node_target, direction in zip(targets, directions):
+                if i_node_target == i_target:
+                    new_sources.append(i_node)
+                    new_directions.append(direction)
+
+            reverse_overrides[i_target] = (new_sources, new_directions)
+
+    # ==============================================================================
+    #                                   ACCESS
+    # ==============================================================================
+
+    def _edgesOf(self, i_node):
+        """
+        Outgoing edges of master node I_NODE
+
+        Returns (TARGETS, DIRECTIONS)"""
+
+        offsets, targets, directions, overrides = self.csr
+
+        override = overrides.get(i_node)
+        if override is not None:
+            return override
+
+        if i_node + 1 >= len(offsets):
+            return (), ()
+
+        start = offsets[i_node]
+        end = offsets[i_node + 1]
+
+        return targets[start:end], directions[start:end]
+
+    def _reverseEdgesOf(self, i_node):
+        """
+        Incoming edges of master node I_NODE
+
+        Returns (SOURCES, DIRECTIONS)"""
+
+        rev_offsets, rev_sources, rev_directions, overrides = self.rev_csr
+
+        override = overrides.get(i_node)
+        if override is not None:
+            return override
+
+        if i_node < 0 or i_node + 1 >= len(rev_offsets):
+            return (), ()
+
+        start = rev_offsets[i_node]
+        end = rev_offsets[i_node + 1]
+
+        return rev_sources[start:end], rev_directions[start:end]
+
+    def nodeFor(self, urn, overlay=None):
+        """
+        Index of the node for feature URN (None if not known)
+        """
+
+        if overlay is not None:
+            i_node = overlay.node_index.get(urn)
+            if i_node is not None:
+                return i_node
+
+        return self.node_index.get(urn)
+
+    def nodeInfo(self, i_node, overlay=None):
+        """
+        Data for node I_NODE
+
+        Returns (URN, LENGTH, COST, FLAGS, TARGETS, DIRECTIONS)"""
+
+        # Case: Changed in delta
+        if overlay is not None:
+            info = overlay.nodes.get(i_node)
+            if info is not None:
+                return info
+
+        # Case: Master
+        targets, directions = self._edgesOf(i_node)
+
+        return (
+            self.urns[i_node],
+            self.lengths[i_node],
+            self.costs[i_node],
+            self.flags[i_node],
+            targets,
+            directions,
+        )
+
+    def reverseEdgesOf(self, i_node, overlay=None):
+        """
+        Incoming edges of node I_NODE
+
+        Returns (SOURCES, DIRECTIONS)"""
+
+        if overlay is not None:
+            return overlay.reverseEdgesOf(i_node)
+
+        return self._reverseEdgesOf(i_node)
+
+    # ==============================================================================
+    #                                  DELTAS
+    # ==============================================================================
+
+    def overlayFor(self, db_view):
+        """
+        Overlay holding changes made in the delta of DB_VIEW (None if view is master)
+        """
+
+        if not db_view.delta:
+            return None
+
+        # Note: Overlay depends on master state too (as it holds changes to incoming edges)
+        with self.lock:
+            key = (db_view.delta, self.revision, self._deltaRevisionFor(db_view))
+
+            return self.overlays.get(key, self._buildOverlay, db_view)
+
+    def _deltaRevisionFor(self, db_view):
+        """
+        Number of checks on which new entries were found in the delta transaction log for DB_VIEW
+
+        Checks at most once every .check_interval seconds. Must be called holding self.lock"""
+
+        now = time.time()
+        checked, cursor, revision = self.delta_logs.get(
+            db_view.delta, (0.0, MywTransactionLogCursor("delta_transaction_log"), 0)
+        )
+
+        if now - checked >= self.check_interval:
+            filter_sql = "delta = '{}'".format(db_view.db.db_driver.sqlEscape(db_view.delta))
+            if cursor.read(db_view.db, [], filter_sql):
+                revision += 1
+            self.delta_logs[db_view.delta] = (now, cursor, revision)
+
+        return revision
+
+    def _buildOverlay(self, db_view):
+        """
+        Build overlay for the changes in the delta of DB_VIEW
+
+        Must be called holding self.lock"""
+
+        self.progress(2, "Building network graph overlay for delta:", db_view.delta)
+
+        overlay = MywNetworkGraphOverlay(self)
+        engine = self._masterEngineFor(db_view.db)
+
+        for feature_type in self.network_def["feature_types"]:
+            table = db_view.table(feature_type, error_if_none=False)
+            if not table or not table.versioned:
+                continue
+
+            changes = table.featureChanges()
+            if not changes:
+                continue
+
+            # Mark changed features as deleted ...
+            for id in changes:
+                urn = "{}/{}".format(feature_type, id)
+                overlay.nodes[overlay.nodeIndexFor(urn)] = (urn, 0.0, 0.0, 0, (), ())
+
+            # ... then set data for those that exist in delta
+            for rec in table.getRecs(list(changes.keys())):
+                urn = rec._urn()
+                length, cost, flags, targets, directions = self._nodeDataFor(
+                    engine, rec, index_proc=overlay.nodeIndexFor
+                )
+                overlay.nodes[overlay.nodeIndexFor(urn)] = (
+                    urn,
+                    length,
+                    cost,
+                    flags,
+                    targets,
+                    directions,
+                )
+
+        # Find changes to incoming edges
+        for i_node, (urn, length, cost, flags, targets, directions) in list(overlay.nodes.items()):
+            old_targets = self._edgesOf(i_node)[0] if i_node >= 0 else ()
+
+            self._updateReverseEdges(
+                i_node,
+                old_targets,
+                targets,
+                directions,
+                overlay.reverseEdgesOf,
+                overlay.reverse_nodes,
+            )
+
+        return overlay
+
+
+class MywNetworkGraphOverlay:
+    """
+    Changes made to a MywNetworkGraph in a delta
+
+    Nodes for features that do not exist in master are given negative indices"""
+
+    def __init__(self, graph):
+        """
+        Init slots of self
+        """
+
+        self.graph = graph
+        self.nodes = {}  # (urn,length,cost,flags,targets,directions) tuples, keyed by node index
+        self.node_index = {}  # Indices of nodes not in graph, keyed by URN
+        self.reverse_nodes = {}  # Changed incoming edges (sources,directions), keyed by node index
+
+    def nodeIndexFor(self, urn):
+        """
+        Index of node for URN (allocating a delta-only one if necessary)
+        """
+
+        i_node = self.graph.node_index.get(urn)
+        if i_node is not None:
+            return i_node
+
+        i_node = self.node_index.get(urn)
+        if i_node is None:
+            i_node = self.node_index[urn] = -(len(self.node_index) + 1)
+            self.nodes[i_node] = (urn, 0.0, 0.0, 0, (), ())
+
+        return i_node
+
+    def reverseEdgesOf(self, i_node):
+        """
+        Incoming edges of node I_NODE (taking account of changes in self)
+
+        Returns (SOURCES, DIRECTIONS)"""
+
+        override = self.reverse_nodes.get(i_node)
+        if override is not None:
+            return override
+
+        return self.graph._reverseEdgesOf(i_node)
@@ -4,6 +4,7 @@
 # Copyright: IQGeo Limited 2010-2023
 
 
+from myworldapp.core.server.base.core.myw_error import MywError
 from .myw_network_engine import MywNetworkEngine
 from .myw_topo_trace_node import MywTopoTraceNode
 
@@ -52,9 +53,13 @@ class MywTopoNetworkEngine(MywNetworkEngine):
             conn_node = MywTopoTraceNode(owner, node.dist, node.topo_node, parent=node)
             return [conn_node]
 
+        # Get connected links (and read their owners in one go)
+        topo_links = self._referencedFeatures(node.topo_node, "links")
+        self.prefetchFeatureRecs([topo_link.owner for topo_link in topo_links if topo_link.owner])
+
         # For each connected link ...
         nodes = []
-        for topo_link in self._referencedFeatures(node.topo_node, "links"):
+        for topo_link in topo_links:
 
             # Avoid going back the way we came
             if topo_link == node.topo_link:
@@ -82,6 +87,47 @@ class MywTopoNetworkEngine(MywNetworkEngine):
 
         return nodes
 
+    def prefetchConnections(self, nodes, direction):
+        """
+        Read the owners, topo links and other-end topo nodes for NODES into the cache
+
+        Reads each feature type in a single query per stage"""
+
+        # Get owners and connected links
+        urns = []
+        link_urns = []
+
+        for node in nodes:
+            if not node.topo_node:
+                continue
+
+            owner_urn = node.topo_node.owner
+            if owner_urn and owner_urn != node.feature._urn():
+                urns.append(owner_urn)
+            else:
+                link_urns += node.topo_node._field("links").urns(include_qualifiers=False)
+
+        self.prefetchFeatureRecs(urns + link_urns)
+
+        # Get owners of links and topo nodes at their other ends
+        try:
+            topo_links = self.caching_view.getRecs(link_urns, error_if_bad=False)
+        except MywError as cond:  # Missing table etc .. will get reported by connectedNodes()
+            self.progress(8, "  Prefetch failed:", cond)
+            return
+
+        urns = []
+        for topo_link in topo_links:
+            if topo_link.owner:
+                urns.append(topo_link.owner)
+
+            for fld in ["node1", "node2"]:
+                urn = topo_link._field(fld).urn(include_qualifiers=False)
+                if urn:
+                    urns.append(urn)
+
+        self.prefetchFeatureRecs(urns)
+
     def _referencedFeatures(self, feature, field_name):
         """
         Returns feature records referenced in field FIELD_NAME of FEATURE
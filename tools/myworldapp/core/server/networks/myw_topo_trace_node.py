@@ -61,6 +61,7 @@ class MywTopoTraceNode(MywTraceNode):
 
                 node.link_start_dist = node.dist
                 node.dist = child_node.dist  # ENH: Invert the copy?
+                node.cost = child_node.cost
                 node.partial = child_node.partial
                 node.full_dist = child_node.full_dist
                 node.topo_node = child_node.topo_node
@@ -18,10 +18,27 @@ class MywTraceNode:
     Has properties:
       .feature   Feature record
       .dist      Total distance to root node of trace (in m)
+      .cost      Total cost to root node of trace (as .dist unless network has cost expressions)
       .parent    Previous node in the trace tree (None for root node)
       .children  Next nodes in the trace tree
 
-    Also provides tree behaviour (see .subTree(), .pathToRoot(), ...)"""
+    Also provides tree behaviour (see .subTree(), .pathToRoot(), ...)
+
+    Uses slots to keep large traces compact (subclasses may add
+    attributes as normal)"""
+
+    __slots__ = (
+        "feature",
+        "dist",
+        "parent",
+        "children",
+        "node_id",
+        "partial",
+        "full_dist",
+        "cost",
+        "min_possible_dist",  # Set by engine when using A* estimator
+        "result_id",  # Set when streaming results
+    )
 
     def __init__(self, feature, dist, parent=None):
         """
@@ -36,6 +53,7 @@ class MywTraceNode:
         self.node_id = feature._urn()  # Key for cycle prevention
         self.partial = False  # True if link has been trimmed
         self.full_dist = dist  # Original dist before trimming
+        self.cost = dist  # Set by engine if network has cost expressions
 
     def stopAt(self, dist):
         """
@@ -43,6 +61,9 @@ class MywTraceNode:
 
         Marks self as a partial link"""
 
+        if self.cost == self.dist:  # Cost is just length
+            self.cost = dist
+
         self.dist = dist
         self.partial = True
 
@@ -106,7 +127,7 @@ class MywTraceNode:
         if hasattr(self, "min_possible_dist"):
             return self.min_possible_dist < other.min_possible_dist
 
-        return self.dist < other.dist
+        return self.cost < other.cost
 
     def definition(self, parent_id):
         """
@@ -286,6 +307,20 @@ class MywTraceNode:
 
         return node
 
+    def pathToRoot(self):
+        """
+        Nodes from self back to the root node of self's tree (a list)
+        """
+
+        nodes = []
+        node = self
+
+        while node:
+            nodes.append(node)
+            node = node.parent
+
+        return nodes
+
     def tidy(self):
         """
         Perform post-processing on self's subtree (hook for subclasses)
@@ -309,6 +344,22 @@ class MywTraceNode:
             for child_node in reversed(node.children):
                 stack.append((child_node, level + 1))
 
+    def subTreeNodes(self):
+        """
+        Nodes of self's subtree, as a depth-first ordered list
+        """
+        # Uses pseudo-recursion to prevent possible stack overflow
+
+        nodes = []
+        stack = [self]
+
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack += reversed(node.children)
+
+        return nodes
+
     def subTreeFeatures(self, feature_types=None):
         """
         Features of self's subtree, as an ordered list
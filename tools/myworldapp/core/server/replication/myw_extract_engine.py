@@ -3,34 +3,180 @@
 ################################################################################
 # Copyright: IQGeo Limited 2010-2023
 
-import base64, json
+import base64, json, multiprocessing, queue
 from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 from decimal import Decimal
 
 from geoalchemy2 import Geometry
-from sqlalchemy import JSON
+from sqlalchemy import JSON, event
 
 
+from myworldapp.core.server.base.core.myw_error import MywError
 from myworldapp.core.server.base.core.myw_progress import MywProgressHandler
 from myworldapp.core.server.base.tilestore.myw_tile_db import MywTileDB
 from myworldapp.core.server.base.db.myw_sqlite_db_server import MywSqliteDbServer
 from myworldapp.core.server.database.myw_raw_database import MywRawDatabase
 
 
-class MywExtractEngine:
+# Table copy jobs for 'fast' extract worker processes (inherited on fork)
+_copy_jobs = None
+
+
+def _run_copy_worker(engine, snapshot_id, isolation_level, job_queue, out_queue):
     """
-    Engine for creating an extract of a myWorld database to sqlite
+    Entry point for a 'fast' extract worker process
+
+    Reads the records for the jobs in JOB_QUEUE from master, in the transaction
+    snapshot SNAPSHOT_ID, and posts them to OUT_QUEUE"""
+
+    job_id = None
+
+    try:
+        # Get a connection of our own (without closing the parent's)
+        engine.dispose(close=False)
+
+        with engine.connect() as conn:
+
+            # Share master transaction's view of the data
+            conn.connection.rollback()
+            trans = conn.begin()
+            conn.exec_driver_sql(
+                "SET TRANSACTION ISOLATION LEVEL {} READ ONLY".format(isolation_level)
+            )
+            conn.exec_driver_sql("SET TRANSACTION SNAPSHOT '{}'".format(snapshot_id))
+
+            # Read tables
+            for job_id in iter(job_queue.get, None):
+                n_recs = 0
+
+                for recs in _copy_jobs[job_id].readRecords(conn):
+                    out_queue.put(("records", job_id, recs))
+                    n_recs += len(recs)
+
+                out_queue.put(("done", job_id, n_recs))
+
+            trans.rollback()
+
+    except Exception as cond:
+        out_queue.put(("error", job_id, "{}: {}".format(type(cond).__name__, cond)))
+
+
+class MywExtractCopyJob:
     """
+    Bulk copy of the records of a master table to an extract table
 
-    def __init__(self, master_db, progress=MywProgressHandler(), encryption_key=None):
+    Holds the master query and a positional insert statement for the extract.
+    Records are read as tuples of SQLite bind values"""
+
+    def __init__(self, schema, table_name, statement, geom_columns, json_columns, insert_sql):
         """
         Init slots of self
+
+        STATEMENT is a SQLAlchemy select returning the columns of INSERT_SQL, in order"""
+
+        self.schema = schema
+        self.table_name = table_name
+        self.statement = statement
+        self.insert_sql = insert_sql
+        self.n_rows_est = 0
+
+        # Build conversion types (in select order)
+        self.col_types = []
+        for col in statement.selected_columns:
+            if col.name in geom_columns:
+                self.col_types.append("geom")
+            elif col.name in json_columns:
+                self.col_types.append("json")
+            else:
+                self.col_types.append(None)
+
+    def __str__(self):
+        """
+        String representation of self for progress messages
+        """
+
+        return "{}.{}".format(self.schema, self.table_name)
+
+    def readRecords(self, conn, chunk_size=10000):
+        """
+        Yields the records to copy, read from master connection CONN
+
+        Yields lists of tuples (chunks of up to CHUNK_SIZE records)"""
+
+        result = conn.execution_options(stream_results=True).execute(self.statement)
+
+        while True:
+            master_recs = result.fetchmany(chunk_size)
+            if not master_recs:
+                break
+
+            yield [self.bindValuesFor(master_rec) for master_rec in master_recs]
+
+    def bindValuesFor(self, master_rec):
+        """
+        Values of MASTER_REC converted to SQLite bind values (a tuple)
+
+        Geometries are passed through as WKB"""
+
+        values = []
+
+        for value, col_type in zip(master_rec, self.col_types):
+
+            if col_type == "geom":
+                value = bytes(value) if value is not None else b""
+
+            elif isinstance(value, Decimal):
+                value = float(value)
+
+            elif isinstance(value, datetime):
+                value = value.isoformat(
+                    "T", "milliseconds"
+                )  # Native App treats datetimes as strings in SQLite
+
+            elif col_type == "json":
+                if value is not None:
+                    value = json.dumps(value)
+
+            values.append(value)
+
+        return tuple(values)
+
+
+class MywExtractEngine:
+    """
+    Engine for creating an extract of a myWorld database to sqlite
+
+    If JOBS is set, feature records are extracted in 'fast' mode: read by
+    JOBS worker processes (sharing the master transaction's snapshot),
+    written with SQLite bulk load settings and indexed after loading"""
+
+    # SQLite settings used when loading in fast mode
+    bulk_load_pragmas = OrderedDict(
+        [
+            ("journal_mode", "OFF"),
+            ("synchronous", "OFF"),
+            ("cache_size", -512000),  # 500MB
+            ("temp_store", "MEMORY"),
+        ]
+    )
+
+    # Max number of records written in fast mode between commits
+    bulk_commit_size = 200000
+
+    def __init__(self, master_db, progress=MywProgressHandler(), encryption_key=None, jobs=None):
         """
+        Init slots of self
+
+        Optional JOBS is the number of worker processes to use for fast mode"""
 
         self.master_db = master_db
         self.progress = progress
         self.encryption_key = encryption_key
+        self.jobs = jobs
+
+        self.deferred_index_tables = {}  # Table descriptors of unindexed tables, keyed by schema
 
     # ==============================================================================
     #                                 EXTRACTION
@@ -83,40 +229,47 @@ class MywExtractEngine:
             master_db_driver = self.master_db.db_driver
             extract_db_driver = extract_db.db_driver
 
-            # Create system tables
-            self.createSystemTables(master_db_driver, extract_db_driver)
-            self.copySystemRecords(master_db_driver, extract_db_driver)
-
-            # Copy master feature tables
-            self.createFeatureTables(master_db_driver, extract_db_driver, "data")
-            self.copyFeatureRecords(master_db_driver, extract_db_driver, "data", extract_filter)
-            self.buildIndexRecords(master_db_driver, extract_db_driver, "data")
-            self.addFeatureTriggers(master_db_driver, extract_db_driver, "data")
-
-            # Copy delta tables
-            self.createFeatureTables(master_db_driver, extract_db_driver, "delta")
-            if extract_filter.include_deltas:
-                self.copyFeatureRecords(
-                    master_db_driver, extract_db_driver, "delta", extract_filter
-                )  # Optional deltas extract
-            self.buildIndexRecords(master_db_driver, extract_db_driver, "delta")
-            self.addFeatureTriggers(master_db_driver, extract_db_driver, "delta")
-
-            # Copy base tables (which don't have index records or triggers)
-            self.createFeatureTables(master_db_driver, extract_db_driver, "base")
-            if extract_filter.include_deltas:
-                self.copyFeatureRecords(
-                    master_db_driver, extract_db_driver, "base", extract_filter
-                )  # Optional deltas extract
-            self.addFeatureTriggers(master_db_driver, extract_db_driver, "base")
-
-            # Zap passwords
-            with self.progress.operation("Pruning data"):
-                sql = "update {} set password=''".format(extract_db_driver.dbNameFor("myw", "user"))
-                extract_db_driver.execute(sql)
-
-            # Ensure all changes are written to database
-            extract_db_driver.session.commit()
+            with self.bulkLoadSettings(extract_db_driver):
+
+                # Create system tables
+                self.createSystemTables(master_db_driver, extract_db_driver)
+                self.copySystemRecords(master_db_driver, extract_db_driver)
+
+                # Copy master feature tables
+                self.createFeatureTables(master_db_driver, extract_db_driver, "data")
+                self.copyFeatureRecords(master_db_driver, extract_db_driver, "data", extract_filter)
+                self.addFeatureIndexes(extract_db_driver, "data")
+                self.buildIndexRecords(master_db_driver, extract_db_driver, "data")
+                self.addFeatureTriggers(master_db_driver, extract_db_driver, "data")
+
+                # Copy delta tables
+                self.createFeatureTables(master_db_driver, extract_db_driver, "delta")
+                if extract_filter.include_deltas:
+                    self.copyFeatureRecords(
+                        master_db_driver, extract_db_driver, "delta", extract_filter
+                    )  # Optional deltas extract
+                self.addFeatureIndexes(extract_db_driver, "delta")
+                self.buildIndexRecords(master_db_driver, extract_db_driver, "delta")
+                self.addFeatureTriggers(master_db_driver, extract_db_driver, "delta")
+
+                # Copy base tables (which don't have index records or triggers)
+                self.createFeatureTables(master_db_driver, extract_db_driver, "base")
+                if extract_filter.include_deltas:
+                    self.copyFeatureRecords(
+                        master_db_driver, extract_db_driver, "base", extract_filter
+                    )  # Optional deltas extract
+                self.addFeatureIndexes(extract_db_driver, "base")
+                self.addFeatureTriggers(master_db_driver, extract_db_driver, "base")
+
+                # Zap passwords
+                with self.progress.operation("Pruning data"):
+                    sql = "update {} set password=''".format(
+                        extract_db_driver.dbNameFor("myw", "user")
+                    )
+                    extract_db_driver.execute(sql)
+
+                # Ensure all changes are written to database
+                extract_db_driver.session.commit()
 
             # Create tables for storing local copy of external feature data
             self.createExternalFeatureTables(master_db_driver, extract_db_driver, extract_filter)
@@ -124,6 +277,48 @@ class MywExtractEngine:
 
         return extract_db
 
+    @contextmanager
+    def bulkLoadSettings(self, extract_db_driver):
+        """
+        Context manager applying SQLite bulk load settings to EXTRACT_DB_DRIVER (in fast mode)
+
+        Disables journalling and syncing while active. Safe because a partially
+        built extract is discarded anyway"""
+
+        # Case: Not fast mode
+        if self.jobs is None:
+            yield
+            return
+
+        extract_db_driver.session.commit()
+
+        def apply_pragmas(dbapi_connection, pragmas):
+            for name, value in pragmas.items():
+                dbapi_connection.execute("PRAGMA {} = {}".format(name, value))
+
+        def on_connect(dbapi_connection, connection_rec):
+            apply_pragmas(dbapi_connection, self.bulk_load_pragmas)
+
+        # Get current settings
+        dbapi_connection = extract_db_driver.session.connection().connection
+        prev_pragmas = OrderedDict()
+        for name in self.bulk_load_pragmas:
+            prev_pragmas[name] = dbapi_connection.execute("PRAGMA {}".format(name)).fetchone()[0]
+
+        # Apply bulk settings (including to any new connections)
+        self.progress(2, "Using bulk load settings:", dict(self.bulk_load_pragmas))
+        apply_pragmas(dbapi_connection, self.bulk_load_pragmas)
+        event.listen(extract_db_driver.session.bind, "connect", on_connect)
+
+        try:
+            yield
+
+        finally:
+            event.remove(extract_db_driver.session.bind, "connect", on_connect)
+
+            extract_db_driver.session.commit()
+            apply_pragmas(extract_db_driver.session.connection().connection, prev_pragmas)
+
     def createSystemTables(self, master_db_driver, extract_db_driver):
         """
         Create system table data model
@@ -131,7 +326,7 @@ class MywExtractEngine:
 
         with self.progress.operation("Creating system tables") as op_stats:
 
-            for table in self.systemTableNames():
+            for table in self.systemTableNames(["mvt_geom"]):  # Only used for server rendering
                 self.progress(1, "Creating table", table)
 
                 table_desc = master_db_driver.tableDescriptorFor("myw", table)
@@ -174,6 +369,7 @@ class MywExtractEngine:
             "delta_int_world_polygon",
             "delta_search_string",
             "extract_key",  # Don't include list of extract encryption keys, for obvious reasons
+            "mvt_geom",  # Only used for server rendering
         ]
 
         with self.progress.operation("Copying system data"):
@@ -197,10 +393,33 @@ class MywExtractEngine:
 
                 table_desc = master_db_driver.tableDescriptorFor(feature_schema, table)
                 table_desc = self._fixupTableDescriptor(table_desc)
-                extract_db_driver.createTable(table_desc)
+
+                # In fast mode, index after loading (see .addFeatureIndexes())
+                if self.jobs is not None:
+                    extract_db_driver.createTable(table_desc, indexes=False)
+                    self.deferred_index_tables.setdefault(feature_schema, []).append(table_desc)
+                else:
+                    extract_db_driver.createTable(table_desc)
 
                 op_stats["tables"] = op_stats.get("tables", 0) + 1
 
+    def addFeatureIndexes(self, extract_db_driver, feature_schema):
+        """
+        Create the indexes of FEATURE_SCHEMA tables whose creation was deferred (fast mode only)
+        """
+
+        table_descs = self.deferred_index_tables.pop(feature_schema, [])
+        if not table_descs:
+            return
+
+        with self.progress.operation("Indexing feature", feature_schema, "tables"):
+
+            for table_desc in table_descs:
+                self.progress(1, "Indexing table", table_desc.name)
+                extract_db_driver.execute(extract_db_driver.createTableIndexSqls(table_desc))
+
+            extract_db_driver.session.commit()
+
     def copyFeatureRecords(
         self, master_db_driver, extract_db_driver, feature_schema, extract_filter
     ):
@@ -209,14 +428,26 @@ class MywExtractEngine:
 
         EXTRACT_FILTER is a MywExtractFilter controlling what get copied"""
 
-        with self.progress.operation("Copying feature data for schema:", feature_schema):
+        with self.progress.operation(
+            "Copying feature data for schema:", feature_schema
+        ) as op_stats:
 
+            tables = []
             for feature_type in extract_filter.myworldFeatureTypes(
                 self.master_db, versioned_only=(feature_schema != "data")
             ):
 
                 pred = extract_filter.regionPredicateFor(self.master_db, feature_type)
+                tables.append((feature_type, pred))
 
+            # Case: Fast mode
+            if self.jobs is not None:
+                op_stats["records"] = self.bulkCopyRecords(
+                    master_db_driver, extract_db_driver, feature_schema, tables
+                )
+                return
+
+            for feature_type, pred in tables:
                 self.copyRecords(
                     master_db_driver, extract_db_driver, feature_schema, feature_type, pred
                 )
@@ -441,11 +672,240 @@ class MywExtractEngine:
         # Tidy up (if we can)
         self.progress("finished", "Records copied:", n_recs, records=n_recs)
 
-    def insertSQLFor(self, extract_db_driver, schema, table_name, geom_columns):
+    # ==============================================================================
+    #                               FAST RECORD COPYING
+    # ==============================================================================
+
+    def bulkCopyRecords(self, master_db_driver, extract_db_driver, schema, tables):
         """
-        Build SQL template for bulk insertion of records into SCHEMA.TABLE_NAME
+        Bulk copy records of feature tables TABLES from master to extract (fast mode)
+
+        TABLES is a list of (FEATURE_TYPE, PRED) tuples. If possible, records are read
+        by worker processes in parallel (largest tables first). Extract is written by
+        this process.
+
+        Returns number of records copied"""
+
+        global _copy_jobs
+
+        # Build job definitions
+        jobs = []
+        for feature_type, pred in tables:
+            jobs.append(
+                self.copyJobFor(master_db_driver, extract_db_driver, schema, feature_type, pred)
+            )
+
+        if not jobs:
+            return 0
+
+        # Case: Read in this process
+        if not self.canRunCopyJobs(jobs):
+            n_recs = 0
+            for job in jobs:
+                self.progress("starting", "Copying table", job)
+                n_job_recs = 0
+                for recs in job.readRecords(master_db_driver.session.connection()):
+                    self.insertRows(extract_db_driver, job.insert_sql, recs)
+                    n_job_recs += len(recs)
+                extract_db_driver.session.commit()
+                self.progress("finished", "Records copied:", n_job_recs, records=n_job_recs)
+                n_recs += n_job_recs
+
+            return n_recs
+
+        # Case: Read in worker processes
+        jobs.sort(key=lambda job: job.n_rows_est, reverse=True)
+
+        snapshot_id = self.exportSnapshot(master_db_driver)
+
+        isolation_level = master_db_driver.session.execute("SHOW transaction_isolation").scalar()
+        if isolation_level.upper() not in ["SERIALIZABLE", "REPEATABLE READ"]:
+            isolation_level = "REPEATABLE READ"
+
+        n_workers = min(self.jobs, len(jobs))
+        self.progress(2, "Reading", len(jobs), "tables using", n_workers, "processes")
+
+        ctx = multiprocessing.get_context("fork")
+        job_queue = ctx.Queue()
+        out_queue = ctx.Queue(maxsize=4 * n_workers)  # Bounds memory used for queued records
+
+        for job_id in range(len(jobs)):
+            job_queue.put(job_id)
+        for worker in range(n_workers):
+            job_queue.put(None)
+
+        _copy_jobs = jobs
+        workers = []
+        try:
+            for worker in range(n_workers):
+                proc = ctx.Process(
+                    target=_run_copy_worker,
+                    args=(
+                        self.master_db.session.bind,
+                        snapshot_id,
+                        isolation_level,
+                        job_queue,
+                        out_queue,
+                    ),
+                )
+                proc.start()
+                workers.append(proc)
+
+            return self.writeCopyJobRecords(extract_db_driver, jobs, out_queue, workers)
+
+        finally:
+            for proc in workers:
+                if proc.is_alive():
+                    proc.terminate()
+                proc.join()
+            _copy_jobs = None
+
+    def writeCopyJobRecords(self, extract_db_driver, jobs, out_queue, workers):
+        """
+        Insert the records posted to OUT_QUEUE by WORKERS until all JOBS are complete
+
+        Returns number of records copied"""
+
+        n_job_recs = [0] * len(jobs)
+        n_jobs_done = 0
+        n_uncommitted = 0
+
+        while n_jobs_done < len(jobs):
+
+            # Get next message (checking for workers that died without reporting)
+            try:
+                (msg_type, job_id, data) = out_queue.get(timeout=10)
+            except queue.Empty:
+                if not any(proc.is_alive() for proc in workers):
+                    raise MywError("Extract worker processes terminated unexpectedly")
+                continue
+
+            # Case: Records
+            if msg_type == "records":
+                self.insertRows(extract_db_driver, jobs[job_id].insert_sql, data)
+                n_job_recs[job_id] += len(data)
+                n_uncommitted += len(data)
+
+                if n_uncommitted > self.bulk_commit_size:
+                    extract_db_driver.session.commit()
+                    n_uncommitted = 0
+
+            # Case: Table complete
+            elif msg_type == "done":
+                self.progress(1, "Copied table", jobs[job_id], ":", data, "records")
+                n_jobs_done += 1
+
+            # Case: Failed
+            else:
+                job = jobs[job_id] if job_id is not None else "(connecting)"
+                raise MywError("Extract of table {} failed: {}".format(job, data))
+
+        extract_db_driver.session.commit()
+
+        return sum(n_job_recs)
+
+    def copyJobFor(self, master_db_driver, extract_db_driver, schema, feature_type, pred=None):
+        """
+        Definition of the bulk copy of FEATURE_TYPE records from master to extract
+
+        Optional PRED is a MywDbPredicate limiting which records get extracted
+
+        Returns a MywExtractCopyJob"""
+
+        from sqlalchemy import func, select
+
+        master_model = self.master_db.dd.featureModel(feature_type, schema)
+        master_table = master_model.__table__
+        geom_columns = master_model.geometry_column_names()
+        json_columns = [col.name for col in master_table.columns if isinstance(col.type, JSON)]
+
+        # Build insert statement
+        (insert_sql, col_names) = self.insertSQLFor(
+            extract_db_driver, schema, feature_type, geom_columns, positional=True
+        )
+
+        # Build master query (in insert order, geoms as plain 2D WKB .. see copyRecords())
+        cols = []
+        for col_name in col_names:
+            col = master_table.columns[col_name]
+            if col_name in geom_columns:
+                col = func.ST_AsBinary(func.ST_Force2D(col)).label(col_name)
+            cols.append(col)
+
+        statement = select(*cols)
+
+        if not (pred is None):
+            statement = statement.where(pred.sqaFilter(master_table))
+
+        job = MywExtractCopyJob(
+            schema, feature_type, statement, geom_columns, json_columns, insert_sql
+        )
+
+        # Get size estimate (for scheduling)
+        if master_db_driver.dialect_name == "postgresql":
+            job.n_rows_est = (
+                master_db_driver.session.execute(
+                    "SELECT reltuples FROM pg_class WHERE oid = to_regclass(:name)",
+                    {"name": master_db_driver.dbNameFor(schema, feature_type, True)},
+                ).scalar()
+                or 0
+            )
+
+        return job
+
+    def canRunCopyJobs(self, jobs):
+        """
+        True if JOBS can be read in parallel worker processes
         """
 
+        if self.jobs <= 1 or len(jobs) <= 1:
+            return False
+
+        if self.master_db.db_driver.dialect_name != "postgresql":
+            self.progress("warning", "Parallel extract not supported for this database type")
+            return False
+
+        if not "fork" in multiprocessing.get_all_start_methods():
+            self.progress("warning", "Parallel extract not supported on this platform")
+            return False
+
+        return True
+
+    def exportSnapshot(self, master_db_driver):
+        """
+        Export the snapshot of master's current transaction (for use by worker processes)
+
+        Ensures workers see the same data as this process (i.e. the data
+        at the checkpoints recorded for the extract)
+
+        Returns snapshot identifier"""
+
+        return master_db_driver.session.execute("SELECT pg_export_snapshot()").scalar()
+
+    def insertRows(self, extract_db_driver, insert_sql, rows):
+        """
+        Insert ROWS into extract database (without committing)
+
+        INSERT_SQL is a positional insert statement. ROWS is a list of tuples"""
+
+        self.progress(5, "Inserting", len(rows), "records")
+
+        cursor = extract_db_driver.session.connection().connection.cursor()
+        cursor.executemany(insert_sql, rows)
+        cursor.close()
+
+    # ==============================================================================
+    #                                 RECORD INSERTION
+    # ==============================================================================
+
+    def insertSQLFor(self, extract_db_driver, schema, table_name, geom_columns, positional=False):
+        """
+        Build SQL template for bulk insertion of records into SCHEMA.TABLE_NAME
+
+        If POSITIONAL, the template uses positional parameters (for use with raw DB-API cursors)
+
+        Returns SQL and names of the columns it sets (in order)"""
+
         # Get table definition
         extract_model = extract_db_driver.rawModelFor(schema, table_name, geom_columns=geom_columns)
 
@@ -455,10 +915,12 @@ class MywExtractEngine:
 
         for col in extract_model.__table__.columns:
             quoted_col_names[col.name] = '"{}"'.format(col.name)
+            param = "?" if positional else ":{}".format(col.name)
+
             if isinstance(col.type, Geometry):
-                placeholders[col.name] = "ST_GeomFromWKB(:{},{})".format(col.name, col.type.srid)
+                placeholders[col.name] = "ST_GeomFromWKB({},{})".format(param, col.type.srid)
             else:
-                placeholders[col.name] = ":{}".format(col.name)
+                placeholders[col.name] = param
 
         # Build statement
         sql = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
@@ -728,26 +1190,45 @@ class MywExtractEngine:
         for key, value in list(options.items()):
             self.progress(1, "Options:", key, "=", value)
 
-        # Open files
-        # ENH: If full extract, faster to just do an os file copy
+        # Open input
         tile_db = MywTileDB(tile_file, "r", progress=self.progress)
+
+        # Case: Full extract .. just copy the file
+        if self.isFullTileExtract(tile_db, bounds, options):
+            n_tiles = self.copyTileFile(tile_db, out_file)
+            self.progress("finished", tiles=n_tiles)
+            tile_db.close()
+            return out_file
+
+        # Open output
         out_tile_db = MywTileDB(out_file, "w", progress=self.progress)
 
-        # Build optional args for loadFromDB()
-        args = {}
-        if options["by_layer"]:
-            args["use_index"] = True
-            args["layer"] = tile_db.layer()  # only used if tilstore version < 5
-
-        # Copy the tiles
-        n_tiles = out_tile_db.loadFromDB(
-            tile_db,
-            bounds=bounds,
-            clip=options["clip"],
-            min_zoom=options["min_zoom"],
-            max_zoom=options["max_zoom"],
-            **args,
-        )
+        # Case: Tiles copied verbatim .. use set-based copy
+        if out_tile_db.canCopyFromDB(tile_db, clip=options["clip"], bounds=bounds):
+            self.progress(2, "Copying tile ranges")
+            n_tiles = out_tile_db.copyFromDB(
+                tile_db,
+                bounds=bounds,
+                min_zoom=options["min_zoom"],
+                max_zoom=options["max_zoom"],
+            )
+
+        # Case: Edge tiles need clipping .. use Java engine
+        else:
+            # Build optional args for loadFromDB()
+            args = {}
+            if options["by_layer"]:
+                args["use_index"] = True
+                args["layer"] = tile_db.layer()  # only used if tilstore version < 5
+
+            n_tiles = out_tile_db.loadFromDB(
+                tile_db,
+                bounds=bounds,
+                clip=options["clip"],
+                min_zoom=options["min_zoom"],
+                max_zoom=options["max_zoom"],
+                **args,
+            )
 
         # Tidy up
         out_tile_db.close()
@@ -755,3 +1236,37 @@ class MywExtractEngine:
         tile_db.close()
 
         return out_file
+
+    def isFullTileExtract(self, tile_db, bounds, options):
+        """
+        True if extract of TILE_DB includes all its tiles unchanged
+
+        BOUNDS and OPTIONS are the region bounds and options for the extract"""
+
+        if bounds is not None:
+            return False
+
+        if options["min_zoom"] is not None or options["max_zoom"] is not None:
+            return False
+
+        return tile_db.type == "myw_tile" and tile_db.schemaVersion() >= 5
+
+    def copyTileFile(self, tile_db, out_file):
+        """
+        Copy the whole of myWorld tile file TILE_DB to OUT_FILE
+
+        Uses SQLite online backup (which is consistent even if TILE_DB is being updated)
+
+        Returns number of tiles copied"""
+
+        self.progress(2, "Copying file", tile_db.filename)
+
+        tile_db.backupTo(out_file)
+
+        # Remove master specific data
+        out_tile_db = MywTileDB(out_file, "u", progress=self.progress)
+        out_tile_db.executeSql("DELETE FROM myw_checkpoint")
+        n_tiles = out_tile_db.scalarQuery("SELECT count(*) FROM myw_tiles")
+        out_tile_db.close()
+
+        return n_tiles
@@ -236,6 +236,7 @@ class MywMasterReplicationEngine(MywReplicationEngine):
         overwrite,
         include_deltas,
         encryption_key=None,
+        jobs=None,
     ):
         """
         Create an extract of self's database
@@ -249,7 +250,10 @@ class MywMasterReplicationEngine(MywReplicationEngine):
         EXTRACT_DB_PATH is the path for output sqlite database. Tile
         files and code package will be placed in the same directory.
 
-        Optional include_deltas will include deltas in the extact"""
+        Optional include_deltas will include deltas in the extact
+
+        Optional JOBS selects fast extraction, reading feature tables in JOBS
+        parallel processes (see MywExtractEngine)"""
 
         with self.progress.operation("Creating extract", name):
             # Check master is init
@@ -286,7 +290,7 @@ class MywMasterReplicationEngine(MywReplicationEngine):
             # Create extract
             # ENH: Remove copy if something goes wrong
             extract_engine = MywExtractEngine(
-                self.db, progress=self.progress, encryption_key=encryption_key
+                self.db, progress=self.progress, encryption_key=encryption_key, jobs=jobs
             )
 
             (extract_db, tile_file_mappings) = extract_engine.extract(
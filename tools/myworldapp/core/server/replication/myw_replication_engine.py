@@ -451,15 +451,24 @@ class MywReplicationEngine(ABC):
                 self.progress("starting", "Creating", out_tile_file, "...")
                 out_tile_db = MywTileDB(out_tile_file, "w", progress=self.progress)
 
-                # Export changes
-                n_tiles = out_tile_db.loadFromDB(
-                    tile_db,
-                    bounds=bounds,
-                    clip=options["clip"],
-                    min_zoom=options["min_zoom"],
-                    max_zoom=options["max_zoom"],
-                    since_version=since_version,
-                )
+                # Export changes (using set-based copy, if possible)
+                if out_tile_db.canCopyFromDB(tile_db, clip=options["clip"], bounds=bounds):
+                    n_tiles = out_tile_db.copyFromDB(
+                        tile_db,
+                        bounds=bounds,
+                        min_zoom=options["min_zoom"],
+                        max_zoom=options["max_zoom"],
+                        since_version=since_version,
+                    )
+                else:
+                    n_tiles = out_tile_db.loadFromDB(
+                        tile_db,
+                        bounds=bounds,
+                        clip=options["clip"],
+                        min_zoom=options["min_zoom"],
+                        max_zoom=options["max_zoom"],
+                        since_version=since_version,
+                    )
 
                 # ENH: Make tile_db a context manager
                 out_tile_db.close()
@@ -7,3 +7,11 @@ def load_config(file_path):
         return config
     except Exception as e:
         raise Exception(f"Error loading configuration file '{file_path}': {e}")
+
+def resolve_table_config(config, table_config):
+    # Per-table settings override the global ETL mode and watermark control table
+    resolved = {"etl_mode": config.get("etl_mode", "full")}
+    if "watermark_table" in config:
+        resolved["watermark_table"] = config["watermark_table"]
+    resolved.update(table_config)
+    return resolved
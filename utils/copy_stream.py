@@ -0,0 +1,42 @@
+import io
+
+def build_copy_sql(full_target, columns):
+    column_list = ', '.join(columns)
+    return f"COPY {full_target} ({column_list}) FROM STDIN WITH (FORMAT csv)"
+
+def format_copy_value(value):
+    # In CSV COPY an unquoted empty field is NULL, so every non-null value is quoted
+    if value is None:
+        return ''
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        text = '\\x' + bytes(value).hex()
+    elif isinstance(value, bool):
+        text = 't' if value else 'f'
+    elif hasattr(value, 'isoformat'):
+        text = value.isoformat()
+    else:
+        text = str(value)
+    return '"' + text.replace('"', '""') + '"'
+
+class CopyRowStream(io.TextIOBase):
+    # Read-only file-like object that renders rows as CSV lines on demand for copy_expert
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._buffer += ','.join(format_copy_value(value) for value in row) + '\n'
+
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
@@ -1,6 +1,70 @@
+import os
+import sys
 import subprocess
+import threading
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools")
+
+def open_myworld_database(target_db_config):
+    # Open the target as a MywDatabase in this process (same setup as tools/myw_db.py)
+    if TOOLS_DIR not in sys.path:
+        sys.path.insert(0, TOOLS_DIR)
+
+    from myworldapp.core.server.startup.myw_python_mods import configure_geojson_lib
+    from myworldapp.core.server.base.core.myw_progress import MywSimpleProgressHandler
+    from myworldapp.core.server.database.myw_database_server import MywDatabaseServer
+
+    configure_geojson_lib()
+
+    db_server = MywDatabaseServer(
+        host=target_db_config["host"],
+        port=target_db_config["port"],
+        username=target_db_config["user"],
+        password=target_db_config["password"],
+        progress=MywSimpleProgressHandler(1)
+    )
+    return db_server.open(target_db_config.get("database", "myproj"))
+
+class InProcessDefLoader:
+    # Loads .def files through one shared, already-open MywDatabase instead of a myw_db child process
+
+    def __init__(self, target_db_config):
+        self.db = open_myworld_database(target_db_config)
+        self._lock = threading.Lock()  # The SQLAlchemy session is not thread-safe
+        self._sessions = []  # Thread-local sessions used so far (db.session is a scoped session)
+
+    def create_table(self, source_path, table_name, logger):
+        with self._lock:
+            session = self.db.session()
+            if not any(s is session for s in self._sessions):
+                self._sessions.append(session)
+
+            ok = False
+            try:
+                self.db.data_loader.loadFeatureTypeDefs(source_path, update=True, skip_unchanged=True)
+                ok = True
+            except Exception as e:
+                logger.error(f"❌ Table creation failed for '{table_name}': {e}")
+                raise Exception(f"Table creation failed for '{table_name}': {e}")
+            finally:
+                self.db.commit(ok)
+
+        logger.info(f"✅ Created table '{table_name}' using def file at {source_path}.")
+
+    def close(self):
+        # Release the connections of every thread's session (call once worker threads have finished)
+        engine = self.db.session.bind
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+        self.db.session.remove()
+        engine.dispose()
+
+def handle_def_file_and_create_table(source_path, target_db_config, table_name, logger, def_loader=None):
+    if def_loader is not None:
+        return def_loader.create_table(source_path, table_name, logger)
 
-def handle_def_file_and_create_table(source_path, target_db_config, table_name, logger):
     try:
         # Use the "database" value from target_db_config dynamically instead of "myproj"
         target_db_name = target_db_config.get("database", "myproj")
@@ -17,3 +81,14 @@ def handle_def_file_and_create_table(source_path, target_db_config, table_name,
     except subprocess.CalledProcessError as e:
         logger.error(f"❌ Table creation failed for '{table_name}': {e}")
         raise Exception(f"Table creation failed for '{table_name}': {e}")
+
+def get_def_loader(config, logger):
+    # Shared in-process loader unless the subprocess path is configured (or the in-process setup fails)
+    if config.get("def_loader", "in_process") != "in_process":
+        return None
+
+    try:
+        return InProcessDefLoader(config["target_database"])
+    except Exception as e:
+        logger.error(f"In-process .def loader unavailable, falling back to myw_db subprocess: {e}")
+        return None
@@ -1,6 +1,21 @@
+import time
 import pandas as pd
+from utils.copy_stream import CopyRowStream, build_copy_sql
+from utils.incremental_executor import run_incremental_etl_for_table
 
 def run_etl_for_table(mssql_conn, pg_conn, table_config, chunk_size, logger):
+    if table_config.get("etl_mode", "full") == "incremental":
+        return run_incremental_etl_for_table(mssql_conn, pg_conn, table_config, chunk_size, logger)
+
+    # Dispatch on the per-table load method ("insert" unless configured otherwise)
+    load_method = table_config.get("load_method", "insert")
+
+    if load_method == "copy":
+        return run_copy_etl_for_table(mssql_conn, pg_conn, table_config, chunk_size, logger)
+
+    if load_method != "insert":
+        raise Exception(f"Unknown load_method '{load_method}' for {table_config['target_schema']}.{table_config['target_table']}")
+
     try:
         mssql_cursor = mssql_conn.cursor()
         pg_cursor = pg_conn.cursor()
@@ -52,3 +67,50 @@ def run_etl_for_table(mssql_conn, pg_conn, table_config, chunk_size, logger):
     except Exception as e:
         logger.error(f"❌ ETL failed for {full_target}: {e}")
         raise Exception(f"ETL failed for {full_target}: {e}")
+
+def run_copy_etl_for_table(mssql_conn, pg_conn, table_config, chunk_size, logger):
+    # Bulk load variant: each fetched chunk is streamed to PostgreSQL with a single COPY ... FROM STDIN
+    try:
+        mssql_cursor = mssql_conn.cursor()
+        pg_cursor = pg_conn.cursor()
+
+        query = table_config["join_query"]
+        target_schema = table_config["target_schema"]
+        target_table = table_config["target_table"]
+        full_target = f"{target_schema}.{target_table}"
+
+        logger.info(f"Running query for table: {full_target} (COPY mode)")
+        mssql_cursor.execute(query)
+
+        # Retrieve column names from the result set metadata
+        columns = [desc[0] for desc in mssql_cursor.description]
+        copy_sql = build_copy_sql(full_target, columns)
+
+        rows_fetched = 0
+        etl_start = time.perf_counter()
+        while True:
+            chunk_start = time.perf_counter()
+            rows = mssql_cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+
+            try:
+                pg_cursor.copy_expert(copy_sql, CopyRowStream(rows))
+                pg_conn.commit()
+            except Exception as e:
+                logger.error(f"Error copying chunk into {full_target}: {e}")
+                pg_conn.rollback()
+                raise Exception(f"COPY error for table {full_target}: {e}")
+
+            elapsed = time.perf_counter() - chunk_start
+            rows_fetched += len(rows)
+            rate = len(rows) / elapsed if elapsed > 0 else float(len(rows))
+            logger.info(f"Copied {rows_fetched} rows into {full_target} (chunk of {len(rows)} rows at {rate:,.0f} rows/sec)")
+
+        total_elapsed = time.perf_counter() - etl_start
+        total_rate = rows_fetched / total_elapsed if total_elapsed > 0 else float(rows_fetched)
+        logger.info(f"✅ Completed ETL for {full_target}: {rows_fetched} rows at {total_rate:,.0f} rows/sec")
+
+    except Exception as e:
+        logger.error(f"❌ ETL failed for {full_target}: {e}")
+        raise Exception(f"ETL failed for {full_target}: {e}")
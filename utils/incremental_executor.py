@@ -0,0 +1,169 @@
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from utils.copy_stream import CopyRowStream, build_copy_sql
+from utils.source_query import add_source_filter, result_column_name
+
+DEFAULT_WATERMARK_TABLE = "public.etl_watermarks"
+LOAD_SEQUENCE_COLUMN = "etl_load_seq"
+
+def ensure_watermark_table(pg_conn, watermark_table):
+    pg_cursor = pg_conn.cursor()
+    pg_cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {watermark_table} ("
+        "target_table varchar PRIMARY KEY, "
+        "watermark_column varchar NOT NULL, "
+        "watermark_type varchar NOT NULL, "
+        "watermark_value text NOT NULL, "
+        "updated_at timestamp NOT NULL DEFAULT now())"
+    )
+    pg_conn.commit()
+
+def encode_watermark(value):
+    # Store the high-water mark as text, tagged with the type needed to pass it back to MSSQL
+    if isinstance(value, (bytes, bytearray)):
+        return 'bytes', bytes(value).hex()
+    if isinstance(value, datetime):
+        return 'datetime', value.isoformat()
+    if isinstance(value, date):
+        return 'date', value.isoformat()
+    if isinstance(value, int):
+        return 'int', str(value)
+    if isinstance(value, Decimal):
+        return 'decimal', str(value)
+    return 'str', str(value)
+
+def decode_watermark(watermark_type, text):
+    if watermark_type == 'bytes':
+        return bytes.fromhex(text)
+    if watermark_type == 'datetime':
+        return datetime.fromisoformat(text)
+    if watermark_type == 'date':
+        return date.fromisoformat(text)
+    if watermark_type == 'int':
+        return int(text)
+    if watermark_type == 'decimal':
+        return Decimal(text)
+    return text
+
+def read_watermark(pg_conn, watermark_table, full_target):
+    pg_cursor = pg_conn.cursor()
+    pg_cursor.execute(
+        f"SELECT watermark_type, watermark_value FROM {watermark_table} WHERE target_table = %s",
+        (full_target,)
+    )
+    row = pg_cursor.fetchone()
+    if row is None:
+        return None
+    return decode_watermark(*row)
+
+def write_watermark(pg_cursor, watermark_table, full_target, watermark_column, value):
+    watermark_type, text = encode_watermark(value)
+    pg_cursor.execute(
+        f"INSERT INTO {watermark_table} (target_table, watermark_column, watermark_type, watermark_value, updated_at) "
+        "VALUES (%s, %s, %s, %s, now()) "
+        "ON CONFLICT (target_table) DO UPDATE SET "
+        "watermark_column = EXCLUDED.watermark_column, "
+        "watermark_type = EXCLUDED.watermark_type, "
+        "watermark_value = EXCLUDED.watermark_value, "
+        "updated_at = EXCLUDED.updated_at",
+        (full_target, watermark_column, watermark_type, text)
+    )
+
+def build_upsert_sql(full_target, stage_table, columns, key_columns):
+    column_list = ', '.join(columns)
+    key_list = ', '.join(key_columns)
+    update_columns = [c for c in columns if c.lower() not in {k.lower() for k in key_columns}]
+
+    if update_columns:
+        conflict_action = "DO UPDATE SET " + ', '.join(f"{c} = EXCLUDED.{c}" for c in update_columns)
+    else:
+        conflict_action = "DO NOTHING"
+
+    # A key can appear more than once in a chunk: keep the last copy (rows arrive in watermark order
+    # and are numbered in arrival order by the stage table's load sequence column)
+    return (
+        f"INSERT INTO {full_target} ({column_list}) "
+        f"SELECT DISTINCT ON ({key_list}) {column_list} FROM {stage_table} ORDER BY {key_list}, {LOAD_SEQUENCE_COLUMN} DESC "
+        f"ON CONFLICT ({key_list}) {conflict_action}"
+    )
+
+def run_incremental_etl_for_table(mssql_conn, pg_conn, table_config, chunk_size, logger):
+    # Extract only rows beyond the stored high-water mark and upsert them, advancing the mark per chunk
+    try:
+        query = table_config["join_query"]
+        target_schema = table_config["target_schema"]
+        target_table = table_config["target_table"]
+        full_target = f"{target_schema}.{target_table}"
+        watermark_column = table_config["watermark_column"]
+        key_columns = table_config["key_columns"]
+        watermark_table = table_config.get("watermark_table", DEFAULT_WATERMARK_TABLE)
+
+        ensure_watermark_table(pg_conn, watermark_table)
+        watermark = read_watermark(pg_conn, watermark_table, full_target)
+
+        mssql_cursor = mssql_conn.cursor()
+        pg_cursor = pg_conn.cursor()
+
+        # The predicate is added to the query itself: wrapping it in a derived table fails for
+        # SELECT * over joins (duplicate column names). WATERMARK_COLUMN may be qualified (e.g. t.row_version)
+        predicate = None
+        params = []
+        if watermark is not None:
+            # Inclusive, since a chunk may end part-way through rows sharing one watermark value (upserts are idempotent)
+            predicate = f"{watermark_column} >= ?"
+            params.append(watermark)
+        incremental_query = add_source_filter(query, predicate, full_target, order_by=watermark_column)
+
+        logger.info(f"Running incremental query for table: {full_target} (watermark {watermark_column} >= {watermark!r})")
+        mssql_cursor.execute(incremental_query, *params)
+
+        # Retrieve column names from the result set metadata
+        columns = [desc[0] for desc in mssql_cursor.description]
+        lowered = [c.lower() for c in columns]
+        watermark_name = result_column_name(watermark_column).lower()
+        if watermark_name not in lowered:
+            raise Exception(f"Watermark column '{watermark_column}' not in query result")
+        watermark_index = lowered.index(watermark_name)
+
+        stage_table = "etl_stage"
+        column_list = ', '.join(columns)
+        create_stage_sql = (
+            f"CREATE TEMP TABLE {stage_table} ON COMMIT DROP AS SELECT {column_list} FROM {full_target} WITH NO DATA; "
+            f"ALTER TABLE {stage_table} ADD COLUMN {LOAD_SEQUENCE_COLUMN} bigint GENERATED ALWAYS AS IDENTITY"
+        )
+        copy_sql = build_copy_sql(stage_table, columns)
+        upsert_sql = build_upsert_sql(full_target, stage_table, columns, key_columns)
+
+        rows_fetched = 0
+        while True:
+            chunk_start = time.perf_counter()
+            rows = mssql_cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+
+            try:
+                pg_cursor.execute(create_stage_sql)
+                pg_cursor.copy_expert(copy_sql, CopyRowStream(rows))
+                pg_cursor.execute(upsert_sql)
+                last_watermark = rows[-1][watermark_index]
+                if last_watermark is not None:
+                    write_watermark(pg_cursor, watermark_table, full_target, watermark_column, last_watermark)
+                pg_conn.commit()
+            except Exception as e:
+                logger.error(f"Error upserting chunk into {full_target}: {e}")
+                pg_conn.rollback()
+                raise Exception(f"Upsert error for table {full_target}: {e}")
+
+            elapsed = time.perf_counter() - chunk_start
+            rows_fetched += len(rows)
+            rate = len(rows) / elapsed if elapsed > 0 else float(len(rows))
+            logger.info(f"Upserted {rows_fetched} rows into {full_target} (chunk of {len(rows)} rows at {rate:,.0f} rows/sec)")
+
+        if rows_fetched == 0:
+            logger.info(f"No new rows for {full_target}")
+        logger.info(f"✅ Completed incremental ETL for {full_target}")
+
+    except Exception as e:
+        logger.error(f"❌ ETL failed for {full_target}: {e}")
+        raise Exception(f"ETL failed for {full_target}: {e}")
@@ -0,0 +1,149 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.config_loader import resolve_table_config
+from utils.def_handler import handle_def_file_and_create_table, get_def_loader
+from utils.db_connections import get_mssql_conn, get_postgres_conn
+from utils.etl_executor import run_etl_for_table
+from utils.source_query import add_source_filter, source_range_query
+
+class WorkerConnections:
+    # Hands each worker thread its own MSSQL/PostgreSQL connection pair, opened on first use
+
+    def __init__(self, config):
+        self._config = config
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._opened = []
+
+    def get(self):
+        if not hasattr(self._local, "conns"):
+            mssql_conn = get_mssql_conn(self._config["source_database"])
+            try:
+                pg_conn = get_postgres_conn(self._config["target_database"])
+            except Exception:
+                mssql_conn.close()
+                raise
+            self._local.conns = (mssql_conn, pg_conn)
+            with self._lock:
+                self._opened.append(self._local.conns)
+        return self._local.conns
+
+    def close_all(self, logger):
+        with self._lock:
+            opened, self._opened = self._opened, []
+        for mssql_conn, pg_conn in opened:
+            for conn in (mssql_conn, pg_conn):
+                try:
+                    conn.close()
+                except Exception as e:
+                    logger.error(f"Failed to close worker connection: {e}")
+
+def build_partition_queries(mssql_conn, table_config, logger):
+    # Split the table's join_query into key ranges on its configured integer column
+    query = table_config["join_query"]
+    column = table_config.get("partition_column")
+    count = int(table_config.get("partition_count", 1))
+
+    if not column or count <= 1:
+        return [query]
+
+    # Incremental loads advance a single watermark, so they cannot be split
+    if table_config.get("etl_mode", "full") == "incremental":
+        logger.info(f"Not partitioning {table_config['target_schema']}.{table_config['target_table']}: incremental mode")
+        return [query]
+
+    # Predicates are added to the query itself: wrapping it in a derived table fails for
+    # SELECT * over joins (duplicate column names). PARTITION_COLUMN is a source expression (e.g. c.id)
+    table_desc = f"{table_config['target_schema']}.{table_config['target_table']}"
+    cursor = mssql_conn.cursor()
+    cursor.execute(source_range_query(query, column, table_desc))
+    low, high = cursor.fetchone()
+    cursor.close()
+
+    if low is None:
+        return [add_source_filter(query, f"{column} IS NULL", table_desc)]
+
+    low, high = int(low), int(high)
+    step = max(1, -(-(high - low + 1) // count))
+
+    queries = []
+    start = low
+    while start <= high:
+        end = start + step
+        if end > high:
+            queries.append(add_source_filter(query, f"{column} >= {start} AND {column} <= {high}", table_desc))
+        else:
+            queries.append(add_source_filter(query, f"{column} >= {start} AND {column} < {end}", table_desc))
+        start = end
+
+    # Rows with no key value fall outside every range
+    queries.append(add_source_filter(query, f"{column} IS NULL", table_desc))
+
+    logger.info(f"Split {table_config['target_schema']}.{table_config['target_table']} into {len(queries)} partitions on {column} ({low}..{high})")
+    return queries
+
+def run_tables_parallel(config, logger):
+    # Create each target table and load its partitions concurrently, one connection pair per worker
+    workers = int(config.get("parallel_workers", 1))
+    chunk_size = config["chunk_size"]
+    connections = WorkerConnections(config)
+    def_loader = get_def_loader(config, logger)
+
+    def prepare_table(table_config):
+        target_schema = table_config["target_schema"]
+        target_table = table_config["target_table"]
+        logger.info(f"🚀 Starting ETL for: {target_schema}.{target_table}")
+
+        source_def_path = os.path.join(config["def_file_folder"]["source_path"], table_config["def_file_name"])
+        handle_def_file_and_create_table(
+            source_def_path,
+            config["target_database"],
+            target_table,
+            logger,
+            def_loader
+        )
+
+        mssql_conn, _ = connections.get()
+        return build_partition_queries(mssql_conn, table_config, logger)
+
+    def load_partition(table_config, partition_query):
+        mssql_conn, pg_conn = connections.get()
+        run_etl_for_table(
+            mssql_conn,
+            pg_conn,
+            dict(table_config, join_query=partition_query),
+            chunk_size,
+            logger
+        )
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="etl") as pool:
+
+            # Phase 1: table creation and partitioning (tables are independent of each other)
+            partitions = []
+            table_configs = [resolve_table_config(config, tc) for tc in config["tables"]]
+            futures = {pool.submit(prepare_table, tc): tc for tc in table_configs}
+            for future in as_completed(futures):
+                table_config = futures[future]
+                try:
+                    for partition_query in future.result():
+                        partitions.append((table_config, partition_query))
+                except Exception as e:
+                    logger.error(f"[ERROR] ETL failed for {table_config['target_schema']}.{table_config['target_table']}: {e}")
+
+            # Phase 2: load all partitions of all tables through the same pool
+            futures = {pool.submit(load_partition, tc, pq): tc for tc, pq in partitions}
+            for future in as_completed(futures):
+                table_config = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"[ERROR] ETL failed for {table_config['target_schema']}.{table_config['target_table']}: {e}")
+    finally:
+        connections.close_all(logger)
+        if def_loader:
+            try:
+                def_loader.close()
+            except Exception as e:
+                logger.error(f"Failed to close .def loader database: {e}")
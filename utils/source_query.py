@@ -0,0 +1,110 @@
+import re
+
+# Clause keywords that can follow WHERE in a single SELECT statement, in statement order
+_TRAILING_CLAUSES = ["GROUP BY", "HAVING", "ORDER BY", "OPTION"]
+_SET_OPERATORS = ["UNION", "EXCEPT", "INTERSECT"]
+_KEYWORD_PATTERNS = {
+    keyword: re.compile(r"\b" + keyword.replace(" ", r"\s+") + r"\b", re.IGNORECASE)
+    for keyword in ["SELECT", "FROM", "WHERE"] + _TRAILING_CLAUSES + _SET_OPERATORS
+}
+
+def _top_level_keywords(query):
+    # Find clause keywords outside brackets, quoted strings/identifiers and comments
+    # Returns a list of (keyword, start, end) in query order
+    found = []
+    depth = 0
+    i = 0
+    while i < len(query):
+        ch = query[i]
+        if query.startswith('--', i):
+            newline = query.find('\n', i)
+            i = len(query) if newline < 0 else newline + 1
+            continue
+        if query.startswith('/*', i):
+            close = query.find('*/', i + 2)
+            i = len(query) if close < 0 else close + 2
+            continue
+        if ch in "'\"[":
+            close_ch = ']' if ch == '[' else ch
+            close = query.find(close_ch, i + 1)
+            while close >= 0 and close_ch != ']' and query.startswith(close_ch * 2, close):
+                close = query.find(close_ch, close + 2)
+            i = len(query) if close < 0 else close + 1
+            continue
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif depth == 0 and ch.isalpha() and (i == 0 or not (query[i - 1].isalnum() or query[i - 1] in '_@#$')):
+            for keyword, pattern in _KEYWORD_PATTERNS.items():
+                match = pattern.match(query, i)
+                if match:
+                    found.append((keyword, match.start(), match.end()))
+                    i = match.end()
+                    break
+            else:
+                i += 1
+            continue
+        i += 1
+    return found
+
+def _clauses(query, table_desc):
+    # Top-level keywords of QUERY, checking it is a single SELECT we can add a predicate to
+    keywords = _top_level_keywords(query)
+    names = [k for k, _, _ in keywords]
+    if not names or names[0] != "SELECT" or "FROM" not in names:
+        raise Exception(f"Cannot filter source query for {table_desc}: not a simple SELECT ... FROM statement")
+    for operator in _SET_OPERATORS:
+        if operator in names:
+            raise Exception(f"Cannot filter source query for {table_desc}: {operator} queries are not supported")
+    if names.count("SELECT") > 1 or names.count("WHERE") > 1:
+        raise Exception(f"Cannot filter source query for {table_desc}: unexpected nested statement")
+    return keywords
+
+def add_source_filter(query, predicate, table_desc, order_by=None):
+    # Add PREDICATE (if given) and optional ORDER_BY to the source query without wrapping it in a derived table
+    # (SQL Server rejects derived tables with duplicate column names, e.g. SELECT * over a join)
+    query = query.strip().rstrip(';')
+    keywords = _clauses(query, table_desc)
+    positions = {k: (start, end) for k, start, end in keywords}
+    trailing = [positions[k][0] for k in _TRAILING_CLAUSES if k in positions]
+    where_end = min(trailing) if trailing else len(query)
+
+    if order_by and "ORDER BY" in positions:
+        raise Exception(f"Cannot order source query for {table_desc}: it already has an ORDER BY clause")
+
+    if predicate is None:
+        head = query[:where_end].rstrip()
+    elif "WHERE" in positions:
+        condition = query[positions["WHERE"][1]:where_end].strip()
+        head = query[:positions["WHERE"][0]] + f"WHERE ({condition}) AND ({predicate})"
+    else:
+        head = query[:where_end].rstrip() + f" WHERE {predicate}"
+
+    # Remaining clauses, with the ordering placed before any query hints
+    option_start = positions["OPTION"][0] if "OPTION" in positions else len(query)
+    tail = query[where_end:option_start].strip()
+    if order_by:
+        tail = (tail + f" ORDER BY {order_by}").strip()
+    tail = (tail + " " + query[option_start:]).strip()
+
+    return head + (" " + tail if tail else "")
+
+def source_range_query(query, column, table_desc):
+    # Query returning MIN/MAX of COLUMN over the rows of the source query (used for key-range partitioning)
+    query = query.strip().rstrip(';')
+    keywords = _clauses(query, table_desc)
+    positions = {k: (start, end) for k, start, end in keywords}
+    if "GROUP BY" in positions or "HAVING" in positions:
+        raise Exception(f"Cannot partition source query for {table_desc}: GROUP BY queries are not supported")
+
+    select_list = query[positions["SELECT"][1]:positions["FROM"][0]]
+    if re.match(r"\s*(DISTINCT|TOP)\b", select_list, re.IGNORECASE):
+        raise Exception(f"Cannot partition source query for {table_desc}: DISTINCT/TOP queries are not supported")
+
+    end = positions["ORDER BY"][0] if "ORDER BY" in positions else len(query)
+    return f"SELECT MIN({column}), MAX({column}) " + query[positions["FROM"][0]:end].rstrip()
+
+def result_column_name(column):
+    # Name of source expression COLUMN in the query result (e.g. 't.[row_version]' -> 'row_version')
+    return column.split('.')[-1].strip().strip('[]"')